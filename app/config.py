@@ -1,19 +1,125 @@
-from typing import List
+from typing import List, Optional
 
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 
 
+class VllmBackend(BaseModel):
+    url: str
+    weight: float = 1.0
+    max_concurrency: Optional[int] = None  # defaults to backend_max_concurrency
+
+
 class Settings(BaseSettings):
     # Database
     database_url: str = "sqlite:///./llm_users.db"
+    # Used by the async routes; derived from database_url (aiosqlite/asyncpg)
+    async_database_url: Optional[str] = None
+    # SQLite storage: "production" (WAL, tuned pragmas, a single writer
+    # connection and a pool of readers) or "default" (driver defaults)
+    sqlite_profile: str = "production"
+    sqlite_busy_timeout: int = 5000  # ms a connection waits for a lock
+    sqlite_writer_timeout: float = 30.0  # seconds a session waits for the writer
+    sqlite_mmap_size: int = 268435456  # bytes of the file memory-mapped
+    sqlite_cache_size: int = -65536  # page cache; negative values are KiB
+    sqlite_read_pool_size: int = 8  # reader connections per engine
+    # Connection pool for other databases (PostgreSQL), per engine
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0  # seconds to wait for a free connection
+    db_pool_recycle: int = 1800  # seconds before a connection is replaced
+    db_pool_pre_ping: bool = True  # check connections before handing them out
+    # Monthly partitions of api_calls (PostgreSQL only)
+    api_calls_partitions_ahead: int = 3  # future months kept created
+    api_calls_retention_months: int = 0  # drop older partitions, 0 keeps all
+    api_calls_partition_check_interval: float = 86400.0  # seconds, 0 disables
+
+    # Authentication caches (API keys, and principals by user id)
+    api_key_cache_ttl: float = 60.0  # seconds before a cached entry is re-checked
+    api_key_cache_max_entries: int = 10000
+    # Key for the HMAC over API key secrets; falls back to jwt_secret_key (with
+    # a startup warning), which ties every API key to the JWT secret
+    api_key_hmac_secret: Optional[str] = None
 
     # JWT
     jwt_secret_key: str = "your-secret-key-here-change-in-production"
     jwt_algorithm: str = "HS256"
     jwt_expiration_hours: int = 24
+    jwt_claims_cache_ttl: float = 300.0  # seconds decoded tokens are reused
+    jwt_claims_cache_max_entries: int = 10000
+
+    # Password hashing (bcrypt runs in a dedicated process pool)
+    bcrypt_rounds: int = 12  # cost factor for newly hashed passwords
+    password_hash_workers: int = 2  # 0 hashes in the default threadpool instead
+    password_hash_queue_size: int = 64  # waiting hashes before logins get a 429
+    password_hash_retry_after: int = 1  # seconds, sent with the 429
 
     # vLLM
     vllm_endpoint: str = "http://127.0.0.1:8080"
+    # Replicas to balance across; falls back to vllm_endpoint when empty
+    vllm_backends: List[VllmBackend] = []
+    # "least_outstanding", "power_of_two" or "prefix_affinity"
+    load_balancing_strategy: str = "least_outstanding"
+    prefix_affinity_turns: int = 2  # non-system messages hashed for affinity
+    prefix_affinity_load_factor: float = 1.25  # bound relative to fair share
+    prefix_affinity_ring_replicas: int = 100  # virtual nodes per unit weight
+    backend_health_check_path: str = "/health"
+    backend_health_check_interval: float = 10.0  # seconds, 0 disables
+    backend_health_check_timeout: float = 2.0
+    backend_unhealthy_threshold: int = 2  # consecutive failures before ejection
+    models_refresh_interval: float = 60.0  # seconds between /v1/models refreshes
+
+    # Admission control in front of the backends
+    backend_max_concurrency: int = 256  # in-flight per backend, 0 = unlimited
+    admission_queue_size: int = 512  # requests allowed to wait for a free slot
+    admission_queue_timeout: float = 10.0  # max seconds a request may wait
+    admission_retry_after: int = 2  # Retry-After seconds on a 503
+
+    # Upstream HTTP client (shared connection pool to vLLM)
+    upstream_max_connections: int = 100
+    upstream_max_keepalive_connections: int = 20
+    upstream_keepalive_expiry: float = 30.0
+    upstream_http2: bool = False
+    upstream_connect_timeout: float = 5.0
+    upstream_read_timeout: float = 60.0
+    upstream_write_timeout: float = 10.0
+    upstream_pool_timeout: float = 5.0
+
+    # Response cache for deterministic (temperature 0) completions
+    response_cache_enabled: bool = False
+    response_cache_max_entries: int = 1024
+    response_cache_ttl: float = 300.0  # seconds
+    # Tokens charged on a cache hit: "full", "prompt" or "none"
+    response_cache_accounting: str = "full"
+
+    # Coalesce identical in-flight deterministic requests into one upstream call
+    single_flight_enabled: bool = True
+
+    # Rate limits per minute (0 disables); users.rpm_limit/tpm_limit override
+    rate_limit_rpm: int = 600
+    rate_limit_tpm: int = 1000000
+    rate_limit_key_rpm: int = 0  # additional limits per API key
+    rate_limit_key_tpm: int = 0
+
+    # Completion tokens reserved against the quota when max_tokens is not set
+    quota_default_max_tokens: int = 256
+
+    # Write-behind persistence of API calls and usage
+    usage_queue_size: int = 10000  # events waiting to be written
+    usage_batch_size: int = 500  # events written per transaction
+    usage_flush_interval: float = 0.2  # max seconds an event waits in the queue
+    # When the queue is full: "block", "inline" (write immediately) or "drop"
+    usage_queue_overflow: str = "block"
+    usage_write_retries: int = 2  # retries of a failed batch before writing per event
+    usage_write_retry_delay: float = 0.5  # seconds, times the attempt number
+
+    # Token counting (uses the optional ``tokenizers`` package when installed)
+    tokenizer_dir: Optional[str] = None  # holds <model>/tokenizer.json files
+    tokenizer_download: bool = False  # fetch missing tokenizers from the HF Hub
+    tokenizer_max_loaded: int = 8  # tokenizers kept in memory (LRU)
+    token_count_cache_max_entries: int = 4096  # memoised prompt/prefix counts
+    token_count_cache_ttl: float = 3600.0  # seconds
+    tokenize_offload_chars: int = 16384  # tokenize larger inputs off the event loop
 
     # CORS
     cors_origins: List[str] = ["http://localhost:3000", "http://localhost:8000"]
@@ -1,34 +1,87 @@
+import hashlib
+import time
+from typing import Optional
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
 from app.config import settings
-from app.dependencies.database import get_db
+from app.dependencies.database import get_db, get_read_db
 from app.models.user import User
+from app.services.auth_cache import Principal, load_principal
+from app.utils.cache import TTLCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+# Decoded claims by token digest, so repeat requests skip signature checks
+claims_cache = TTLCache(
+    max_entries=settings.jwt_claims_cache_max_entries,
+    ttl=settings.jwt_claims_cache_ttl,
+)
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-):
+
+def decode_access_token(token: str) -> dict:
+    """Verified claims of a token, raising JWTError if it is invalid or expired"""
+    digest = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    claims = claims_cache.get(digest)
+    if claims is None:
+        claims = jwt.decode(
+            token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm]
+        )
+        claims_cache.set(digest, claims)
+    elif claims.get("exp", 0) <= time.time():
+        claims_cache.delete(digest)
+        raise JWTError("Signature has expired.")
+    return claims
+
+
+def get_current_principal(
+    token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)
+) -> Principal:
+    """
+    Authenticate a bearer token without loading the user row. The user id and
+    token version come from the token; the version is checked against the
+    cached principal so bumping ``users.token_version`` revokes the token.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(
-            token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm]
-        )
-        username: str = payload.get("sub")
+        payload = decode_access_token(token)
+        username: Optional[str] = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
+    user_id = payload.get("uid")
+    if user_id is None:
+        # Tokens issued before ids were embedded: resolve the username once
+        user = db.query(User.id).filter(User.username == username).first()
+        if user is None:
+            raise credentials_exception
+        user_id = user.id
+
+    principal = load_principal(user_id, db)
+    if principal is None or payload.get("ver", 0) != principal.token_version:
         raise credentials_exception
+    return principal
+
+
+def get_current_user(
+    principal: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+):
+    """The full user row, for endpoints that read or change mutable fields"""
+    user = db.get(User, principal.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
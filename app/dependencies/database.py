@@ -1,11 +1,147 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from app.config import settings
 
-engine = create_engine(settings.database_url)
+# Async drivers for the same database, used by the async (proxy) routes
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_database_url(url: str) -> str:
+    """``database_url`` with its driver swapped for the async one"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend in ASYNC_DRIVERS and parsed.get_driver_name() != ASYNC_DRIVERS[backend]:
+        parsed = parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    return parsed.render_as_string(hide_password=False)
+
+
+def sqlite_pragmas(read_only: bool = False) -> list:
+    """Pragmas of the "production" SQLite profile, run on every new connection"""
+    pragmas = [
+        # Readers no longer block the writer, and commits append to the WAL
+        "PRAGMA journal_mode=WAL",
+        # Only fsync at checkpoints; still durable against application crashes
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size}",
+        f"PRAGMA cache_size={settings.sqlite_cache_size}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+
+def apply_sqlite_pragmas(engine, read_only: bool = False) -> None:
+    """Run ``sqlite_pragmas()`` on each connection the engine opens"""
+    pragmas = sqlite_pragmas(read_only)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def uses_sqlite_profile(url: str) -> bool:
+    """Whether the production SQLite profile applies to a database URL"""
+    parsed = make_url(url)
+    return (
+        settings.sqlite_profile == "production"
+        and parsed.get_backend_name() == "sqlite"
+        and parsed.database not in (None, "", ":memory:")
+    )
+
+
+def create_engines(url: str, create=create_engine, poolclass=QueuePool):
+    """
+    The (writer, reader) engines for a database URL. Under the production
+    SQLite profile every session that may write shares a single pooled
+    connection, so writers queue in the pool instead of failing with
+    "database is locked", while read-only sessions use a pool of query-only
+    connections; otherwise both are the same engine, pooled according to
+    the ``db_pool_*`` settings for server databases.
+    """
+    if make_url(url).get_backend_name() != "sqlite":
+        engine = create(
+            url,
+            poolclass=poolclass,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=settings.db_pool_pre_ping,
+        )
+        return engine, engine
+    if not uses_sqlite_profile(url):
+        engine = create(url)
+        return engine, engine
+
+    writer = create(
+        url,
+        poolclass=poolclass,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.sqlite_writer_timeout,
+    )
+    reader = create(
+        url,
+        poolclass=poolclass,
+        pool_size=settings.sqlite_read_pool_size,
+        max_overflow=0,
+    )
+    apply_sqlite_pragmas(getattr(writer, "sync_engine", writer))
+    apply_sqlite_pragmas(getattr(reader, "sync_engine", reader), read_only=True)
+    return writer, reader
+
+
+engine, read_engine = create_engines(settings.database_url)
+async_engine, async_read_engine = create_engines(
+    settings.async_database_url or async_database_url(settings.database_url),
+    create=create_async_engine,
+    poolclass=AsyncAdaptedQueuePool,
+)
+
+# Sessions that may write use the writer; billing reads use the read pool
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+AsyncReadSessionLocal = async_sessionmaker(
+    async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# Every sync engine, e.g. for instrumentation
+sync_engines = tuple(
+    dict.fromkeys(
+        (engine, read_engine, async_engine.sync_engine, async_read_engine.sync_engine)
+    )
+)
+
+async_engines = tuple(dict.fromkeys((async_engine, async_read_engine)))
+
+
+async def dispose_engines() -> None:
+    """
+    Close every pooled connection (called from the lifespan hook). aiosqlite
+    runs each connection in a non-daemon thread, so an undisposed async
+    engine keeps the process from exiting.
+    """
+    for target in async_engines:
+        await target.dispose()
+        # dispose() swaps in a fresh pool whose "connect" listeners lock with a
+        # threading.Lock (SQLAlchemy 2.0.23); two coroutines opening the first
+        # connections of a later lifespan would then deadlock the event loop
+        target.sync_engine.pool.dispatch.connect._set_asyncio()
+    for target in dict.fromkeys((engine, read_engine)):
+        target.dispose()
 
 
 def get_db():
@@ -14,3 +150,24 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """Session for endpoints that only read, kept off the writer connection"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """Async session for ``async def`` routes, so queries don't block the loop"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    """Read-only counterpart of ``get_async_db``"""
+    async with AsyncReadSessionLocal() as db:
+        yield db
@@ -1,15 +1,47 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import settings
-from app.routers import (auth_router, chat_router, openai_compatible_router,
-                         users_router)
+from app.routers import (auth_router, chat_router, metrics_router,
+                         openai_compatible_router, users_router)
+from app.dependencies.database import dispose_engines, engine
 from app.middleware.api_call_tracker import ApiCallTrackerMiddleware
+from app.services.backends import start_health_checks, stop_health_checks
+from app.services.model_catalog import start_model_refresh, stop_model_refresh
+from app.services.partitions import (start_partition_maintenance,
+                                     stop_partition_maintenance)
+from app.services.password_hashing import password_hasher
+from app.services.upstream import shutdown_upstream_client, startup_upstream_client
+from app.services.usage_writer import usage_writer
+from app.utils.security import check_api_key_hmac_secret
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    check_api_key_hmac_secret()
+    client = await startup_upstream_client()
+    start_health_checks(client)
+    start_model_refresh(client)
+    usage_writer.start()
+    start_partition_maintenance(engine)
+    yield
+    # Requests have finished by now; write out the usage still queued
+    await usage_writer.stop()
+    await stop_partition_maintenance()
+    await stop_model_refresh()
+    await stop_health_checks()
+    await shutdown_upstream_client()
+    await dispose_engines()
+    password_hasher.shutdown()
+
 
 app = FastAPI(
     title="LLM User Management API",
     description="API proxy for vLLM with user authentication and token usage tracking",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # API Call Tracking Middleware (must be first)
@@ -29,6 +61,7 @@ app.include_router(auth_router, prefix="/auth", tags=["authentication"])
 app.include_router(chat_router, prefix="/chat", tags=["chat"])
 app.include_router(users_router, prefix="/users", tags=["users"])
 app.include_router(openai_compatible_router, tags=["openai-compatible"])
+app.include_router(metrics_router, tags=["metrics"])
 
 
 @app.get("/")
@@ -5,19 +5,57 @@ Middleware to track API calls for billing purposes
 
 import time
 import json
-from typing import Callable
+import re
+from typing import Callable, Optional
 from fastapi import Request, Response
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
 from datetime import datetime
 
-from app.dependencies.database import get_db
-from app.models.user import ApiCall, User
+from app.services.auth_cache import api_key_cache
+from app.services.response_cache import CACHE_HEADER
+from app.services.usage import USAGE_STATE
+from app.services.usage_writer import UsageEvent, usage_writer
+
+# Endpoints whose calls are billed (health checks, auth, docs etc. are not)
+TRACKED_PATHS = frozenset(
+    {
+        "/v1/chat/completions",
+        "/v1/completions",
+        "/chat/completions",
+    }
+)
+
+# Only this much of the request body is kept, to find the model of calls that
+# failed before the router recorded usage; the body itself is never buffered
+REQUEST_HEAD_BYTES = 8192
+_MODEL_FIELD = re.compile(rb'"model"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def _request_model(head: bytes, complete: bool) -> Optional[str]:
+    """The "model" of a JSON request body from its first bytes"""
+    if complete:
+        try:
+            model = json.loads(head.decode("utf-8", errors="ignore")).get("model")
+            return model if isinstance(model, str) else None
+        except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+            return None
+    match = _MODEL_FIELD.search(head)
+    if match is None:
+        return None
+    try:
+        return json.loads(b'"' + match.group(1) + b'"')
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
 
 
 class ApiCallTrackerMiddleware:
     """
-    Middleware that tracks API calls for billing and usage analytics
+    Middleware that tracks API calls for billing and usage analytics.
+
+    Bodies pass through untouched: only their sizes are counted, plus a
+    bounded head of the request, so a stream costs the same memory however
+    long it runs. Token usage comes from the ``UsageRecord`` the router leaves
+    in the request state.
     """
 
     def __init__(self, app: Callable):
@@ -40,136 +78,112 @@ class ApiCallTrackerMiddleware:
         # Start timing
         start_time = time.time()
 
-        # Create a custom receive function to capture request body
-        request_body = b""
+        # Count the request body, keeping only its head
+        request_head = bytearray()
+        request_size = 0
         original_receive = receive
 
         async def capture_receive():
-            nonlocal request_body
+            nonlocal request_size
             message = await original_receive()
             if message["type"] == "http.request":
-                request_body += message.get("body", b"")
+                body = message.get("body", b"")
+                request_size += len(body)
+                if len(request_head) < REQUEST_HEAD_BYTES:
+                    request_head.extend(body[:REQUEST_HEAD_BYTES - len(request_head)])
             return message
 
-        # Create a custom send function to capture response
-        response_body = b""
+        # Count the response body as it is sent
+        response_size = 0
         response_status = 200
+        cached = False
         original_send = send
+        cache_header = CACHE_HEADER.lower().encode("latin-1")
 
         async def capture_send(message):
-            nonlocal response_body, response_status
+            nonlocal response_size, response_status, cached
             if message["type"] == "http.response.start":
                 response_status = message.get("status", 200)
+                cached = (cache_header, b"HIT") in message.get("headers", [])
             elif message["type"] == "http.response.body":
-                response_body += message.get("body", b"")
+                response_size += len(message.get("body", b""))
 
             await original_send(message)
 
-        # Process the request
-        await self.app(scope, capture_receive, capture_send)
-
-        # Log the API call
-        processing_time = time.time() - start_time
-        await self._log_api_call(
-            method=method,
-            path=path,
-            request_body=request_body,
-            response_body=response_body,
-            response_status=response_status,
-            processing_time=processing_time,
-            scope=scope
-        )
+        # Routers leave the request's token usage in the request state
+        scope.setdefault("state", {})
+
+        # Process the request, logging it even if the client went away
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            processing_time = time.time() - start_time
+            await self._log_api_call(
+                method=method,
+                path=path,
+                request_head=bytes(request_head),
+                request_size=request_size,
+                response_size=response_size,
+                response_status=response_status,
+                processing_time=processing_time,
+                scope=scope,
+                cached=cached
+            )
 
     def _should_track_call(self, path: str, method: str) -> bool:
         """
         Determine if this API call should be tracked for billing
         """
-        # Track API calls to these endpoints
-        trackable_paths = [
-            "/v1/chat/completions",
-            "/v1/completions",
-            "/chat/completions",
-        ]
-
-        # Don't track these (health checks, auth, etc.)
-        ignore_paths = [
-            "/",
-            "/docs",
-            "/redoc",
-            "/openapi.json",
-            "/auth/",
-            "/users/me",
-            "/users/usage",
-        ]
-
-        # Check if it's a trackable API call
-        for trackable in trackable_paths:
-            if trackable in path:
-                return True
-
-        # Check if it should be ignored
-        for ignore in ignore_paths:
-            if path.startswith(ignore):
-                return False
-
-        return False
-
-    async def _log_api_call(self, method: str, path: str, request_body: bytes,
-                           response_body: bytes, response_status: int,
-                           processing_time: float, scope):
+        return path in TRACKED_PATHS or path.rstrip("/") in TRACKED_PATHS
+
+    async def _log_api_call(self, method: str, path: str, request_head: bytes,
+                           request_size: int, response_size: int,
+                           response_status: int, processing_time: float,
+                           scope, cached: bool = False):
         """
-        Log the API call to the database
+        Queue the API call for the usage writer, together with its token usage.
+
+        This is the only place usage is recorded: the router records what vLLM
+        reported in the request state and nothing is estimated here. Calls
+        that failed before the router recorded usage are logged with no
+        tokens. Nothing is written to the database on the request path; see
+        app/services/usage_writer.py.
         """
         try:
-            # Extract user information from headers or scope
+            # Extract user information from the usage record or headers
             user_id = None
+            principal = None
             api_key = None
+            record = scope.get("state", {}).get(USAGE_STATE)
+            prompt_tokens = completion_tokens = reserved = 0
+            model = None
 
-            # Check for Authorization header (Bearer token)
             headers = dict(scope.get("headers", []))
             authorization = headers.get(b"authorization", b"").decode("utf-8", errors="ignore")
 
-            if authorization.startswith("Bearer "):
-                token = authorization[7:]  # Remove "Bearer " prefix
-
-                # Try to find user by API key
-                db: Session = next(get_db())
-                try:
-                    user = db.query(User).filter(User.api_key == token).first()
-                    if user:
-                        user_id = user.id
-                        api_key = token
-                finally:
-                    db.close()
-
-            # Parse request body to extract model and estimate tokens
-            tokens_used = 0.0
-            model = None
-
-            try:
-                if request_body:
-                    request_data = json.loads(request_body.decode("utf-8", errors="ignore"))
-                    model = request_data.get("model")
-
-                    # Estimate tokens (rough calculation)
-                    if "messages" in request_data:
-                        # Chat completions - count characters roughly
-                        content = ""
-                        for msg in request_data["messages"]:
-                            content += msg.get("content", "")
-                        tokens_used = len(content.split()) * 1.3  # Rough estimate
-                    elif "prompt" in request_data:
-                        # Completions - count words
-                        tokens_used = len(request_data["prompt"].split()) * 1.3
-
-                    # Apply max_tokens limit if specified
-                    max_tokens = request_data.get("max_tokens", 0)
-                    if max_tokens and tokens_used > max_tokens:
-                        tokens_used = max_tokens
-
-            except (json.JSONDecodeError, UnicodeDecodeError):
-                # If we can't parse the request, skip token estimation
-                pass
+            if record is not None:
+                principal = record.principal
+                user_id = principal.id
+                prompt_tokens = record.prompt_tokens
+                completion_tokens = record.completion_tokens
+                model = record.model
+                cached = cached or record.cached
+                reserved = record.reserved
+            elif authorization.startswith("Bearer "):
+                api_key = authorization[7:]  # Remove "Bearer " prefix
+
+                # Usually already cached by the router; otherwise the writer
+                # looks the key up when it writes the batch
+                principal = api_key_cache.get(api_key)
+                if principal:
+                    user_id = principal.id
+                    api_key = None
+
+            # Extract the model of failed calls from the head of the request
+            if model is None and request_head:
+                model = _request_model(request_head, len(request_head) == request_size)
+
+            tokens_used = prompt_tokens + completion_tokens
 
             # Calculate estimated cost (rough approximation)
             estimated_cost = 0.0
@@ -182,36 +196,30 @@ class ApiCallTrackerMiddleware:
                 else:
                     estimated_cost = (tokens_used / 1000) * 0.001  # Default rate
 
-            # Create API call record
-            if user_id:
-                db_session: Session = next(get_db())
-                try:
-                    api_call = ApiCall(
-                        user_id=user_id,
-                        endpoint=path,
-                        method=method,
-                        request_size=len(request_body),
-                        response_size=len(response_body),
-                        status_code=response_status,
-                        tokens_used=tokens_used,
-                        model=model,
-                        estimated_cost=estimated_cost
-                    )
-
-                    db_session.add(api_call)
-
-                    # Update user's total token usage
-                    user = db_session.query(User).filter(User.id == user_id).first()
-                    if user:
-                        user.tokens_used += tokens_used
-
-                    db_session.commit()
-
-                except Exception as e:
-                    print(f"Error logging API call: {e}")
-                    db_session.rollback()
-                finally:
-                    db_session.close()
+            # Queue the API call record and the settlement of the reservation
+            if user_id or api_key:
+                event = UsageEvent(
+                    {
+                        "user_id": user_id,
+                        "timestamp": datetime.utcnow(),
+                        "endpoint": path,
+                        "method": method,
+                        "request_size": request_size,
+                        "response_size": response_size,
+                        "status_code": response_status,
+                        "tokens_used": tokens_used,
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "model": model,
+                        "estimated_cost": estimated_cost,
+                        "cached": cached,
+                    },
+                    principal=principal,
+                    api_key=api_key,
+                    # users.tokens_used is an integer column
+                    delta=int(round(tokens_used)) - reserved,
+                )
+                await usage_writer.submit(event)
 
         except Exception as e:
             # Don't let logging errors break the API
@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Float
+from sqlalchemy import Boolean, Column, Integer, String, Date, DateTime, Text, ForeignKey, Float, Index
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.schema import PrimaryKeyConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -12,26 +14,59 @@ class User(Base):  # type: ignore
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
-    api_key = Column(
-        String, unique=True, index=True, nullable=True
-    )  # API key for OpenAI-compatible endpoints
     token_limit = Column(Integer, default=10000)
     tokens_used = Column(Integer, default=0)
+    scheduling_weight = Column(
+        Float, default=1.0
+    )  # Share of backend slots under contention (fair queuing weight)
+    token_version = Column(
+        Integer, default=0
+    )  # Bumped to revoke every JWT issued to the user
+    rpm_limit = Column(
+        Integer, nullable=True
+    )  # Requests per minute; NULL uses the default, 0 is unlimited
+    tpm_limit = Column(
+        Integer, nullable=True
+    )  # Tokens per minute; NULL uses the default, 0 is unlimited
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationship to API calls
     api_calls = relationship("ApiCall", back_populates="user")
+    # API keys for OpenAI-compatible endpoints
+    api_keys = relationship("ApiKey", back_populates="user")
 
 
-class ApiCall(Base):  # type: ignore
-    __tablename__ = "api_calls"
+class ApiKey(Base):  # type: ignore
+    __tablename__ = "api_keys"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    prefix = Column(String, unique=True, index=True)  # Public part, shown in listings
+    secret_hash = Column(String)  # HMAC-SHA256 of the secret part
+    name = Column(String, nullable=True)  # Label chosen by the user
+    created_at = Column(DateTime, default=datetime.utcnow)
+    revoked_at = Column(DateTime, nullable=True)  # Set when the key is revoked
+
+    user = relationship("User", back_populates="api_keys")
+
+
+class ApiCall(Base):  # type: ignore
+    __tablename__ = "api_calls"
+    # On PostgreSQL the table is range-partitioned by month (see
+    # app/services/partitions.py); other databases get a plain table
+    __table_args__ = {
+        "postgresql_partition_by": "RANGE (timestamp)",
+        "info": {"partition_column": "timestamp"},
+    }
+
+    # Indexed by ix_api_calls_user_id_timestamp below; every read of this
+    # table is one user's calls over a time range, newest first
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    timestamp = Column(DateTime, default=datetime.utcnow)
 
     # Request details
-    endpoint = Column(String, index=True)  # e.g., "/v1/chat/completions"
+    endpoint = Column(String)  # e.g., "/v1/chat/completions"
     method = Column(String, default="POST")  # HTTP method
     request_size = Column(Integer, default=0)  # Request payload size in bytes
 
@@ -41,7 +76,10 @@ class ApiCall(Base):  # type: ignore
 
     # Token usage
     tokens_used = Column(Float, default=0.0)  # Tokens used in this call
+    prompt_tokens = Column(Integer, default=0)  # As reported by vLLM
+    completion_tokens = Column(Integer, default=0)  # As reported by vLLM
     model = Column(String, nullable=True)  # Model used (e.g., "gpt-3.5-turbo")
+    cached = Column(Boolean, default=False)  # Served from the response cache
 
     # Cost tracking (optional, for future billing)
     estimated_cost = Column(Float, default=0.0)  # Estimated cost in USD
@@ -50,4 +88,48 @@ class ApiCall(Base):  # type: ignore
     user = relationship("User", back_populates="api_calls")
 
     def __repr__(self):
-        return f"<ApiCall(user_id={self.user_id}, endpoint='{self.endpoint}', tokens={self.tokens_used}, timestamp={self.timestamp})>"
\ No newline at end of file
+        return f"<ApiCall(user_id={self.user_id}, endpoint='{self.endpoint}', tokens={self.tokens_used}, timestamp={self.timestamp})>"
+
+
+Index("ix_api_calls_user_id_timestamp", ApiCall.user_id, ApiCall.timestamp.desc())
+
+
+class _UsageRollup:
+    """
+    Columns shared by the usage rollups: totals of a user's API calls to one
+    model within one time bucket, kept up to date by the usage writer in the
+    same transaction that inserts the calls (see app/services/rollups.py)
+    """
+
+    user_id = Column(Integer, ForeignKey("users.id"))
+    model = Column(String, default="")  # "" when the model is not known
+    call_count = Column(Integer, default=0)
+    tokens_used = Column(Float, default=0.0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    estimated_cost = Column(Float, default=0.0)
+
+
+class UsageHourly(_UsageRollup, Base):  # type: ignore
+    __tablename__ = "usage_hourly"
+    # Billing reads one user's buckets over a time range, across models
+    __table_args__ = (PrimaryKeyConstraint("user_id", "bucket", "model"),)
+
+    bucket = Column(DateTime)  # Start of the hour (UTC)
+
+
+class UsageDaily(_UsageRollup, Base):  # type: ignore
+    __tablename__ = "usage_daily"
+    __table_args__ = (PrimaryKeyConstraint("user_id", "bucket", "model"),)
+
+    bucket = Column(Date)  # Day (UTC)
+
+
+@compiles(PrimaryKeyConstraint, "postgresql")
+def _partitioned_primary_key(constraint, compiler, **kw):
+    """PostgreSQL requires the partition column in a partitioned table's key"""
+    column = constraint.table.info.get("partition_column")
+    if column and column not in constraint.columns:
+        names = [c.name for c in constraint.columns] + [column]
+        return "PRIMARY KEY (%s)" % ", ".join(compiler.preparer.quote(n) for n in names)
+    return compiler.visit_primary_key_constraint(constraint, **kw)
@@ -1,4 +1,5 @@
 from .auth import router as auth_router
 from .chat import router as chat_router
+from .metrics import router as metrics_router
 from .openai_compatible import router as openai_compatible_router
 from .users import router as users_router
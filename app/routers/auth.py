@@ -1,67 +1,113 @@
 from datetime import timedelta
+from typing import cast
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app import schemas
 from app.config import settings
-from app.dependencies.auth import get_current_user
-from app.dependencies.database import get_db
+from app.dependencies.auth import get_current_principal, get_current_user
+from app.dependencies.database import get_async_db, get_async_read_db, get_db
 from app.models.user import User
-from app.utils.security import (
-    authenticate_user,
-    create_access_token,
-    generate_api_key,
-    get_password_hash,
-)
+from app.services.auth_cache import Principal, invalidate_user
+from app.services.password_hashing import PasswordHasher, get_password_hasher
+from app.utils.security import access_token_claims, create_access_token, issue_api_key
 
 router = APIRouter()
 
 
 @router.post("/register", response_model=schemas.UserWithApiKey)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if db_user:
+async def register_user(
+    user: schemas.UserCreate,
+    read_db: AsyncSession = Depends(get_async_read_db),
+    db: AsyncSession = Depends(get_async_db),
+    hasher: PasswordHasher = Depends(get_password_hasher),
+):
+    existing = await read_db.scalar(
+        select(User.id).where(User.username == user.username).limit(1)
+    )
+    await read_db.close()
+    if existing is not None:
         raise HTTPException(status_code=400, detail="Username already registered")
 
-    hashed_password = get_password_hash(user.password)
-    api_key = generate_api_key()
+    hashed_password = await hasher.hash(user.password)
 
+    # ``db`` only checks out the writer connection here, after the slow hash:
+    # under the SQLite production profile every write shares that connection
     db_user = User(
         username=user.username,
         hashed_password=hashed_password,
-        api_key=api_key,
         token_limit=user.token_limit,
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    try:
+        await db.flush()
+    except IntegrityError:
+        # Registered concurrently since the check above
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Username already registered")
+    api_key, _ = issue_api_key(db, cast(int, db_user.id))
+    await db.commit()
+    await db.refresh(db_user)
+    return schemas.UserWithApiKey(
+        **schemas.User.model_validate(db_user).model_dump(), api_key=api_key
+    )
 
 
 @router.post("/token", response_model=schemas.Token)
-def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_read_db),
+    hasher: PasswordHasher = Depends(get_password_hasher),
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
-    if not user:
+    user = await db.scalar(
+        select(User).where(User.username == form_data.username).limit(1)
+    )
+    # Closed accounts keep their row for billing but have no password
+    hashed_password = user.hashed_password if user is not None else None
+    claims = access_token_claims(user) if user is not None else None
+    # Return the connection to the pool instead of holding it through bcrypt
+    await db.close()
+    if (
+        claims is None
+        or not hashed_password
+        or not await hasher.verify(form_data.password, cast(str, hashed_password))
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token_expires = timedelta(hours=settings.jwt_expiration_hours)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
+    access_token = create_access_token(data=claims, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.post("/refresh", response_model=schemas.Token)
-def refresh_access_token(current_user: User = Depends(get_current_user)):
+def refresh_access_token(principal: Principal = Depends(get_current_principal)):
     access_token_expires = timedelta(hours=settings.jwt_expiration_hours)
     access_token = create_access_token(
-        data={"sub": current_user.username}, expires_delta=access_token_expires
+        data=access_token_claims(principal), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.post("/revoke")
+def revoke_access_tokens(
+    current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
+):
+    """
+    Invalidate every access token issued to the current user
+    """
+    user_id = cast(int, current_user.id)
+    db.query(User).filter(User.id == user_id).update(
+        {User.token_version: func.coalesce(User.token_version, 0) + 1},
+        synchronize_session=False,
+    )
+    db.commit()
+    invalidate_user(user_id)
+    return {"message": "Access tokens revoked"}
@@ -1,12 +1,26 @@
 import httpx
-import requests
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.dependencies.auth import get_current_user
-from app.dependencies.database import get_db
-from app.models.user import User
+from app.dependencies.auth import get_current_principal
+from app.dependencies.database import get_async_db
+from app.services.admission import (
+    AdmissionController,
+    fair_share,
+    get_admission_controller,
+)
+from app.services.auth_cache import Principal
+from app.services.backends import post_to_backend, prefix_affinity_key
+from app.services.rate_limit import RateLimiter, get_rate_limiter
+from app.services.token_counter import TokenCounter, get_token_counter
+from app.services.upstream import get_upstream_client, upstream_error
+from app.services.usage import (
+    reported_usage,
+    requested_max_tokens,
+    reserve_tokens,
+    track_usage,
+)
 
 router = APIRouter()
 
@@ -14,46 +28,62 @@ router = APIRouter()
 @router.post("/completions")
 async def chat_completions(
     request: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    http_request: Request,
+    http_response: Response,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db),
+    client: httpx.AsyncClient = Depends(get_upstream_client),
+    admission: AdmissionController = Depends(get_admission_controller),
+    counter: TokenCounter = Depends(get_token_counter),
+    limiter: RateLimiter = Depends(get_rate_limiter),
 ):
     # Check token limit
     if current_user.tokens_used >= current_user.token_limit:
         raise HTTPException(status_code=429, detail="Token limit exceeded")
 
-    # Count tokens in request (simplified - in real implementation use tiktoken)
+    # Count tokens in request with the model's tokenizer (or the fallback estimate)
     if "messages" in request:
-        # Chat completions - count characters in messages
-        content = ""
-        for msg in request["messages"]:
-            content += msg.get("content", "")
-        token_count = len(content.split()) * 1.3  # Rough estimate for chat
+        token_count = await counter.count_messages(
+            request.get("model"), request["messages"]
+        )
     else:
         # Legacy completions
-        prompt = request.get("prompt", "")
-        token_count = len(prompt.split())  # rough estimate
+        token_count = await counter.count_text(
+            request.get("model"), request.get("prompt", "")
+        )
+
+    reservation = token_count + requested_max_tokens(request)
+    http_response.headers.update(limiter.check(current_user, reservation))
 
-    # Check if this request would exceed limit
-    if current_user.tokens_used + token_count > current_user.token_limit:
-        raise HTTPException(status_code=429, detail="Request would exceed token limit")
+    # Reserve the worst case; the API call tracker settles the real usage
+    record = track_usage(http_request, current_user, request.get("model"))
+    record.reserved = await reserve_tokens(db, current_user, reservation)
 
     # Proxy to vLLM - use the same endpoint that was called
     endpoint = "/v1/chat/completions"  # Default to chat completions
+    affinity_key = prefix_affinity_key(
+        request.get("messages", []), settings.prefix_affinity_turns
+    )
+    flow, weight = fair_share(current_user)
 
-    # Use requests for now to debug connection issues
     try:
-        response = requests.post(
-            f"{settings.vllm_endpoint}{endpoint}",
-            json=request,
-            timeout=30.0
-        )
-        response.raise_for_status()
+        async with admission.lease(affinity_key, flow, weight) as backend:
+            response = await post_to_backend(
+                client, admission.pool, backend, endpoint, request
+            )
         result = response.json()
 
-        # Update token usage
-        current_user.tokens_used += token_count
-        db.commit()
+        # Prefer the usage vLLM reported over our own estimate
+        record.prompt_tokens, record.completion_tokens = reported_usage(
+            result,
+            token_count,
+            lambda: counter.count(
+                request.get("model"),
+                (result.get("choices") or [{}])[0].get("message", {}).get("content")
+                or "",
+            ),
+        )
 
         return result
-    except requests.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"vLLM service error: {str(e)}")
+    except httpx.HTTPError as e:
+        raise upstream_error(e)
@@ -0,0 +1,122 @@
+# app/routers/metrics.py
+"""
+Prometheus-style metrics for the gateway (admission queue, backends and the
+usage write queue).
+"""
+
+from typing import List
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.services.admission import AdmissionController, get_admission_controller
+from app.services.usage_writer import UsageWriter, get_usage_writer
+
+router = APIRouter()
+
+
+def _metric(lines: List[str], name: str, kind: str, help_text: str, samples) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    # Each sample is (suffix, value), the suffix holding labels or "_sum" etc.
+    for suffix, value in samples:
+        lines.append(f"{name}{suffix} {value}")
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics(
+    admission: AdmissionController = Depends(get_admission_controller),
+    usage: UsageWriter = Depends(get_usage_writer),
+):
+    """Expose admission, backend and usage queue metrics in Prometheus text format"""
+    stats = admission.metrics
+    backends = admission.pool.backends
+    lines: List[str] = []
+
+    _metric(
+        lines,
+        "gateway_admission_queue_depth",
+        "gauge",
+        "Requests waiting for a backend slot",
+        [("", admission.queue_depth)],
+    )
+    _metric(
+        lines,
+        "gateway_admission_admitted_total",
+        "counter",
+        "Requests admitted to a backend",
+        [("", stats.admitted_total)],
+    )
+    _metric(
+        lines,
+        "gateway_admission_queued_total",
+        "counter",
+        "Requests that had to wait in the admission queue",
+        [("", stats.queued_total)],
+    )
+    _metric(
+        lines,
+        "gateway_admission_rejected_total",
+        "counter",
+        "Requests shed with a 503",
+        [
+            ('{reason="queue_full"}', stats.rejected_queue_full_total),
+            ('{reason="timeout"}', stats.rejected_timeout_total),
+        ],
+    )
+    _metric(
+        lines,
+        "gateway_admission_wait_seconds",
+        "summary",
+        "Time admitted requests spent waiting for a slot",
+        [("_sum", stats.wait_seconds_sum), ("_count", stats.admitted_total)],
+    )
+    _metric(
+        lines,
+        "gateway_admission_wait_seconds_max",
+        "gauge",
+        "Longest wait for a slot since startup",
+        [("", stats.wait_seconds_max)],
+    )
+    _metric(
+        lines,
+        "gateway_backend_in_flight",
+        "gauge",
+        "Requests currently in flight per backend",
+        [(f'{{backend="{b.url}"}}', b.in_flight) for b in backends],
+    )
+    _metric(
+        lines,
+        "gateway_backend_healthy",
+        "gauge",
+        "Whether the backend is receiving traffic (1) or ejected (0)",
+        [(f'{{backend="{b.url}"}}', int(b.healthy)) for b in backends],
+    )
+    _metric(
+        lines,
+        "gateway_usage_queue_depth",
+        "gauge",
+        "API call records waiting to be written",
+        [("", usage.queue_depth)],
+    )
+    _metric(
+        lines,
+        "gateway_usage_written_total",
+        "counter",
+        "API call records written to the database",
+        [("", usage.written_total)],
+    )
+    _metric(
+        lines,
+        "gateway_usage_lost_total",
+        "counter",
+        "API call records not written",
+        [
+            ('{reason="queue_full"}', usage.dropped_total),
+            ('{reason="write_error"}', usage.failed_total),
+        ],
+    )
+
+    return PlainTextResponse(
+        "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4"
+    )
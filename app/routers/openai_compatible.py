@@ -4,21 +4,52 @@ OpenAI-compatible API endpoints for direct integration with opencode and other c
 These endpoints use API key authentication instead of JWT tokens.
 """
 
+import json
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
 import httpx
-from fastapi import APIRouter, Depends, Header, HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.dependencies.database import get_db
-from app.models.user import User
-from app.utils.security import verify_api_key
+from app.dependencies.database import get_async_db, get_async_read_db
+from app.services.admission import (
+    AdmissionController,
+    fair_share,
+    get_admission_controller,
+)
+from app.services.auth_cache import Principal, authenticate_api_key_async
+from app.services.backends import Backend, post_to_backend, prefix_affinity_key
+from app.services.model_catalog import ModelCatalog, get_model_catalog
+from app.services.rate_limit import RateLimiter, get_rate_limiter
+from app.services.response_cache import (
+    CACHE_HEADER,
+    ResponseCache,
+    billable_usage,
+    cache_bypassed,
+    cache_key,
+    get_response_cache,
+)
+from app.services.single_flight import SingleFlight, get_single_flight
+from app.services.token_counter import TokenCounter, get_token_counter, message_text
+from app.services.upstream import get_upstream_client, upstream_error
+from app.services.usage import (
+    UsageRecord,
+    reported_usage,
+    requested_max_tokens,
+    reserve_tokens,
+    track_usage,
+)
+from app.utils.security import split_api_key
 
 router = APIRouter()
 
 
 async def get_user_from_api_key(
+    request: Request,
     authorization: str = Header(..., alias="Authorization"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
     """Extract and validate API key from Authorization header"""
     if not authorization:
@@ -30,19 +61,204 @@ async def get_user_from_api_key(
     else:
         api_key = authorization
 
-    # Verify API key
-    user = verify_api_key(api_key, db)
-    if not user:
+    # Verify API key (cached, so usually no database round trip)
+    principal = await authenticate_api_key_async(api_key, db)
+    if not principal:
         raise HTTPException(status_code=401, detail="Invalid API key")
 
-    return user
+    # Public part of the key, for per-key rate limits
+    request.state.api_key_prefix = split_api_key(api_key)[0]
+    return principal
+
+
+def _chat_chunk_from_completion_chunk(chunk: dict, model: str, first: bool) -> dict:
+    """Translate a vLLM text_completion chunk into a chat.completion.chunk event"""
+    if not chunk.get("choices") and chunk.get("usage"):
+        # Final usage-only chunk (stream_options.include_usage)
+        return {
+            "id": chunk.get("id", ""),
+            "object": "chat.completion.chunk",
+            "created": chunk.get("created", 0),
+            "model": model,
+            "choices": [],
+            "usage": chunk["usage"],
+        }
+
+    choice = (chunk.get("choices") or [{}])[0]
+    delta = {"content": choice.get("text", "")}
+    if first:
+        delta = {"role": "assistant", **delta}
+
+    return {
+        "id": chunk.get("id", ""),
+        "object": "chat.completion.chunk",
+        "created": chunk.get("created", 0),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "delta": delta,
+                "finish_reason": choice.get("finish_reason"),
+            }
+        ],
+    }
+
+
+def _with_stream_usage(payload: dict) -> Tuple[dict, bool]:
+    """
+    Ask vLLM to report usage in a final stream chunk. Also returns whether the
+    client asked for that chunk itself (otherwise it is not relayed).
+    """
+    options = payload.get("stream_options") or {}
+    requested = bool(options.get("include_usage"))
+    return {**payload, "stream_options": {**options, "include_usage": True}}, requested
+
+
+async def _open_upstream_stream(
+    client: httpx.AsyncClient,
+    admission: AdmissionController,
+    user: Principal,
+    path: str,
+    payload: dict,
+    affinity_key: Optional[str] = None,
+) -> Tuple[httpx.Response, Backend]:
+    """
+    Send a streaming request to vLLM and return the response once headers
+    arrive. The chosen backend stays acquired until the caller releases it.
+    """
+    backend = await admission.acquire(affinity_key, *fair_share(user))
+    upstream_request = client.build_request(
+        "POST", f"{backend.url}{path}", json=payload
+    )
+    try:
+        response = await client.send(upstream_request, stream=True)
+        if response.is_error:
+            await response.aclose()
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        admission.release(backend)
+        if isinstance(e, httpx.RequestError):
+            admission.pool.report_failure(backend)
+        raise upstream_error(e)
+    return response, backend
+
+
+async def _relay_sse(
+    response: httpx.Response,
+    release: Callable[[], None],
+    record: UsageRecord,
+    chat_model: Optional[str] = None,
+    relay_usage: bool = False,
+) -> AsyncIterator[str]:
+    """
+    Relay vLLM server-sent events to the client as they arrive.
+
+    When ``chat_model`` is given, completion chunks are translated into
+    ``chat.completion.chunk`` events. ``record`` is kept up to date as chunks
+    are relayed: from the usage vLLM reports in its final chunk, or by
+    counting chunks until then, so whatever was streamed is accounted for
+    even if the client goes away. Usage-only chunks are only relayed when
+    ``relay_usage`` is set.
+    """
+    completion_tokens = 0
+    first = True
+    try:
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                yield "data: [DONE]\n\n"
+                break
+
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+
+            usage = chunk.get("usage")
+            if usage and usage.get("completion_tokens") is not None:
+                completion_tokens = usage["completion_tokens"]
+                if usage.get("prompt_tokens") is not None:
+                    record.prompt_tokens = usage["prompt_tokens"]
+            elif any(c.get("text") for c in chunk.get("choices") or []):
+                # vLLM emits one chunk per generated token
+                completion_tokens += 1
+            record.completion_tokens = completion_tokens
+
+            if not chunk.get("choices") and not relay_usage:
+                continue
+            if chat_model is not None:
+                chunk = _chat_chunk_from_completion_chunk(chunk, chat_model, first)
+                first = False
+            yield f"data: {json.dumps(chunk)}\n\n"
+    finally:
+        await response.aclose()
+        release()
+
+
+def _cache_slot(
+    cache: Optional[ResponseCache], request: Request, endpoint: str, body: dict
+) -> Optional[Tuple[ResponseCache, str]]:
+    """The cache and the request's key in it, or None if the cache does not apply"""
+    if cache is None or cache_bypassed(request):
+        return None
+    key = cache_key(endpoint, body)
+    return None if key is None else (cache, key)
+
+
+async def _fetch_completion(
+    client: httpx.AsyncClient,
+    admission: AdmissionController,
+    user: Principal,
+    payload: dict,
+    flights: Optional[SingleFlight],
+    flight_key: Optional[str],
+    affinity_key: Optional[str] = None,
+) -> dict:
+    """
+    POST a non-streaming completion to vLLM and return the parsed result.
+    Identical deterministic requests already in flight share one upstream call.
+    """
+
+    async def fetch() -> dict:
+        async with admission.lease(affinity_key, *fair_share(user)) as backend:
+            response = await post_to_backend(
+                client, admission.pool, backend, "/v1/completions", payload
+            )
+        return response.json()
+
+    if flights is None or flight_key is None:
+        return await fetch()
+    return await flights.do(flight_key, fetch)
+
+
+def _sse_response(
+    stream: AsyncIterator[str], headers: Optional[Dict[str, str]] = None
+) -> StreamingResponse:
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            **(headers or {}),
+        },
+    )
 
 
 @router.post("/v1/chat/completions")
 async def chat_completions_openai(
     request: Request,
-    user: User = Depends(get_user_from_api_key),
-    db: Session = Depends(get_db),
+    http_response: Response,
+    user: Principal = Depends(get_user_from_api_key),
+    db: AsyncSession = Depends(get_async_db),
+    client: httpx.AsyncClient = Depends(get_upstream_client),
+    admission: AdmissionController = Depends(get_admission_controller),
+    cache: Optional[ResponseCache] = Depends(get_response_cache),
+    flights: Optional[SingleFlight] = Depends(get_single_flight),
+    counter: TokenCounter = Depends(get_token_counter),
+    limiter: RateLimiter = Depends(get_rate_limiter),
 ):
     """OpenAI-compatible chat completions endpoint"""
     # Parse request body
@@ -52,18 +268,14 @@ async def chat_completions_openai(
     if user.tokens_used >= user.token_limit:
         raise HTTPException(status_code=429, detail="Token limit exceeded")
 
-    # Extract messages and estimate tokens
+    # Extract messages and count prompt tokens
     messages = body.get("messages", [])
     prompt_text = ""
     for msg in messages:
         if isinstance(msg, dict) and "content" in msg:
-            prompt_text += msg["content"] + " "
-
-    token_count = len(prompt_text.split())  # rough estimate
+            prompt_text += message_text(msg) + " "
 
-    # Check if this request would exceed limit
-    if user.tokens_used + token_count > user.token_limit:
-        raise HTTPException(status_code=429, detail="Request would exceed token limit")
+    token_count = await counter.count_messages(body.get("model"), messages)
 
     # Convert OpenAI format to vLLM format
     vllm_request = {
@@ -79,62 +291,120 @@ async def chat_completions_openai(
         if key not in ["messages", "model"] and key not in vllm_request:
             vllm_request[key] = value
 
-    # Proxy to vLLM
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{settings.vllm_endpoint}/v1/completions",
-                json=vllm_request,
-                timeout=60.0,
+    reservation = token_count + requested_max_tokens(vllm_request)
+    rate_headers = limiter.check(user, reservation, request.state.api_key_prefix)
+    http_response.headers.update(rate_headers)
+
+    # Reserve the worst case; the API call tracker settles the real usage
+    record = track_usage(request, user, body.get("model"))
+    record.reserved = await reserve_tokens(db, user, reservation)
+
+    # Serve deterministic repeats from the response cache
+    slot = _cache_slot(cache, request, "/v1/chat/completions", body)
+    if slot is not None:
+        response_cache, key = slot
+        http_response.headers[CACHE_HEADER] = "MISS"
+        cached = response_cache.get(key)
+        if cached is not None:
+            usage = cached["usage"]
+            record.prompt_tokens, record.completion_tokens = billable_usage(
+                usage["prompt_tokens"], usage["completion_tokens"]
             )
-            response.raise_for_status()
-            vllm_result = response.json()
-
-            # Convert vLLM response to OpenAI format
-            openai_response = {
-                "id": vllm_result.get("id", "chatcmpl-" + str(hash(str(vllm_result)))),
-                "object": "chat.completion",
-                "created": vllm_result.get("created", 0),
-                "model": body.get("model", "llm-user-managed"),
-                "choices": [
-                    {
-                        "index": 0,
-                        "message": {
-                            "role": "assistant",
-                            "content": vllm_result.get("choices", [{}])[0].get(
-                                "text", ""
-                            ),
-                        },
-                        "finish_reason": vllm_result.get("choices", [{}])[0].get(
-                            "finish_reason", "stop"
-                        ),
-                    }
-                ],
-                "usage": {
-                    "prompt_tokens": token_count,
-                    "completion_tokens": len(
-                        vllm_result.get("choices", [{}])[0].get("text", "").split()
+            record.cached = True
+            http_response.headers[CACHE_HEADER] = "HIT"
+            return cached
+
+    # Keep a conversation on one replica so vLLM can reuse its prefix cache
+    affinity_key = prefix_affinity_key(messages, settings.prefix_affinity_turns)
+
+    if vllm_request["stream"]:
+        vllm_request, relay_usage = _with_stream_usage(vllm_request)
+        response, backend = await _open_upstream_stream(
+            client, admission, user, "/v1/completions", vllm_request, affinity_key
+        )
+        record.prompt_tokens = token_count
+        return _sse_response(
+            _relay_sse(
+                response,
+                lambda: admission.release(backend),
+                record,
+                chat_model=body.get("model", "llm-user-managed"),
+                relay_usage=relay_usage,
+            ),
+            rate_headers,
+        )
+
+    # Proxy to vLLM
+    try:
+        vllm_result = await _fetch_completion(
+            client,
+            admission,
+            user,
+            vllm_request,
+            flights,
+            cache_key("/v1/chat/completions", body),
+            affinity_key,
+        )
+
+        completion_text = vllm_result.get("choices", [{}])[0].get("text", "")
+        prompt_tokens, completion_tokens = reported_usage(
+            vllm_result,
+            token_count,
+            lambda: counter.count(body.get("model"), completion_text),
+        )
+
+        # Convert vLLM response to OpenAI format
+        openai_response = {
+            "id": vllm_result.get("id", "chatcmpl-" + str(hash(str(vllm_result)))),
+            "object": "chat.completion",
+            "created": vllm_result.get("created", 0),
+            "model": body.get("model", "llm-user-managed"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": vllm_result.get("choices", [{}])[0].get("text", ""),
+                    },
+                    "finish_reason": vllm_result.get("choices", [{}])[0].get(
+                        "finish_reason", "stop"
                     ),
-                    "total_tokens": token_count
-                    + len(vllm_result.get("choices", [{}])[0].get("text", "").split()),
-                },
-            }
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
 
-            # Update token usage
-            user.tokens_used += openai_response["usage"]["total_tokens"]
-            db.commit()
+        record.prompt_tokens, record.completion_tokens = (
+            prompt_tokens,
+            completion_tokens,
+        )
 
-            return openai_response
+        if slot is not None:
+            response_cache, key = slot
+            response_cache.set(key, openai_response)
 
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=502, detail=f"vLLM service error: {str(e)}")
+        return openai_response
+
+    except httpx.HTTPError as e:
+        raise upstream_error(e)
 
 
 @router.post("/v1/completions")
 async def completions_openai(
     request: Request,
-    user: User = Depends(get_user_from_api_key),
-    db: Session = Depends(get_db),
+    http_response: Response,
+    user: Principal = Depends(get_user_from_api_key),
+    db: AsyncSession = Depends(get_async_db),
+    client: httpx.AsyncClient = Depends(get_upstream_client),
+    admission: AdmissionController = Depends(get_admission_controller),
+    cache: Optional[ResponseCache] = Depends(get_response_cache),
+    flights: Optional[SingleFlight] = Depends(get_single_flight),
+    counter: TokenCounter = Depends(get_token_counter),
+    limiter: RateLimiter = Depends(get_rate_limiter),
 ):
     """OpenAI-compatible completions endpoint (legacy)"""
     # Parse request body
@@ -144,72 +414,92 @@ async def completions_openai(
     if user.tokens_used >= user.token_limit:
         raise HTTPException(status_code=429, detail="Token limit exceeded")
 
-    # Estimate tokens
+    # Count prompt tokens
     prompt = body.get("prompt", "")
-    token_count = len(prompt.split())
-
-    if user.tokens_used + token_count > user.token_limit:
-        raise HTTPException(status_code=429, detail="Request would exceed token limit")
+    token_count = await counter.count_text(body.get("model"), prompt)
+
+    reservation = token_count + requested_max_tokens(body)
+    rate_headers = limiter.check(user, reservation, request.state.api_key_prefix)
+    http_response.headers.update(rate_headers)
+
+    # Reserve the worst case; the API call tracker settles the real usage
+    record = track_usage(request, user, body.get("model"))
+    record.reserved = await reserve_tokens(db, user, reservation)
+
+    if body.get("stream"):
+        payload, relay_usage = _with_stream_usage(body)
+        response, backend = await _open_upstream_stream(
+            client, admission, user, "/v1/completions", payload
+        )
+        record.prompt_tokens = token_count
+        return _sse_response(
+            _relay_sse(
+                response,
+                lambda: admission.release(backend),
+                record,
+                relay_usage=relay_usage,
+            ),
+            rate_headers,
+        )
+
+    # Serve deterministic repeats from the response cache
+    slot = _cache_slot(cache, request, "/v1/completions", body)
+    if slot is not None:
+        response_cache, key = slot
+        http_response.headers[CACHE_HEADER] = "MISS"
+        cached = response_cache.get(key)
+        if cached is not None:
+            record.prompt_tokens, record.completion_tokens = billable_usage(
+                *reported_usage(
+                    cached,
+                    token_count,
+                    lambda: counter.count(
+                        body.get("model"),
+                        cached.get("choices", [{}])[0].get("text", ""),
+                    ),
+                )
+            )
+            record.cached = True
+            http_response.headers[CACHE_HEADER] = "HIT"
+            return cached
 
     # Proxy to vLLM
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{settings.vllm_endpoint}/v1/completions", json=body, timeout=60.0
-            )
-            response.raise_for_status()
-            result = response.json()
+    try:
+        result = await _fetch_completion(
+            client, admission, user, body, flights, cache_key("/v1/completions", body)
+        )
 
-            # Update token usage
-            completion_tokens = len(
-                result.get("choices", [{}])[0].get("text", "").split()
-            )
-            user.tokens_used += token_count + completion_tokens
-            db.commit()
+        record.prompt_tokens, record.completion_tokens = reported_usage(
+            result,
+            token_count,
+            lambda: counter.count(
+                body.get("model"), result.get("choices", [{}])[0].get("text", "")
+            ),
+        )
+
+        if slot is not None:
+            response_cache, key = slot
+            response_cache.set(key, result)
 
-            return result
+        return result
 
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=502, detail=f"vLLM service error: {str(e)}")
+    except httpx.HTTPError as e:
+        raise upstream_error(e)
 
 
 @router.get("/v1/models")
-async def list_models():
-    """OpenAI-compatible models endpoint - proxies to vLLM"""
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(f"{settings.vllm_endpoint}/v1/models")
-            response.raise_for_status()
-            return response.json()
-    except httpx.RequestError as e:
-        # If vLLM is not available, return a fallback response matching vLLM format
-        return {
-            "object": "list",
-            "data": [
-                {
-                    "id": "mistralai/Devstral-2-123B-Instruct-2512",
-                    "object": "model",
-                    "created": 1765900623,
-                    "owned_by": "vllm",
-                    "root": "mistralai/Devstral-2-123B-Instruct-2512",
-                    "parent": None,
-                    "max_model_len": 262144,
-                    "permission": [
-                        {
-                            "id": "modelperm-a0229203fcd27c57",
-                            "object": "model_permission",
-                            "created": 1765900623,
-                            "allow_create_engine": False,
-                            "allow_sampling": True,
-                            "allow_logprobs": True,
-                            "allow_search_indices": False,
-                            "allow_view": True,
-                            "allow_fine_tuning": False,
-                            "organization": "*",
-                            "group": None,
-                            "is_blocking": False
-                        }
-                    ]
-                }
-            ]
-        }
+async def list_models(
+    request: Request,
+    catalog: ModelCatalog = Depends(get_model_catalog),
+):
+    """
+    OpenAI-compatible models endpoint - served from the cached model catalog,
+    which the background refresh keeps current (the fallback list until then)
+    """
+    payload, etag = catalog.snapshot()
+    header = request.headers.get("if-none-match", "")
+    if_none_match = [tag.strip() for tag in header.split(",")]
+    if etag in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return JSONResponse(payload, headers={"ETag": etag})
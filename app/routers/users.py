@@ -1,13 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func, extract
+import uuid
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Optional, cast
 
 from app import schemas
+from app.dependencies.auth import get_current_principal
 from app.dependencies.auth import get_current_user as get_current_user_dep
-from app.dependencies.database import get_db
-from app.models.user import User, ApiCall
+from app.dependencies.database import get_db, get_read_db
+from app.models.user import User, ApiCall, ApiKey
+from app.services.auth_cache import Principal, invalidate_user
+from app.services.rollups import call_bounds, daily_totals, model_totals
+from app.utils.security import issue_api_key
 
 router = APIRouter()
 
@@ -30,9 +35,115 @@ def update_token_limit(
 
     current_user.token_limit = token_limit
     db.commit()
+    invalidate_user(cast(int, current_user.id))
     return {"message": "Token limit updated"}
 
 
+@router.post("/me/api-key", response_model=schemas.UserWithApiKey)
+def regenerate_api_key(
+    current_user: User = Depends(get_current_user_dep),
+    db: Session = Depends(get_db),
+):
+    """
+    Issue a new API key; all previous keys stop working immediately
+    """
+    db.query(ApiKey).filter(
+        ApiKey.user_id == current_user.id, ApiKey.revoked_at.is_(None)
+    ).update({ApiKey.revoked_at: datetime.utcnow()}, synchronize_session=False)
+    api_key, _ = issue_api_key(db, cast(int, current_user.id))
+    db.commit()
+    db.refresh(current_user)
+    invalidate_user(cast(int, current_user.id))
+    return schemas.UserWithApiKey(
+        **schemas.User.model_validate(current_user).model_dump(), api_key=api_key
+    )
+
+
+@router.get("/me/api-keys", response_model=List[schemas.ApiKeyInfo])
+def list_api_keys(
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_read_db),
+):
+    """
+    List the active API keys (prefixes only, secrets are never stored)
+    """
+    return (
+        db.query(ApiKey)
+        .filter(ApiKey.user_id == current_user.id, ApiKey.revoked_at.is_(None))
+        .order_by(ApiKey.created_at)
+        .all()
+    )
+
+
+@router.post("/me/api-keys", response_model=schemas.ApiKeyCreated)
+def create_api_key(
+    name: Optional[str] = Query(None, description="Label for the new key"),
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+):
+    """
+    Issue an additional API key; existing keys keep working, for rotation
+    """
+    api_key, key = issue_api_key(db, current_user.id, name)
+    db.commit()
+    db.refresh(key)
+    return schemas.ApiKeyCreated(
+        **schemas.ApiKeyInfo.model_validate(key).model_dump(), api_key=api_key
+    )
+
+
+@router.delete("/me/api-keys/{prefix}")
+def revoke_api_key(
+    prefix: str,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+):
+    """
+    Revoke one API key by its prefix
+    """
+    revoked = (
+        db.query(ApiKey)
+        .filter(
+            ApiKey.user_id == current_user.id,
+            ApiKey.prefix == prefix,
+            ApiKey.revoked_at.is_(None),
+        )
+        .update({ApiKey.revoked_at: datetime.utcnow()}, synchronize_session=False)
+    )
+    db.commit()
+    if not revoked:
+        raise HTTPException(status_code=404, detail="API key not found")
+    invalidate_user(current_user.id)
+    return {"message": "API key revoked"}
+
+
+@router.delete("/me")
+def delete_current_user(
+    current_user: User = Depends(get_current_user_dep),
+    db: Session = Depends(get_db),
+):
+    """
+    Close the current account: its password, API keys and issued tokens stop
+    working and the username is released. The user row itself is kept so the
+    API call history and usage rollups stay attributed for billing.
+    """
+    user_id = cast(int, current_user.id)
+    db.query(ApiKey).filter(
+        ApiKey.user_id == user_id, ApiKey.revoked_at.is_(None)
+    ).update({ApiKey.revoked_at: datetime.utcnow()}, synchronize_session=False)
+    db.query(User).filter(User.id == user_id).update(
+        {
+            User.username: f"deleted_{user_id}_{uuid.uuid4().hex}",
+            User.hashed_password: None,
+            User.token_version: func.coalesce(User.token_version, 0) + 1,
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    invalidate_user(user_id)
+    return {"message": "User deleted"}
+
+
 @router.get("/usage")
 def get_usage(current_user: User = Depends(get_current_user_dep)):
     return {
@@ -45,8 +156,8 @@ def get_usage(current_user: User = Depends(get_current_user_dep)):
 @router.get("/billing/daily")
 def get_daily_usage(
     days: int = Query(30, description="Number of days to look back"),
-    current_user: User = Depends(get_current_user_dep),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_read_db),
 ):
     """
     Get daily usage statistics for billing purposes
@@ -54,21 +165,10 @@ def get_daily_usage(
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
 
-    # Query daily usage
-    daily_usage = db.query(
-        func.date(ApiCall.timestamp).label('date'),
-        func.count(ApiCall.id).label('call_count'),
-        func.sum(ApiCall.tokens_used).label('tokens_used'),
-        func.sum(ApiCall.estimated_cost).label('estimated_cost')
-    ).filter(
-        ApiCall.user_id == current_user.id,
-        ApiCall.timestamp >= start_date,
-        ApiCall.timestamp <= end_date
-    ).group_by(
-        func.date(ApiCall.timestamp)
-    ).order_by(
-        func.date(ApiCall.timestamp)
-    ).all()
+    # Whole days from the rollup, up to and including today
+    daily_usage = daily_totals(
+        db, current_user.id, start_date.date(), end_date.date() + timedelta(days=1)
+    )
 
     # Format the results
     usage_data = []
@@ -86,7 +186,7 @@ def get_daily_usage(
         "period_days": days,
         "daily_usage": usage_data,
         "summary": {
-            "total_calls": sum(row.call_count or 0 for row in daily_usage),
+            "total_calls": sum(int(row.call_count or 0) for row in daily_usage),
             "total_tokens": float(sum(row.tokens_used or 0 for row in daily_usage)),
             "total_cost": float(sum(row.estimated_cost or 0 for row in daily_usage))
         }
@@ -99,8 +199,8 @@ def get_api_calls(
     offset: int = Query(0, description="Number of calls to skip"),
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
-    current_user: User = Depends(get_current_user_dep),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_read_db),
 ):
     """
     Get detailed API call history for billing
@@ -140,10 +240,13 @@ def get_api_calls(
             "method": call.method,
             "status_code": call.status_code,
             "tokens_used": float(call.tokens_used),
+            "prompt_tokens": call.prompt_tokens or 0,
+            "completion_tokens": call.completion_tokens or 0,
             "model": call.model,
             "estimated_cost": float(call.estimated_cost),
             "request_size": call.request_size,
-            "response_size": call.response_size
+            "response_size": call.response_size,
+            "cached": bool(call.cached)
         })
 
     return {
@@ -160,8 +263,8 @@ def get_api_calls(
 def get_billing_summary(
     month: Optional[int] = Query(None, description="Month (1-12)"),
     year: Optional[int] = Query(None, description="Year (e.g., 2025)"),
-    current_user: User = Depends(get_current_user_dep),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_read_db),
 ):
     """
     Get billing summary for current month or specified month/year
@@ -182,53 +285,46 @@ def get_billing_summary(
     else:
         end_date = datetime(target_year, target_month + 1, 1)
 
-    # Get monthly usage
-    monthly_stats = db.query(
-        func.count(ApiCall.id).label('call_count'),
-        func.sum(ApiCall.tokens_used).label('tokens_used'),
-        func.sum(ApiCall.estimated_cost).label('estimated_cost'),
-        func.avg(ApiCall.tokens_used).label('avg_tokens_per_call'),
-        func.min(ApiCall.timestamp).label('first_call'),
-        func.max(ApiCall.timestamp).label('last_call')
-    ).filter(
-        ApiCall.user_id == current_user.id,
-        ApiCall.timestamp >= start_date,
-        ApiCall.timestamp < end_date
-    ).first()
-
-    # Get daily breakdown for the month
-    daily_breakdown = db.query(
-        func.date(ApiCall.timestamp).label('date'),
-        func.count(ApiCall.id).label('calls'),
-        func.sum(ApiCall.tokens_used).label('tokens')
-    ).filter(
-        ApiCall.user_id == current_user.id,
-        ApiCall.timestamp >= start_date,
-        ApiCall.timestamp < end_date
-    ).group_by(
-        func.date(ApiCall.timestamp)
-    ).order_by(
-        func.date(ApiCall.timestamp)
-    ).all()
+    # Daily breakdown for the month from the rollup
+    daily_breakdown = daily_totals(
+        db, current_user.id, start_date.date(), end_date.date()
+    )
+    by_model = model_totals(db, current_user.id, start_date.date(), end_date.date())
+    first_call, last_call = call_bounds(db, current_user.id, start_date, end_date)
+
+    total_calls = sum(int(row.call_count or 0) for row in daily_breakdown)
+    total_tokens = float(sum(row.tokens_used or 0 for row in daily_breakdown))
 
     daily_data = []
     for row in daily_breakdown:
         daily_data.append({
             "date": str(row.date) if row.date else None,
-            "calls": int(row.calls or 0),
-            "tokens": float(row.tokens or 0)
+            "calls": int(row.call_count or 0),
+            "tokens": float(row.tokens_used or 0)
+        })
+
+    model_data = []
+    for row in by_model:
+        model_data.append({
+            "model": row.model or None,
+            "calls": int(row.call_count or 0),
+            "prompt_tokens": int(row.prompt_tokens or 0),
+            "completion_tokens": int(row.completion_tokens or 0),
+            "tokens": float(row.tokens_used or 0),
+            "estimated_cost": float(row.estimated_cost or 0)
         })
 
     return {
         "user_id": current_user.id,
         "billing_period": f"{target_year}-{target_month:02d}",
         "summary": {
-            "total_calls": monthly_stats.call_count or 0,
-            "total_tokens": float(monthly_stats.tokens_used or 0),
-            "estimated_cost": float(monthly_stats.estimated_cost or 0),
-            "avg_tokens_per_call": float(monthly_stats.avg_tokens_per_call or 0),
-            "first_call": monthly_stats.first_call.isoformat() if monthly_stats.first_call else None,
-            "last_call": monthly_stats.last_call.isoformat() if monthly_stats.last_call else None
+            "total_calls": total_calls,
+            "total_tokens": total_tokens,
+            "estimated_cost": float(sum(row.estimated_cost or 0 for row in daily_breakdown)),
+            "avg_tokens_per_call": total_tokens / total_calls if total_calls else 0.0,
+            "first_call": first_call.isoformat() if first_call else None,
+            "last_call": last_call.isoformat() if last_call else None
         },
-        "daily_breakdown": daily_data
+        "daily_breakdown": daily_data,
+        "model_breakdown": model_data
     }
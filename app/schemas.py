@@ -1,5 +1,5 @@
 from typing import Optional, List
-from datetime import date
+from datetime import date, datetime
 
 from pydantic import BaseModel, field_validator
 
@@ -23,6 +23,9 @@ class UserCreate(UserBase):
 class User(UserBase):
     id: int
     tokens_used: int
+    scheduling_weight: Optional[float] = 1.0
+    rpm_limit: Optional[int] = None
+    tpm_limit: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -32,6 +35,19 @@ class UserWithApiKey(User):
     api_key: str
 
 
+class ApiKeyInfo(BaseModel):
+    prefix: str
+    name: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ApiKeyCreated(ApiKeyInfo):
+    api_key: str
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -49,10 +65,13 @@ class ApiCallInfo(BaseModel):
     method: str
     status_code: int
     tokens_used: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
     model: Optional[str]
     estimated_cost: float
     request_size: int
     response_size: int
+    cached: bool = False
 
     class Config:
         from_attributes = True
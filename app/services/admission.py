@@ -0,0 +1,203 @@
+# app/services/admission.py
+"""
+Admission control in front of the vLLM backends.
+
+Each backend accepts a bounded number of in-flight requests. When every
+backend is full, requests wait in a bounded queue for a slot to free up.
+Requests are shed with a fast 503 and ``Retry-After`` when the queue is full
+or when they have waited longer than the maximum queue time, which keeps
+latency bounded for the requests that are admitted.
+
+The queue is served by start-time fair queuing (SFQ) across flows, normally
+one flow per user. Each waiter is tagged with a virtual start time, the later
+of the current virtual time and its flow's previous finish tag, and a finish
+tag ``start + 1 / weight``. Freed slots go to the waiter with the smallest
+start tag, and the virtual time advances to the start tag of the waiter
+served. Under contention every waiting user therefore gets a share of freed
+slots proportional to their weight, so one user's batch job cannot starve
+everyone else.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.services.backends import Backend, BackendPool, backend_pool
+
+
+class AdmissionMetrics:
+    """Counters describing the admission queue"""
+
+    def __init__(self):
+        self.admitted_total = 0
+        self.queued_total = 0
+        self.rejected_queue_full_total = 0
+        self.rejected_timeout_total = 0
+        self.wait_seconds_sum = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        self.admitted_total += 1
+        self.wait_seconds_sum += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+class AdmissionController:
+    """Hands out backend slots, queueing and shedding requests under overload"""
+
+    def __init__(
+        self,
+        pool: BackendPool,
+        queue_size: int,
+        queue_timeout: float,
+        retry_after: int,
+    ):
+        self.pool = pool
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.metrics = AdmissionMetrics()
+        # Heap of (start tag, sequence, future, affinity key)
+        self._waiters: List[
+            Tuple[float, int, "asyncio.Future[Backend]", Optional[str]]
+        ] = []
+        self._depth = 0
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._finish_tags: Dict[str, float] = {}
+
+    @property
+    def queue_depth(self) -> int:
+        return self._depth
+
+    def _try_acquire(self, affinity_key: Optional[str]) -> Optional[Backend]:
+        available = self.pool.available()
+        if not available:
+            return None
+        return self.pool.acquire(self.pool.choose(affinity_key, available))
+
+    def _overloaded(self, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    def _enqueue(
+        self, flow: Optional[str], weight: float, affinity_key: Optional[str]
+    ) -> "asyncio.Future[Backend]":
+        """Queue a waiter, tagging it with its flow's virtual start/finish time"""
+        flow = flow or ""
+        start = max(self._virtual_time, self._finish_tags.get(flow, 0.0))
+        finish = start + 1.0 / (weight if weight > 0 else 1.0)
+        self._finish_tags[flow] = finish
+
+        future: "asyncio.Future[Backend]" = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiters, (start, next(self._sequence), future, affinity_key)
+        )
+        self._depth += 1
+
+        # Drop entries of requests that gave up once they dominate the heap
+        if len(self._waiters) > 2 * max(self.queue_size, 1):
+            self._waiters = [w for w in self._waiters if not w[2].done()]
+            heapq.heapify(self._waiters)
+        return future
+
+    async def acquire(
+        self,
+        affinity_key: Optional[str] = None,
+        flow: Optional[str] = None,
+        weight: float = 1.0,
+    ) -> Backend:
+        """
+        Reserve a slot on a backend, waiting in the queue if all of them are
+        full. ``flow`` identifies the caller (usually the user) for fair
+        queuing and ``weight`` is its share. Raises a 503 if the queue is full
+        or the wait times out.
+        """
+        if self._depth == 0:
+            backend = self._try_acquire(affinity_key)
+            if backend is not None:
+                self.metrics.record_wait(0.0)
+                return backend
+
+        if self._depth >= self.queue_size:
+            self.metrics.rejected_queue_full_total += 1
+            raise self._overloaded("Gateway overloaded: admission queue is full")
+
+        future = self._enqueue(flow, weight, affinity_key)
+        self.metrics.queued_total += 1
+        started = time.monotonic()
+        try:
+            backend = await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.metrics.rejected_timeout_total += 1
+            raise self._overloaded("Gateway overloaded: timed out waiting for a slot")
+        except BaseException:
+            # A slot may have been handed over just as the caller went away
+            if future.done() and not future.cancelled():
+                self.release(future.result())
+            raise
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                # Idle queue: fairness history no longer matters
+                self._finish_tags.clear()
+
+        self.metrics.record_wait(time.monotonic() - started)
+        return backend
+
+    def release(self, backend: Backend) -> None:
+        """Free a slot and hand capacity to queued requests in fair order"""
+        self.pool.release(backend)
+        while self._waiters:
+            start, _, future, affinity_key = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            next_backend = self._try_acquire(affinity_key)
+            if next_backend is None:
+                break
+            heapq.heappop(self._waiters)
+            self._virtual_time = start
+            future.set_result(next_backend)
+
+    @asynccontextmanager
+    async def lease(
+        self,
+        affinity_key: Optional[str] = None,
+        flow: Optional[str] = None,
+        weight: float = 1.0,
+    ) -> AsyncIterator[Backend]:
+        """Hold a backend slot for the duration of a non-streaming call"""
+        backend = await self.acquire(affinity_key, flow, weight)
+        try:
+            yield backend
+        finally:
+            self.release(backend)
+
+
+def fair_share(user) -> Tuple[str, float]:
+    """Fair-queuing flow and weight for a user (anything with id/scheduling_weight)"""
+    weight = getattr(user, "scheduling_weight", None) or 1.0
+    return str(user.id), float(weight)
+
+
+admission_controller = AdmissionController(
+    backend_pool,
+    queue_size=settings.admission_queue_size,
+    queue_timeout=settings.admission_queue_timeout,
+    retry_after=settings.admission_retry_after,
+)
+
+
+def get_admission_controller() -> AdmissionController:
+    """Dependency returning the application-wide admission controller"""
+    return admission_controller
@@ -0,0 +1,179 @@
+# app/services/auth_cache.py
+"""
+In-process cache of authenticated principals.
+
+Identifying the caller of a proxied request used to cost a ``users`` query in
+the route dependency and another one in the tracking middleware. Both now
+resolve the key through a bounded TTL cache of lightweight principals that do
+not hold a database session. JWT-authenticated requests resolve the user id
+carried in the token through a second cache keyed by user id, which also
+holds the token version used for revocation. Changes made through the users
+and auth routers invalidate entries explicitly; other workers pick them up
+when the TTL expires.
+"""
+
+import hashlib
+from typing import Optional, cast
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.user import User
+from app.utils.cache import TTLCache
+from app.utils.security import verify_api_key, verify_api_key_async
+
+
+class Principal:
+    """Session-independent identity and limits of an API key's owner"""
+
+    __slots__ = (
+        "id",
+        "username",
+        "token_limit",
+        "tokens_used",
+        "scheduling_weight",
+        "token_version",
+        "rpm_limit",
+        "tpm_limit",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        username: str,
+        token_limit: int,
+        tokens_used: float = 0,
+        scheduling_weight: float = 1.0,
+        token_version: int = 0,
+        rpm_limit: Optional[int] = None,
+        tpm_limit: Optional[int] = None,
+    ):
+        self.id = id
+        self.username = username
+        self.token_limit = token_limit
+        self.tokens_used = tokens_used
+        self.scheduling_weight = scheduling_weight
+        self.token_version = token_version
+        self.rpm_limit = rpm_limit  # None uses the default in Settings
+        self.tpm_limit = tpm_limit
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        # The untyped declarative columns read as Column[...] to mypy; on an
+        # instance they hold plain values
+        return cls(
+            id=cast(int, user.id),
+            username=cast(str, user.username),
+            token_limit=cast(int, user.token_limit or 0),
+            tokens_used=cast(int, user.tokens_used or 0),
+            scheduling_weight=cast(float, user.scheduling_weight or 1.0),
+            token_version=cast(int, user.token_version or 0),
+            rpm_limit=cast(Optional[int], user.rpm_limit),
+            tpm_limit=cast(Optional[int], user.tpm_limit),
+        )
+
+    def __repr__(self):
+        return f"<Principal(id={self.id}, username='{self.username}')>"
+
+
+def _cache_key(api_key: str) -> str:
+    # Keep digests rather than raw keys as cache keys
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class ApiKeyCache:
+    """Bounded TTL cache mapping API keys to principals"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, api_key: str) -> Optional[Principal]:
+        return self._cache.get(_cache_key(api_key))
+
+    def put(self, api_key: str, principal: Principal) -> None:
+        self._cache.set(_cache_key(api_key), principal)
+
+    def invalidate_key(self, api_key: str) -> None:
+        self._cache.delete(_cache_key(api_key))
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop every cached key of a user (rare, so a scan is fine)"""
+        for key, principal in self._cache.items():
+            if principal.id == user_id:
+                self._cache.delete(key)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+api_key_cache = ApiKeyCache(
+    max_entries=settings.api_key_cache_max_entries,
+    ttl=settings.api_key_cache_ttl,
+)
+# Principals by user id, shared with API key lookups so usage mirrors agree
+user_cache = TTLCache(
+    max_entries=settings.api_key_cache_max_entries,
+    ttl=settings.api_key_cache_ttl,
+)
+
+
+def _cached_principal(user: User) -> Principal:
+    principal = user_cache.get(str(user.id))
+    if principal is None:
+        principal = Principal.from_user(user)
+        user_cache.set(str(user.id), principal)
+    return principal
+
+
+def load_principal(user_id: int, db: Session) -> Optional[Principal]:
+    """Principal for a user id, querying the database on a miss"""
+    principal = user_cache.get(str(user_id))
+    if principal is not None:
+        return principal
+
+    user = db.get(User, user_id)
+    if user is None:
+        return None
+    return _cached_principal(user)
+
+
+def invalidate_user(user_id: int) -> None:
+    """Forget everything cached about a user after their row changed"""
+    api_key_cache.invalidate_user(user_id)
+    user_cache.delete(str(user_id))
+
+
+def authenticate_api_key(api_key: str, db: Session) -> Optional[Principal]:
+    """Resolve an API key to its principal, querying the database on a miss"""
+    principal = api_key_cache.get(api_key)
+    if principal is not None:
+        return principal
+
+    user = verify_api_key(api_key, db)
+    if not user:
+        return None
+
+    principal = _cached_principal(user)
+    api_key_cache.put(api_key, principal)
+    return principal
+
+
+async def authenticate_api_key_async(
+    api_key: str, db: AsyncSession
+) -> Optional[Principal]:
+    """``authenticate_api_key`` for async routes"""
+    principal = api_key_cache.get(api_key)
+    if principal is not None:
+        return principal
+
+    user = await verify_api_key_async(api_key, db)
+    if not user:
+        return None
+
+    principal = _cached_principal(user)
+    api_key_cache.put(api_key, principal)
+    return principal
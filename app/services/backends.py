@@ -0,0 +1,296 @@
+# app/services/backends.py
+"""
+Pool of vLLM replicas with in-process load balancing.
+
+Each backend keeps a counter of requests currently in flight. Requests are
+routed to the least loaded healthy replica (least outstanding requests, or
+power-of-two-choices), with loads scaled by the configured backend weight.
+In prefix-affinity mode, requests sharing a conversation prefix are pinned to
+one replica through consistent hashing with bounded loads so vLLM can reuse
+its prefix KV cache.
+A background task probes every replica and ejects the ones that keep failing
+until they report healthy again.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import json
+import math
+import random
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+import httpx
+
+from app.config import settings
+
+LEAST_OUTSTANDING = "least_outstanding"
+POWER_OF_TWO = "power_of_two"
+PREFIX_AFFINITY = "prefix_affinity"
+STRATEGIES = (LEAST_OUTSTANDING, POWER_OF_TWO, PREFIX_AFFINITY)
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def prefix_affinity_key(messages: list, turns: int) -> Optional[str]:
+    """
+    Key identifying the shared prefix of a conversation: the leading system
+    messages plus the first ``turns`` other messages. Later turns are ignored
+    so every request of the same session maps to the same key.
+    """
+    prefix = []
+    remaining = turns
+    for msg in messages:
+        if not isinstance(msg, dict):
+            continue
+        if msg.get("role") != "system":
+            if remaining <= 0:
+                break
+            remaining -= 1
+        prefix.append([msg.get("role"), msg.get("content")])
+
+    if not prefix:
+        return None
+    canonical = json.dumps(prefix, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class Backend:
+    """A single vLLM replica and its in-process routing state"""
+
+    def __init__(
+        self, url: str, weight: float = 1.0, max_concurrency: Optional[int] = None
+    ):
+        self.url = url.rstrip("/")
+        self.weight = weight if weight > 0 else 1.0
+        self.max_concurrency = max_concurrency or None
+        self.in_flight = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+
+    @property
+    def load(self) -> float:
+        """Outstanding requests (counting the next one) relative to weight"""
+        return (self.in_flight + 1) / self.weight
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.max_concurrency is None or self.in_flight < self.max_concurrency
+
+    def __repr__(self):
+        return (
+            f"<Backend(url='{self.url}', weight={self.weight}, "
+            f"in_flight={self.in_flight}, healthy={self.healthy})>"
+        )
+
+
+class BackendPool:
+    """Routes upstream requests across a set of vLLM backends"""
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        strategy: str = LEAST_OUTSTANDING,
+        unhealthy_threshold: int = 2,
+        ring_replicas: int = 100,
+        affinity_load_factor: float = 1.25,
+    ):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown load balancing strategy: {strategy}")
+        self.backends = backends
+        self.strategy = strategy
+        self.unhealthy_threshold = unhealthy_threshold
+        self.affinity_load_factor = affinity_load_factor
+
+        # Consistent hash ring with virtual nodes proportional to weight
+        ring: List[Tuple[int, int]] = []
+        for index, backend in enumerate(backends):
+            vnodes = max(1, round(ring_replicas * backend.weight))
+            for vnode in range(vnodes):
+                ring.append((_hash64(f"{backend.url}#{vnode}".encode()), index))
+        ring.sort()
+        self._ring_hashes = [h for h, _ in ring]
+        self._ring_backends = [backends[i] for _, i in ring]
+
+    @classmethod
+    def from_settings(cls) -> "BackendPool":
+        default_limit = settings.backend_max_concurrency
+        if settings.vllm_backends:
+            backends = [
+                Backend(b.url, b.weight, b.max_concurrency or default_limit)
+                for b in settings.vllm_backends
+            ]
+        else:
+            backends = [Backend(settings.vllm_endpoint, max_concurrency=default_limit)]
+        return cls(
+            backends,
+            strategy=settings.load_balancing_strategy,
+            unhealthy_threshold=settings.backend_unhealthy_threshold,
+            ring_replicas=settings.prefix_affinity_ring_replicas,
+            affinity_load_factor=settings.prefix_affinity_load_factor,
+        )
+
+    def candidates(self) -> List[Backend]:
+        """Healthy backends, or every backend if all of them are ejected"""
+        healthy = [b for b in self.backends if b.healthy]
+        return healthy or self.backends
+
+    def available(self) -> List[Backend]:
+        """Candidate backends that are below their concurrency limit"""
+        return [b for b in self.candidates() if b.has_capacity]
+
+    def choose(
+        self,
+        affinity_key: Optional[str] = None,
+        candidates: Optional[List[Backend]] = None,
+    ) -> Backend:
+        """Pick the backend for the next request without reserving it"""
+        if candidates is None:
+            candidates = self.candidates()
+        if len(candidates) == 1:
+            return candidates[0]
+
+        if self.strategy == PREFIX_AFFINITY and affinity_key is not None:
+            backend = self._choose_by_affinity(affinity_key, candidates)
+            if backend is not None:
+                return backend
+
+        if self.strategy == POWER_OF_TWO:
+            first, second = random.choices(
+                candidates, weights=[b.weight for b in candidates], k=2
+            )
+            return first if first.load <= second.load else second
+
+        # Break ties randomly so idle replicas share the load
+        return min(candidates, key=lambda b: (b.load, random.random()))
+
+    def _choose_by_affinity(
+        self, affinity_key: str, candidates: List[Backend]
+    ) -> Optional[Backend]:
+        """
+        Walk the hash ring clockwise from the key and return the first
+        candidate whose load stays within ``affinity_load_factor`` times its
+        weighted share of the traffic. Returns None if every candidate is over
+        its bound, so the caller falls back to the least loaded one.
+        """
+        total_in_flight = sum(b.in_flight for b in candidates) + 1
+        total_weight = sum(b.weight for b in candidates)
+        eligible = set(id(b) for b in candidates)
+        seen = set()
+
+        start = bisect.bisect(self._ring_hashes, _hash64(affinity_key.encode()))
+        ring_size = len(self._ring_backends)
+        for offset in range(ring_size):
+            backend = self._ring_backends[(start + offset) % ring_size]
+            if id(backend) in seen or id(backend) not in eligible:
+                continue
+            seen.add(id(backend))
+
+            share = total_in_flight * backend.weight / total_weight
+            if backend.in_flight + 1 <= math.ceil(self.affinity_load_factor * share):
+                return backend
+            if len(seen) == len(eligible):
+                break
+        return None
+
+    def acquire(
+        self, backend: Optional[Backend] = None, affinity_key: Optional[str] = None
+    ) -> Backend:
+        """Reserve an in-flight slot on ``backend`` (or the best one)"""
+        backend = backend or self.choose(affinity_key)
+        backend.in_flight += 1
+        return backend
+
+    def release(self, backend: Backend) -> None:
+        backend.in_flight = max(0, backend.in_flight - 1)
+
+    @contextmanager
+    def lease(
+        self, backend: Optional[Backend] = None, affinity_key: Optional[str] = None
+    ) -> Iterator[Backend]:
+        """Hold an in-flight slot for the duration of a non-streaming call"""
+        backend = self.acquire(backend, affinity_key)
+        try:
+            yield backend
+        finally:
+            self.release(backend)
+
+    def report_success(self, backend: Backend) -> None:
+        backend.consecutive_failures = 0
+        backend.healthy = True
+
+    def report_failure(self, backend: Backend) -> None:
+        backend.consecutive_failures += 1
+        if backend.consecutive_failures >= self.unhealthy_threshold:
+            backend.healthy = False
+
+    async def check_health(self, client: httpx.AsyncClient) -> None:
+        """Probe every backend once and update its health state"""
+
+        async def probe(backend: Backend):
+            try:
+                response = await client.get(
+                    f"{backend.url}{settings.backend_health_check_path}",
+                    timeout=settings.backend_health_check_timeout,
+                )
+                response.raise_for_status()
+            except httpx.HTTPError:
+                self.report_failure(backend)
+            else:
+                self.report_success(backend)
+
+        await asyncio.gather(*(probe(b) for b in self.backends))
+
+    async def run_health_checks(self, client: httpx.AsyncClient) -> None:
+        while True:
+            await self.check_health(client)
+            await asyncio.sleep(settings.backend_health_check_interval)
+
+
+async def post_to_backend(
+    client: httpx.AsyncClient,
+    pool: BackendPool,
+    backend: Backend,
+    path: str,
+    payload: dict,
+) -> httpx.Response:
+    """POST to a backend, feeding connection failures into its health state"""
+    try:
+        response = await client.post(f"{backend.url}{path}", json=payload)
+    except httpx.RequestError:
+        pool.report_failure(backend)
+        raise
+    response.raise_for_status()
+    return response
+
+
+backend_pool = BackendPool.from_settings()
+_health_task: Optional[asyncio.Task] = None
+
+
+def get_backend_pool() -> BackendPool:
+    """Dependency returning the application-wide backend pool"""
+    return backend_pool
+
+
+def start_health_checks(client: httpx.AsyncClient) -> None:
+    """Start probing backends in the background (called from the lifespan hook)"""
+    global _health_task
+    if settings.backend_health_check_interval > 0 and _health_task is None:
+        _health_task = asyncio.create_task(backend_pool.run_health_checks(client))
+
+
+async def stop_health_checks() -> None:
+    global _health_task
+    if _health_task is not None:
+        _health_task.cancel()
+        try:
+            await _health_task
+        except asyncio.CancelledError:
+            pass
+        _health_task = None
@@ -0,0 +1,165 @@
+# app/services/model_catalog.py
+"""
+In-memory catalog of the models served by the vLLM backends.
+
+The model list is refreshed in the background and merged across every
+backend, so ``/v1/models`` never waits on vLLM. When vLLM is unreachable the
+last good list keeps being served, and the hard-coded fallback is only used
+until the first successful refresh.
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import httpx
+
+from app.config import settings
+from app.services.backends import BackendPool, backend_pool
+
+# Returned when no backend has ever answered, matching vLLM's format
+FALLBACK_MODELS = {
+    "object": "list",
+    "data": [
+        {
+            "id": "mistralai/Devstral-2-123B-Instruct-2512",
+            "object": "model",
+            "created": 1765900623,
+            "owned_by": "vllm",
+            "root": "mistralai/Devstral-2-123B-Instruct-2512",
+            "parent": None,
+            "max_model_len": 262144,
+            "permission": [
+                {
+                    "id": "modelperm-a0229203fcd27c57",
+                    "object": "model_permission",
+                    "created": 1765900623,
+                    "allow_create_engine": False,
+                    "allow_sampling": True,
+                    "allow_logprobs": True,
+                    "allow_search_indices": False,
+                    "allow_view": True,
+                    "allow_fine_tuning": False,
+                    "organization": "*",
+                    "group": None,
+                    "is_blocking": False,
+                }
+            ],
+        }
+    ],
+}
+
+
+def _etag(payload: dict) -> str:
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return '"' + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _model_ids(models: Sequence[Any]) -> Set[str]:
+    return {m["id"] for m in models if isinstance(m.get("id"), str)}
+
+
+class ModelCatalog:
+    """Cached, merged ``/v1/models`` listing with an ETag"""
+
+    def __init__(self) -> None:
+        self._payload: Optional[dict] = None
+        self._etag: Optional[str] = None
+        self._max_model_len: Dict[str, int] = {}
+        self._model_ids: Set[str] = _model_ids(FALLBACK_MODELS["data"])
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._payload is not None
+
+    def snapshot(self) -> Tuple[dict, str]:
+        """Current model list and its ETag (the fallback list if never loaded)"""
+        if self._payload is None:
+            return FALLBACK_MODELS, _etag(FALLBACK_MODELS)
+        return self._payload, self._etag or _etag(self._payload)
+
+    def serves(self, model: str) -> bool:
+        """Whether ``model`` is in the current list (or the fallback list)"""
+        return model in self._model_ids
+
+    def max_model_len(self, model: str) -> Optional[int]:
+        """Context length reported by vLLM for ``model``, if known"""
+        return self._max_model_len.get(model)
+
+    def update(self, models: List[dict]) -> None:
+        payload = {"object": "list", "data": models}
+        self._payload = payload
+        self._etag = _etag(payload)
+        self._model_ids = _model_ids(models)
+        self._max_model_len = {
+            m["id"]: m["max_model_len"]
+            for m in models
+            if "id" in m and isinstance(m.get("max_model_len"), int)
+        }
+
+    async def refresh(self, client: httpx.AsyncClient, pool: BackendPool) -> bool:
+        """
+        Fetch and merge the model lists of all backends. Returns False, keeping
+        the previous list, if no backend answered.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+
+            async def fetch(url: str) -> Optional[List[dict]]:
+                try:
+                    # Bounded by the client's upstream_*_timeout settings
+                    response = await client.get(f"{url}/v1/models")
+                    response.raise_for_status()
+                    return response.json().get("data", [])
+                except (httpx.HTTPError, ValueError):
+                    return None
+
+            results = await asyncio.gather(*(fetch(b.url) for b in pool.backends))
+            if all(r is None for r in results):
+                return False
+
+            merged: Dict[str, dict] = {}
+            for models in results:
+                for model in models or []:
+                    if isinstance(model, dict) and "id" in model:
+                        merged.setdefault(model["id"], model)
+
+            self.update(sorted(merged.values(), key=lambda m: m["id"]))
+            return True
+
+    async def run_refresh(self, client: httpx.AsyncClient, pool: BackendPool) -> None:
+        while True:
+            await self.refresh(client, pool)
+            await asyncio.sleep(settings.models_refresh_interval)
+
+
+model_catalog = ModelCatalog()
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def get_model_catalog() -> ModelCatalog:
+    """Dependency returning the application-wide model catalog"""
+    return model_catalog
+
+
+def start_model_refresh(client: httpx.AsyncClient) -> None:
+    """Refresh the catalog in the background (called from the lifespan hook)"""
+    global _refresh_task
+    if settings.models_refresh_interval > 0 and _refresh_task is None:
+        _refresh_task = asyncio.create_task(
+            model_catalog.run_refresh(client, backend_pool)
+        )
+
+
+async def stop_model_refresh() -> None:
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
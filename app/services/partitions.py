@@ -0,0 +1,171 @@
+# app/services/partitions.py
+"""
+Monthly range partitions of ``api_calls`` on PostgreSQL.
+
+Every billing query filters on a user and a ``timestamp`` range, and the
+table grows by one row per request. On PostgreSQL it is therefore created
+``PARTITION BY RANGE (timestamp)`` with one partition per calendar month,
+named ``api_calls_yYYYYmMM``. Queries over a range only scan the months they
+touch, and old history is removed by detaching and dropping a partition,
+which is a catalog change rather than a bulk ``DELETE``.
+
+A background task keeps ``api_calls_partitions_ahead`` future months
+created and, when ``api_calls_retention_months`` is set, detaches and drops
+partitions older than that. Other databases keep a plain table and all of
+this is a no-op.
+"""
+
+import asyncio
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.config import settings
+
+PARENT_TABLE = "api_calls"
+
+_maintenance_task: Optional[asyncio.Task] = None
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_y{month.year}m{month.month:02d}"
+
+
+def partition_ddl(month: date) -> str:
+    """CREATE statement for the partition holding ``month``"""
+    month = month_start(month)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} "
+        f"PARTITION OF {PARENT_TABLE} FOR VALUES "
+        f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def is_partitioned(conn: Connection) -> bool:
+    """Whether ``api_calls`` is a partitioned table on this connection"""
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(
+        conn.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table p "
+                "JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+            ),
+            {"table": PARENT_TABLE},
+        ).first()
+    )
+
+
+def list_partitions(conn: Connection) -> List[str]:
+    """Names of the monthly partitions currently attached, oldest first"""
+    rows = conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = :table AND pg_table_is_visible(parent.oid)"
+        ),
+        {"table": PARENT_TABLE},
+    )
+    return sorted(row[0] for row in rows)
+
+
+def ensure_partitions(
+    conn: Connection, today: Optional[date] = None, months_ahead: Optional[int] = None
+) -> List[str]:
+    """Create the partitions for this month and the next ``months_ahead``"""
+    if months_ahead is None:
+        months_ahead = settings.api_calls_partitions_ahead
+    current = month_start(today or datetime.utcnow().date())
+    existing = set(list_partitions(conn))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if partition_name(month) not in existing:
+            conn.execute(text(partition_ddl(month)))
+            created.append(partition_name(month))
+    return created
+
+
+def detach_partition(conn: Connection, month: date, drop: bool = True) -> None:
+    """Detach a month from ``api_calls``, and drop its table unless told not to"""
+    name = partition_name(month_start(month))
+    conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+    if drop:
+        conn.execute(text(f"DROP TABLE {name}"))
+
+
+def drop_partitions_before(conn: Connection, cutoff: date) -> List[str]:
+    """Detach and drop every partition entirely before ``cutoff``'s month"""
+    limit = partition_name(month_start(cutoff))
+    dropped = []
+    for name in list_partitions(conn):
+        # Names sort chronologically (api_calls_yYYYYmMM)
+        if name < limit:
+            conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
+
+
+def maintain_partitions(engine: Engine, today: Optional[date] = None) -> List[str]:
+    """
+    Create upcoming partitions and apply the retention policy. Returns the
+    partitions created or dropped; a no-op unless ``api_calls`` is partitioned.
+    """
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        today = today or datetime.utcnow().date()
+        changed = ensure_partitions(conn, today)
+        if settings.api_calls_retention_months > 0:
+            cutoff = add_months(
+                month_start(today), -settings.api_calls_retention_months
+            )
+            changed += drop_partitions_before(conn, cutoff)
+        return changed
+
+
+async def _run_maintenance(engine: Engine) -> None:
+    while True:
+        try:
+            changed = await asyncio.to_thread(maintain_partitions, engine)
+            if changed:
+                print(f"api_calls partitions changed: {', '.join(changed)}")
+        except Exception as e:
+            print(f"api_calls partition maintenance failed: {e}")
+        await asyncio.sleep(settings.api_calls_partition_check_interval)
+
+
+def start_partition_maintenance(engine: Engine) -> None:
+    """Maintain partitions in the background (called from the lifespan hook)"""
+    global _maintenance_task
+    if (
+        engine.dialect.name == "postgresql"
+        and settings.api_calls_partition_check_interval > 0
+        and _maintenance_task is None
+    ):
+        _maintenance_task = asyncio.create_task(_run_maintenance(engine))
+
+
+async def stop_partition_maintenance() -> None:
+    global _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        try:
+            await _maintenance_task
+        except asyncio.CancelledError:
+            pass
+        _maintenance_task = None
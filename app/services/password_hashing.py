@@ -0,0 +1,93 @@
+# app/services/password_hashing.py
+"""
+bcrypt hashing off the event loop and off the shared threadpool.
+
+bcrypt is deliberately slow, so hashing inline lets a burst of logins or
+registrations occupy the threadpool that every other sync endpoint relies on.
+Hashes run in a small dedicated process pool instead and are awaited
+asynchronously. The number of hashes waiting for a worker is bounded; beyond
+that, requests get a fast 429 with ``Retry-After`` rather than queueing
+behind a login storm.
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.utils.security import get_password_hash, verify_password
+
+
+def _worker_context():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded pool, shedding load once the queue is full"""
+
+    def __init__(self, workers: int, queue_size: int, retry_after: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self.rejected_total = 0
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Hashes running or waiting for a worker"""
+        return self._pending
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self._executor is None and self.workers > 0:
+            # Forking the server would copy its event loop, open sockets and
+            # pooled connections into each worker; forkserver (spawn where it
+            # is unavailable) starts workers from a clean process instead
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=_worker_context()
+            )
+        return self._executor
+
+    async def _run(self, fn: Callable, *args):
+        if self._pending >= max(self.workers, 1) + self.queue_size:
+            self.rejected_total += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many authentication requests, retry shortly",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password, settings.bcrypt_rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    queue_size=settings.password_hash_queue_size,
+    retry_after=settings.password_hash_retry_after,
+)
+
+
+def get_password_hasher() -> PasswordHasher:
+    """Dependency returning the application-wide password hasher"""
+    return password_hasher
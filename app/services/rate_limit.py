@@ -0,0 +1,124 @@
+# app/services/rate_limit.py
+"""
+Per-user and per-key requests-per-minute and tokens-per-minute limits.
+
+Limits are enforced in memory with GCRA (the generic cell rate algorithm),
+which is equivalent to a sliding-window limiter but keeps a single float per
+bucket: the theoretical arrival time (TAT) of the next request. A check is a
+couple of dictionary lookups and some arithmetic, so it is cheap enough to
+run on every proxied call. Responses carry OpenAI-style ``x-ratelimit-*``
+headers; rejected requests get a 429 with ``Retry-After``.
+
+Limits come from the user's ``rpm_limit``/``tpm_limit`` columns, falling back
+to the defaults in ``Settings``; a limit of 0 disables it. Each worker
+process enforces its own counters.
+"""
+
+import math
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.config import settings
+
+REQUESTS = "requests"
+TOKENS = "tokens"
+
+
+def _duration(seconds: float) -> str:
+    """Format a reset time the way OpenAI does (e.g. ``1.5s``, ``6m0s``)"""
+    if seconds < 60:
+        return f"{round(seconds, 3):g}s"
+    minutes, seconds = divmod(int(math.ceil(seconds)), 60)
+    return f"{minutes}m{seconds}s"
+
+
+class RateLimiter:
+    """GCRA buckets keyed by user or API key, refilling over ``period`` seconds"""
+
+    def __init__(self, period: float = 60.0):
+        self.period = period
+        self.rejected_total = 0
+        self._tat: Dict[str, float] = {}
+        self._next_sweep = 0.0
+
+    def _sweep(self, now: float) -> None:
+        """Forget buckets that have fully refilled (same as never seen)"""
+        self._tat = {key: tat for key, tat in self._tat.items() if tat > now}
+        self._next_sweep = now + self.period
+
+    def check(
+        self, principal, tokens: int, key_id: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Count one request of ``tokens`` tokens against the user's (and, when
+        ``key_id`` is given, the key's) limits. Returns the rate limit headers
+        for the response, or raises a 429 without consuming anything if any
+        limit would be exceeded.
+        """
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        rpm, tpm = principal.rpm_limit, principal.tpm_limit
+        if rpm is None:
+            rpm = settings.rate_limit_rpm
+        if tpm is None:
+            tpm = settings.rate_limit_tpm
+        key_rpm = settings.rate_limit_key_rpm if key_id else 0
+        key_tpm = settings.rate_limit_key_tpm if key_id else 0
+        buckets = (
+            (REQUESTS, f"u{principal.id}:r", rpm, 1),
+            (TOKENS, f"u{principal.id}:t", tpm, tokens),
+            (REQUESTS, f"k{key_id}:r", key_rpm, 1),
+            (TOKENS, f"k{key_id}:t", key_tpm, tokens),
+        )
+
+        # Per kind, the (remaining, limit, reset) of the tightest bucket
+        tightest: Dict[str, Tuple[int, int, float]] = {}
+        admitted = []
+        retry_after = 0.0
+        for kind, key, limit, cost in buckets:
+            if limit <= 0:
+                continue
+            interval = self.period / limit
+            tat = max(self._tat.get(key, now), now)
+            new_tat = tat + cost * interval
+            if new_tat - now > self.period:
+                retry_after = max(retry_after, new_tat - now - self.period)
+                new_tat = tat
+            else:
+                admitted.append((key, new_tat))
+            # Small epsilon so float error does not round a whole unit away
+            remaining = int((self.period - (new_tat - now)) / interval + 1e-9)
+            if kind not in tightest or remaining < tightest[kind][0]:
+                tightest[kind] = (remaining, limit, new_tat - now)
+
+        headers = {}
+        for kind, (remaining, limit, reset) in tightest.items():
+            headers[f"x-ratelimit-limit-{kind}"] = str(limit)
+            headers[f"x-ratelimit-remaining-{kind}"] = str(max(remaining, 0))
+            headers[f"x-ratelimit-reset-{kind}"] = _duration(reset)
+
+        if retry_after > 0:
+            self.rejected_total += 1
+            headers["Retry-After"] = str(math.ceil(retry_after))
+            raise HTTPException(
+                status_code=429, detail="Rate limit exceeded", headers=headers
+            )
+
+        for key, new_tat in admitted:
+            self._tat[key] = new_tat
+        return headers
+
+    def clear(self) -> None:
+        self._tat.clear()
+
+
+rate_limiter = RateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Dependency returning the application-wide rate limiter"""
+    return rate_limiter
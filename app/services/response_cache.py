@@ -0,0 +1,72 @@
+# app/services/response_cache.py
+"""
+Exact-match cache for deterministic completions.
+
+Requests with ``temperature: 0`` that are byte-for-byte the same once
+canonicalised (model, prompt or messages, and sampling parameters) return the
+same completion, so their responses can be served without touching vLLM.
+Entries live in a size-bounded LRU and expire after a TTL.
+"""
+
+import hashlib
+import json
+from typing import Optional, Tuple
+
+from fastapi import Request
+
+from app.config import settings
+from app.utils.cache import TTLCache
+
+CACHE_HEADER = "X-Cache"
+
+# Request fields that do not change the generated completion
+_IGNORED_FIELDS = ("stream", "user")
+
+
+class ResponseCache(TTLCache):
+    """Size-bounded LRU mapping request keys to responses, with a TTL"""
+
+
+def cache_key(endpoint: str, body: dict) -> Optional[str]:
+    """
+    Canonical key for a request, or None if the request is not cacheable
+    (streamed, or sampled with a non-zero temperature).
+    """
+    if body.get("stream") or body.get("temperature") != 0:
+        return None
+
+    canonical = {k: v for k, v in body.items() if k not in _IGNORED_FIELDS}
+    payload = json.dumps(
+        [endpoint, canonical], sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_bypassed(request: Request) -> bool:
+    """Clients opt out of the cache with ``Cache-Control: no-cache``/``no-store``"""
+    cache_control = request.headers.get("cache-control", "").lower()
+    return "no-cache" in cache_control or "no-store" in cache_control
+
+
+def billable_usage(prompt_tokens: int, completion_tokens: int) -> Tuple[int, int]:
+    """
+    Prompt and completion tokens charged for a cache hit under the configured
+    accounting policy
+    """
+    policy = settings.response_cache_accounting
+    if policy == "none":
+        return 0, 0
+    if policy == "prompt":
+        return prompt_tokens, 0
+    return prompt_tokens, completion_tokens
+
+
+response_cache = ResponseCache(
+    max_entries=settings.response_cache_max_entries,
+    ttl=settings.response_cache_ttl,
+)
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Dependency returning the response cache, or None when it is disabled"""
+    return response_cache if settings.response_cache_enabled else None
@@ -0,0 +1,205 @@
+# app/services/rollups.py
+"""
+Hourly and daily usage rollups for the billing endpoints.
+
+Billing used to aggregate raw ``api_calls`` rows with ``GROUP BY
+date(timestamp)`` on every request, which reads every call in the period
+and cannot use the timestamp index. Instead, ``usage_hourly`` and
+``usage_daily`` hold one row per (user, model, bucket) with the call count,
+token and cost totals, and the usage writer adds each batch to them with
+an upsert in the same transaction that inserts the calls. The rollups are
+therefore exactly as current as ``api_calls``, and billing reads at most
+one row per model per bucket however long the history grows.
+
+The only raw rows billing still reads are the calls inside the first and
+last hourly bucket of a period, to report the exact time of its first and
+last call.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models.user import ApiCall, UsageDaily, UsageHourly
+
+# ApiCall columns summed into the rollup columns of the same name
+COUNTERS = ("tokens_used", "prompt_tokens", "completion_tokens", "estimated_cost")
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_INSERTS: Dict[str, Any] = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def hour_bucket(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(timestamp: datetime) -> date:
+    return timestamp.date()
+
+
+ROLLUPS = ((UsageHourly, hour_bucket), (UsageDaily, day_bucket))
+
+
+def aggregate(rows: List[dict], bucket_of) -> List[dict]:
+    """Sum ``api_calls`` rows into one rollup row per (user, model, bucket)"""
+    totals: Dict[Tuple, dict] = {}
+    for row in rows:
+        key = (row["user_id"], row.get("model") or "", bucket_of(row["timestamp"]))
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = {
+                "user_id": key[0],
+                "model": key[1],
+                "bucket": key[2],
+                "call_count": 0,
+                **{name: 0 for name in COUNTERS},
+            }
+        total["call_count"] += 1
+        for name in COUNTERS:
+            total[name] += row.get(name) or 0
+    return list(totals.values())
+
+
+def _upsert(db: Session, table, rows: List[dict]) -> None:
+    counters = ("call_count",) + COUNTERS
+    insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.user_id, table.bucket, table.model],
+            set_={
+                name: getattr(table, name) + getattr(stmt.excluded, name)
+                for name in counters
+            },
+        )
+        db.execute(stmt, rows)
+        return
+
+    # No portable upsert: add to existing rows, insert the rest
+    for row in rows:
+        updated = db.execute(
+            update(table)
+            .where(
+                table.user_id == row["user_id"],
+                table.bucket == row["bucket"],
+                table.model == row["model"],
+            )
+            .values({name: getattr(table, name) + row[name] for name in counters})
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            db.add(table(**row))
+    db.flush()
+
+
+def apply_rollups(db: Session, rows: List[dict]) -> None:
+    """Add inserted ``api_calls`` rows to the rollups (caller commits)"""
+    if not rows:
+        return
+    for table, bucket_of in ROLLUPS:
+        _upsert(db, table, aggregate(rows, bucket_of))
+
+
+def rebuild_rollups(db: Session, chunk_size: int = 10000) -> int:
+    """
+    Recompute both rollups from ``api_calls``, e.g. after introducing them on
+    an existing database. Run it while nothing writes usage. Returns the
+    number of calls read.
+    """
+    db.query(UsageHourly).delete(synchronize_session=False)
+    db.query(UsageDaily).delete(synchronize_session=False)
+    columns: List[Any] = [ApiCall.user_id, ApiCall.model, ApiCall.timestamp] + [
+        getattr(ApiCall, name) for name in COUNTERS
+    ]
+    result = db.execute(
+        select(*columns).where(ApiCall.user_id.is_not(None)),
+        execution_options={"yield_per": chunk_size},
+    )
+    calls = 0
+    for partition in result.mappings().partitions():
+        rows = [dict(row) for row in partition if row["timestamp"] is not None]
+        apply_rollups(db, rows)
+        calls += len(rows)
+    return calls
+
+
+def daily_totals(db: Session, user_id: int, start: date, end: date):
+    """Per-day totals of a user over ``[start, end)``, summed across models"""
+    return (
+        db.query(
+            UsageDaily.bucket.label("date"),
+            func.sum(UsageDaily.call_count).label("call_count"),
+            func.sum(UsageDaily.tokens_used).label("tokens_used"),
+            func.sum(UsageDaily.estimated_cost).label("estimated_cost"),
+        )
+        .filter(
+            UsageDaily.user_id == user_id,
+            UsageDaily.bucket >= start,
+            UsageDaily.bucket < end,
+        )
+        .group_by(UsageDaily.bucket)
+        .order_by(UsageDaily.bucket)
+        .all()
+    )
+
+
+def model_totals(db: Session, user_id: int, start: date, end: date):
+    """Per-model totals of a user over ``[start, end)``"""
+    return (
+        db.query(
+            UsageDaily.model,
+            func.sum(UsageDaily.call_count).label("call_count"),
+            func.sum(UsageDaily.prompt_tokens).label("prompt_tokens"),
+            func.sum(UsageDaily.completion_tokens).label("completion_tokens"),
+            func.sum(UsageDaily.tokens_used).label("tokens_used"),
+            func.sum(UsageDaily.estimated_cost).label("estimated_cost"),
+        )
+        .filter(
+            UsageDaily.user_id == user_id,
+            UsageDaily.bucket >= start,
+            UsageDaily.bucket < end,
+        )
+        .group_by(UsageDaily.model)
+        .order_by(UsageDaily.model)
+        .all()
+    )
+
+
+def call_bounds(
+    db: Session, user_id: int, start: datetime, end: datetime
+) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    Times of a user's first and last call in ``[start, end)``. The hourly
+    rollup finds the first and last hour with calls, so only the raw rows
+    of those two hours are read.
+    """
+    hours = (
+        db.query(func.min(UsageHourly.bucket), func.max(UsageHourly.bucket))
+        .filter(
+            UsageHourly.user_id == user_id,
+            UsageHourly.bucket >= hour_bucket(start),
+            UsageHourly.bucket < end,
+        )
+        .one()
+    )
+    if hours[0] is None:
+        return None, None
+
+    def bound(aggregate, hour: datetime):
+        return (
+            db.query(aggregate(ApiCall.timestamp))
+            .filter(
+                ApiCall.user_id == user_id,
+                ApiCall.timestamp >= max(hour, start),
+                ApiCall.timestamp < min(hour + timedelta(hours=1), end),
+            )
+            .scalar()
+        )
+
+    return bound(func.min, hours[0]), bound(func.max, hours[1])
@@ -0,0 +1,51 @@
+# app/services/single_flight.py
+"""
+Single-flight coalescing of identical in-flight upstream requests.
+
+While a request for a given key is being served by vLLM, other callers with
+the same key await that one upstream call instead of issuing their own. Each
+caller still gets its own response and does its own accounting.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key"""
+
+    def __init__(self):
+        self._calls: Dict[str, "asyncio.Task[Any]"] = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run ``fn`` once per key at a time and share its result (or exception)
+        with every concurrent caller. The upstream call runs in its own task,
+        so a caller disconnecting does not cancel it for the others.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: "asyncio.Task[Any]") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved even if every caller went away
+        if not task.cancelled():
+            task.exception()
+
+
+single_flight = SingleFlight()
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Dependency returning the coalescer, or None when it is disabled"""
+    return single_flight if settings.single_flight_enabled else None
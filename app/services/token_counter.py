@@ -0,0 +1,212 @@
+# app/services/token_counter.py
+"""
+Token counting for quotas and usage accounting.
+
+Counts use the served model's own tokenizer when one is available locally
+(``tokenizer_dir/<model>/tokenizer.json``, or the Hugging Face Hub when
+``tokenizer_download`` is set). Tokenizers need the optional ``tokenizers``
+package; without it, or for unknown models, a character-based estimate is
+used, which unlike word counts does not undercount code.
+
+The model name comes from the client, so tokenizers are only loaded for
+models in the model catalog, at most ``tokenizer_max_loaded`` are kept (least
+recently used first out), and loading runs in a worker thread since it reads
+files or downloads from the Hub.
+
+Counts of message prefixes are memoised in an LRU, so each turn of a growing
+conversation only tokenizes the new messages. Large uncached inputs are
+tokenized in a worker thread to keep the event loop responsive.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.config import settings
+from app.services.model_catalog import model_catalog
+from app.utils.cache import TTLCache
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # pragma: no cover - optional dependency
+    Tokenizer = None
+
+# Cached for models whose tokenizer could not be loaded, so it isn't retried
+_UNAVAILABLE = object()
+
+
+def estimate_tokens(text: str) -> int:
+    """Fallback estimate: roughly four characters per token, at least one per word"""
+    return max(len(text.split()), -(-len(text) // 4))
+
+
+def message_text(message: Any) -> str:
+    """Text content of a chat message (plain string or list of content parts)"""
+    if not isinstance(message, dict):
+        return ""
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(
+            part.get("text", "")
+            for part in content
+            if isinstance(part, dict) and isinstance(part.get("text"), str)
+        )
+    return ""
+
+
+class TokenCounter:
+    """Counts tokens per model, memoising the counts of message prefixes"""
+
+    def __init__(
+        self,
+        tokenizer_dir: Optional[str],
+        download: bool,
+        cache_max_entries: int,
+        cache_ttl: float,
+        offload_chars: int,
+        max_loaded: int = 8,
+        is_served: Optional[Callable[[str], bool]] = None,
+    ):
+        self.tokenizer_dir = tokenizer_dir
+        self.download = download
+        self.offload_chars = offload_chars
+        self.is_served = is_served
+        self._registered: Dict[str, Any] = {}
+        self._tokenizers = TTLCache(max_entries=max_loaded, ttl=float("inf"))
+        self._loading: Dict[str, "asyncio.Task[Any]"] = {}
+        self._counts = TTLCache(max_entries=cache_max_entries, ttl=cache_ttl)
+
+    def register(self, model: str, tokenizer: Any) -> None:
+        """
+        Use ``tokenizer`` for ``model``. Anything with
+        ``encode(text, add_special_tokens=False)`` returning a list of ids (or
+        an object with ``.ids``) works; None forces the fallback estimate.
+        """
+        self._registered[model] = tokenizer
+
+    def _load(self, model: str) -> Any:
+        if Tokenizer is None:
+            return None
+        try:
+            if self.tokenizer_dir:
+                path = os.path.join(self.tokenizer_dir, model, "tokenizer.json")
+                if os.path.isfile(path):
+                    return Tokenizer.from_file(path)
+            if self.download:
+                return Tokenizer.from_pretrained(model)
+        except Exception as e:
+            print(f"Could not load tokenizer for {model}: {e}")
+        return None
+
+    def tokenizer(self, model: Optional[str]) -> Any:
+        """
+        The tokenizer for ``model`` if it is registered or already loaded,
+        else None. Never loads one: see ``load_tokenizer``.
+        """
+        if not model:
+            return None
+        if model in self._registered:
+            return self._registered[model]
+        tokenizer = self._tokenizers.get(model)
+        return None if tokenizer is _UNAVAILABLE else tokenizer
+
+    async def load_tokenizer(self, model: Optional[str]) -> Any:
+        """
+        The tokenizer for ``model``, loading it in a worker thread on first use
+        if the model is in the catalog. Concurrent first uses share one load.
+        """
+        if not model or model in self._registered:
+            return self.tokenizer(model)
+        tokenizer = self._tokenizers.get(model)
+        if tokenizer is not None:
+            return None if tokenizer is _UNAVAILABLE else tokenizer
+        if self.is_served is not None and not self.is_served(model):
+            return None
+
+        task = self._loading.get(model)
+        if task is None:
+            task = asyncio.ensure_future(asyncio.to_thread(self._load, model))
+            self._loading[model] = task
+            task.add_done_callback(lambda t: self._loading.pop(model, None))
+        tokenizer = await asyncio.shield(task)
+        self._tokenizers.set(model, _UNAVAILABLE if tokenizer is None else tokenizer)
+        return tokenizer
+
+    def _tokenize(self, model: Optional[str], texts: Sequence[str]) -> List[int]:
+        tokenizer = self.tokenizer(model)
+        if tokenizer is None:
+            return [estimate_tokens(text) for text in texts]
+        counts = []
+        for text in texts:
+            encoded = tokenizer.encode(text, add_special_tokens=False)
+            counts.append(len(getattr(encoded, "ids", encoded)))
+        return counts
+
+    async def _tokenize_async(
+        self, model: Optional[str], texts: Sequence[str]
+    ) -> List[int]:
+        await self.load_tokenizer(model)
+        if sum(len(text) for text in texts) >= self.offload_chars:
+            return await asyncio.to_thread(self._tokenize, model, texts)
+        return self._tokenize(model, texts)
+
+    def count(self, model: Optional[str], text: str) -> int:
+        """
+        Tokens in ``text``, tokenized inline (for short texts) with the
+        tokenizer the request's prompt was counted with
+        """
+        return self._tokenize(model, [text])[0]
+
+    async def count_text(self, model: Optional[str], text: str) -> int:
+        """Tokens in a prompt, memoised by content"""
+        key = hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+        count = self._counts.get(key)
+        if count is None:
+            count = (await self._tokenize_async(model, [text]))[0]
+            self._counts.set(key, count)
+        return count
+
+    async def count_messages(self, model: Optional[str], messages: Sequence) -> int:
+        """
+        Tokens in the contents of a list of chat messages. Counts are
+        memoised per prefix of the conversation, so only messages after the
+        longest known prefix are tokenized.
+        """
+        digest = hashlib.sha256(f"{model}\0".encode("utf-8"))
+        keys = []
+        for message in messages:
+            digest.update(json.dumps(message, sort_keys=True, default=str).encode())
+            keys.append(digest.hexdigest())
+
+        known, total = 0, 0
+        for i in range(len(keys), 0, -1):
+            cached = self._counts.get(keys[i - 1])
+            if cached is not None:
+                known, total = i, cached
+                break
+
+        texts = [message_text(message) for message in messages[known:]]
+        for i, count in enumerate(await self._tokenize_async(model, texts), known):
+            total += count
+            self._counts.set(keys[i], total)
+        return total
+
+
+token_counter = TokenCounter(
+    tokenizer_dir=settings.tokenizer_dir,
+    download=settings.tokenizer_download,
+    cache_max_entries=settings.token_count_cache_max_entries,
+    cache_ttl=settings.token_count_cache_ttl,
+    offload_chars=settings.tokenize_offload_chars,
+    max_loaded=settings.tokenizer_max_loaded,
+    is_served=model_catalog.serves,
+)
+
+
+def get_token_counter() -> TokenCounter:
+    """Dependency returning the application-wide token counter"""
+    return token_counter
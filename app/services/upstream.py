@@ -0,0 +1,70 @@
+# app/services/upstream.py
+"""
+Shared HTTP client used to proxy requests to vLLM.
+
+A single pooled ``httpx.AsyncClient`` is created when the application starts
+and closed when it shuts down, so every router reuses keep-alive connections
+to the upstream instead of opening a new socket per request.
+"""
+
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException
+
+from app.config import settings
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def create_upstream_client() -> httpx.AsyncClient:
+    """Build a pooled client from the upstream settings"""
+    limits = httpx.Limits(
+        max_connections=settings.upstream_max_connections,
+        max_keepalive_connections=settings.upstream_max_keepalive_connections,
+        keepalive_expiry=settings.upstream_keepalive_expiry,
+    )
+    timeout = httpx.Timeout(
+        connect=settings.upstream_connect_timeout,
+        read=settings.upstream_read_timeout,
+        write=settings.upstream_write_timeout,
+        pool=settings.upstream_pool_timeout,
+    )
+    return httpx.AsyncClient(
+        limits=limits, timeout=timeout, http2=settings.upstream_http2
+    )
+
+
+async def startup_upstream_client() -> httpx.AsyncClient:
+    """Create the application-wide client (called from the lifespan hook)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_upstream_client()
+    return _client
+
+
+async def shutdown_upstream_client() -> None:
+    """Close the application-wide client and release its connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_upstream_client() -> httpx.AsyncClient:
+    """
+    Dependency returning the shared upstream client.
+
+    The client is normally created by the lifespan hook; it is created lazily
+    here as well so the routers keep working when the app is driven without
+    running its lifespan (e.g. a bare ``TestClient``).
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_upstream_client()
+    return _client
+
+
+def upstream_error(exc: httpx.HTTPError) -> HTTPException:
+    """Map a transport or upstream status failure to the gateway's 502 response"""
+    return HTTPException(status_code=502, detail=f"vLLM service error: {str(exc)}")
@@ -0,0 +1,109 @@
+# app/services/usage.py
+"""
+Reserving and recording token usage against a user's quota.
+
+Every proxied request has a single accounting pipeline: the router attaches a
+``UsageRecord`` to the request and fills it in from vLLM's ``usage`` (falling
+back to the token estimator only for missing fields), and once the response
+is complete the API call tracker hands it to the usage writer, which writes
+the ``ApiCall`` row and the user's running total in batches.
+
+Quota is enforced with a reserve/settle model. Before proxying, the prompt
+tokens plus ``max_tokens`` are reserved with one conditional ``UPDATE`` that
+only succeeds while the total stays within ``token_limit``, so concurrent
+requests cannot overshoot the limit and no row lock is held across the call.
+Settlement replaces the reservation with the real usage, releasing the rest.
+"""
+
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.user import User
+
+
+async def reserve_tokens(db: AsyncSession, principal, tokens: int) -> int:
+    """
+    Atomically reserve ``tokens`` of the user's quota, raising a 429 if that
+    would exceed their limit. Returns the amount reserved, which the usage
+    writer later settles against the real usage.
+    """
+    tokens = max(int(tokens), 0)
+    result = await db.execute(
+        update(User)
+        .where(
+            User.id == principal.id,
+            User.tokens_used + tokens <= User.token_limit,
+        )
+        .values(tokens_used=User.tokens_used + tokens)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if not result.rowcount:
+        raise HTTPException(status_code=429, detail="Request would exceed token limit")
+    principal.tokens_used += tokens
+    return tokens
+
+
+def requested_max_tokens(body: dict) -> int:
+    """Completion tokens to reserve for a request"""
+    max_tokens = body.get("max_tokens")
+    if isinstance(max_tokens, int) and max_tokens > 0:
+        return max_tokens
+    return settings.quota_default_max_tokens
+
+
+# Key of the usage record in the ASGI scope's request state
+USAGE_STATE = "usage"
+
+
+class UsageRecord:
+    """Token usage of one proxied request, written by the API call tracker"""
+
+    __slots__ = (
+        "principal",
+        "model",
+        "prompt_tokens",
+        "completion_tokens",
+        "cached",
+        "reserved",
+    )
+
+    def __init__(self, principal, model: Optional[str] = None):
+        self.principal = principal
+        self.model = model
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached = False
+        self.reserved = 0  # quota held until the call is settled
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def track_usage(request: Request, principal, model: Optional[str]) -> UsageRecord:
+    """Attach a usage record to the request for the API call tracker to write"""
+    record = UsageRecord(principal, model)
+    setattr(request.state, USAGE_STATE, record)
+    return record
+
+
+def reported_usage(
+    result: dict, prompt_estimate: int, estimate_completion: Callable[[], int]
+) -> Tuple[int, int]:
+    """
+    Prompt and completion tokens from the ``usage`` vLLM reported, using the
+    estimates only for whichever count is missing
+    """
+    usage = result.get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    if prompt_tokens is None:
+        prompt_tokens = prompt_estimate
+    if completion_tokens is None:
+        completion_tokens = estimate_completion()
+    return int(prompt_tokens), int(completion_tokens)
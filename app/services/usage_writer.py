@@ -0,0 +1,298 @@
+# app/services/usage_writer.py
+"""
+Write-behind persistence of API calls and their token usage.
+
+The API call tracker no longer writes to the database while handling a
+request. Each finished call becomes a ``UsageEvent`` on a bounded in-memory
+queue, and a background task writes the queue in batches: every
+``flush_interval`` seconds or ``batch_size`` events, whichever comes first,
+all ``ApiCall`` rows are inserted with one statement, the users' token
+totals are settled with one aggregated ``UPDATE`` and the calls are added
+to the hourly and daily usage rollups, in a single transaction run off the
+event loop.
+
+The cached principal is settled as soon as the event is accepted, so quota
+checks see the usage before it reaches the database. While the writer is
+not running (before startup, after shutdown, or in tests without a
+lifespan) events are written immediately, one per transaction.
+
+When the queue is full, ``overflow`` decides what happens to a new event:
+
+* ``"block"`` waits for space, slowing the finishing request down;
+* ``"inline"`` writes the event immediately in its own transaction;
+* ``"drop"`` discards its API call record (counted in ``dropped_total``)
+  but keeps its usage: the delta is added to a per-user accumulator that
+  the next batch settles along with its own.
+
+A batch that fails is retried ``retries`` times, unless it broke a
+constraint (e.g. a row of a user deleted meanwhile), since that would fail
+again. Then its events are written one per transaction, so only the bad
+rows are lost; their usage is carried over to the next batch like a dropped
+event's.
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.dependencies.database import SessionLocal
+from app.models.user import ApiCall, User
+from app.services.auth_cache import api_key_cache, authenticate_api_key
+from app.services.rollups import apply_rollups
+
+OVERFLOW_POLICIES = ("block", "inline", "drop")
+
+
+class UsageEvent:
+    """One finished API call waiting to be written"""
+
+    __slots__ = ("values", "principal", "api_key", "delta")
+
+    def __init__(
+        self,
+        values: dict,
+        principal=None,
+        api_key: Optional[str] = None,
+        delta: int = 0,
+    ):
+        # ApiCall column values; user_id is resolved from ``api_key`` at
+        # write time when the call failed before it was authenticated
+        self.values = values
+        self.principal = principal
+        self.api_key = api_key
+        self.delta = delta  # change to users.tokens_used (usage - reservation)
+
+
+class UsageWriter:
+    """Batches usage events from a bounded queue into bulk database writes"""
+
+    def __init__(
+        self,
+        queue_size: int,
+        batch_size: int,
+        flush_interval: float,
+        overflow: str = "block",
+        retries: int = 2,
+        retry_delay: float = 0.5,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown usage queue overflow policy: {overflow}")
+        self.queue_size = queue_size
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.retries = max(retries, 0)
+        self.retry_delay = retry_delay
+        self.written_total = 0
+        self.dropped_total = 0
+        self.failed_total = 0
+        self._queue: Optional["asyncio.Queue[Optional[UsageEvent]]"] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        # Usage of events whose record was dropped, settled by the next write
+        self._carried: Dict[int, int] = {}
+        self._carried_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None and self.running else 0
+
+    @property
+    def carried_users(self) -> int:
+        """Users with usage waiting to be settled by the next write"""
+        return len(self._carried)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        queue: "asyncio.Queue[Optional[UsageEvent]]" = asyncio.Queue(
+            maxsize=self.queue_size
+        )
+        self._queue = queue
+        self._task = asyncio.create_task(self._run(queue))
+
+    async def stop(self) -> None:
+        """Write everything still queued and stop the background task"""
+        queue, task = self._queue, self._task
+        if queue is None or task is None or task.done():
+            return
+        # The sentinel sits behind every queued event, so they are all written
+        await queue.put(None)
+        await task
+        self._task = None
+        # Events that were blocked on a full queue land behind the sentinel
+        leftover = []
+        while not queue.empty():
+            event = queue.get_nowait()
+            if event is not None:
+                leftover.append(event)
+        if leftover or self._carried:
+            await asyncio.to_thread(self.write, leftover)
+
+    async def submit(self, event: UsageEvent) -> None:
+        """Queue an event for writing, applying the overflow policy if full"""
+        queue = self._queue
+        if queue is None or not self.running:
+            self._accept(event)
+            await asyncio.to_thread(self.write, [event])
+            return
+
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            if self.overflow == "drop":
+                self._accept(event)
+                self._carry_event(event)
+                self.dropped_total += 1
+                print("Usage queue full, dropped an API call record")
+                return
+            if self.overflow == "inline":
+                self._accept(event)
+                await asyncio.to_thread(self.write, [event])
+                return
+            await queue.put(event)
+        self._accept(event)
+
+    @staticmethod
+    def _accept(event: UsageEvent) -> None:
+        # Mirror the settlement on the cached principal straight away
+        if event.principal is not None and event.delta:
+            event.principal.tokens_used += event.delta
+
+    def _carry(self, deltas: Dict[int, int]) -> None:
+        """Add usage by user id to the accumulator the next write settles"""
+        with self._carried_lock:
+            for user_id, delta in deltas.items():
+                self._carried[user_id] = self._carried.get(user_id, 0) + delta
+
+    def _carry_event(self, event: UsageEvent) -> None:
+        user_id = event.values.get("user_id")
+        if user_id is not None and event.delta:
+            self._carry({user_id: event.delta})
+
+    async def _run(self, queue: "asyncio.Queue[Optional[UsageEvent]]") -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            event = await queue.get()
+            if event is None:
+                return
+            batch = [event]
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if event is None:
+                    stopping = True
+                    break
+                batch.append(event)
+
+            await asyncio.to_thread(self.write, batch)
+            if stopping:
+                return
+
+    def write(self, events: List[UsageEvent]) -> None:
+        """
+        Write the events and the carried-over usage in one transaction,
+        retrying, then falling back to one transaction per event
+        """
+        with self._carried_lock:
+            carried, self._carried = self._carried, {}
+
+        for attempt in range(self.retries + 1):
+            try:
+                self._write(events, carried)
+                return
+            except IntegrityError as e:
+                error: Exception = e
+                break
+            except Exception as e:
+                error = e
+                if attempt < self.retries:
+                    time.sleep(self.retry_delay * (attempt + 1))
+
+        print(f"Error writing {len(events)} API call records: {error}")
+        if carried:
+            try:
+                self._write([], carried)
+            except Exception:
+                self._carry(carried)
+        for event in events:
+            try:
+                self._write([event], {})
+            except Exception as e:
+                self.failed_total += 1
+                self._carry_event(event)
+                print(f"Error writing an API call record, dropped it: {e}")
+
+    def _write(self, events: List[UsageEvent], carried: Dict[int, int]) -> None:
+        """Insert the events' API calls and settle their usage in one transaction"""
+        db = SessionLocal()
+        try:
+            rows = []
+            deltas: Dict[int, int] = dict(carried)
+            for event in events:
+                user_id = event.values.get("user_id")
+                if user_id is None and event.api_key:
+                    principal = api_key_cache.get(event.api_key)
+                    if principal is None:
+                        principal = authenticate_api_key(event.api_key, db)
+                    if principal is not None:
+                        user_id = event.values["user_id"] = principal.id
+                if user_id is None:
+                    continue
+                # The call and its rollup buckets must agree on the time
+                event.values.setdefault("timestamp", datetime.utcnow())
+                rows.append(event.values)
+                if event.delta:
+                    deltas[user_id] = deltas.get(user_id, 0) + event.delta
+
+            if deltas:
+                db.execute(
+                    update(User)
+                    .where(User.id.in_(deltas))
+                    .values(
+                        tokens_used=User.tokens_used
+                        + case(deltas, value=User.id, else_=0)
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            if rows:
+                db.execute(insert(ApiCall), rows)
+                apply_rollups(db, rows)
+            db.commit()
+            self.written_total += len(rows)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+usage_writer = UsageWriter(
+    queue_size=settings.usage_queue_size,
+    batch_size=settings.usage_batch_size,
+    flush_interval=settings.usage_flush_interval,
+    overflow=settings.usage_queue_overflow,
+    retries=settings.usage_write_retries,
+    retry_delay=settings.usage_write_retry_delay,
+)
+
+
+def get_usage_writer() -> UsageWriter:
+    """Dependency returning the application-wide usage writer"""
+    return usage_writer
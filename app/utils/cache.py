@@ -0,0 +1,49 @@
+# app/utils/cache.py
+"""
+Small in-process caches shared by the gateway services.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Iterator, Optional, Tuple
+
+
+class TTLCache:
+    """Size-bounded LRU mapping keys to values, with a TTL"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Snapshot of (key, value) pairs, including expired ones"""
+        return iter([(k, v) for k, (_, v) in self._entries.items()])
+
+    def clear(self) -> None:
+        self._entries.clear()
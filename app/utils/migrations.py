@@ -0,0 +1,114 @@
+# app/utils/migrations.py
+"""
+Helpers for the Alembic revisions in ``migrations/versions``.
+
+Databases created before the migration history existed were built by
+``create_all`` and the old ``scripts/migrate_*.py`` scripts, so revisions
+check what is already there instead of assuming a clean upgrade path.
+
+Schema changes on large tables are made without long locks:
+
+* a new column with a default is added nullable, which only touches the
+  catalog, then existing rows are backfilled in short batches, each in its
+  own transaction, so writers are never blocked for the whole table;
+* indexes are built ``CONCURRENTLY`` on PostgreSQL, partition by partition
+  for a partitioned table, and dropped the same way.
+
+SQLite adds a column with a constant default without rewriting the table
+and builds indexes in one statement, so there both are done directly.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.services import partitions
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def _dialect() -> str:
+    return op.get_bind().dialect.name
+
+
+def has_table(table: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def has_column(table: str, column: str) -> bool:
+    columns = sa.inspect(op.get_bind()).get_columns(table)
+    return any(c["name"] == column for c in columns)
+
+
+def has_index(table: str, name: str) -> bool:
+    indexes = sa.inspect(op.get_bind()).get_indexes(table)
+    return any(i["name"] == name for i in indexes)
+
+
+def is_partitioned(table: str) -> bool:
+    return table == partitions.PARENT_TABLE and partitions.is_partitioned(op.get_bind())
+
+
+def add_column_backfilled(
+    table: str,
+    column: str,
+    type_,
+    default: str,
+    batch_size: int = BACKFILL_BATCH_SIZE,
+) -> None:
+    """
+    Add ``column`` with the SQL literal ``default`` for new rows and set it
+    on existing rows in batches. Does nothing if the column already exists.
+    """
+    if has_column(table, column):
+        return
+    if _dialect() == "sqlite":
+        op.add_column(table, sa.Column(column, type_, server_default=sa.text(default)))
+        return
+
+    op.add_column(table, sa.Column(column, type_, nullable=True))
+    op.alter_column(table, column, server_default=sa.text(default))
+    statement = sa.text(
+        f"UPDATE {table} SET {column} = {default} WHERE id IN "
+        f"(SELECT id FROM {table} WHERE {column} IS NULL LIMIT :batch)"
+    )
+    with op.get_context().autocommit_block():
+        while op.get_bind().execute(statement, {"batch": batch_size}).rowcount:
+            pass
+
+
+def create_index_online(name: str, table: str, columns: str) -> None:
+    """Create index ``name`` on ``table (columns)`` without blocking writes"""
+    if has_index(table, name):
+        return
+    if _dialect() != "postgresql":
+        op.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+        return
+
+    if not is_partitioned(table):
+        with op.get_context().autocommit_block():
+            op.execute(f"CREATE INDEX CONCURRENTLY {name} ON {table} ({columns})")
+        return
+
+    # A partitioned index can't be built concurrently: create it invalid on
+    # the parent only, build each partition's index concurrently and attach
+    # it; the parent index becomes valid once every partition is attached
+    op.execute(f"CREATE INDEX {name} ON ONLY {table} ({columns})")
+    for partition in partitions.list_partitions(op.get_bind()):
+        child = f"{partition}_{name[len('ix_' + table) + 1:]}_idx"
+        with op.get_context().autocommit_block():
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} "
+                f"ON {partition} ({columns})"
+            )
+        op.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+
+
+def drop_index_online(name: str, table: str) -> None:
+    """Drop index ``name`` if it exists, without blocking writes"""
+    if not has_index(table, name):
+        return
+    if _dialect() == "postgresql" and not is_partitioned(table):
+        with op.get_context().autocommit_block():
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        return
+    op.execute(f"DROP INDEX IF EXISTS {name}")
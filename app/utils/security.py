@@ -1,13 +1,20 @@
+import hashlib
+import hmac
 import secrets
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple, Union
 
 import bcrypt
 from jose import jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.config import settings
-from app.models.user import User
+from app.models.user import ApiKey, User
+
+# Keys look like ``llm-<public prefix>.<secret>``
+API_KEY_PREFIX = "llm-"
 
 
 def verify_password(plain_password, hashed_password):
@@ -16,19 +23,101 @@ def verify_password(plain_password, hashed_password):
     )
 
 
-def get_password_hash(password):
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+def get_password_hash(password, rounds: Optional[int] = None):
+    salt = bcrypt.gensalt(rounds=rounds or settings.bcrypt_rounds)
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
 
 
 def generate_api_key():
-    """Generate a secure API key"""
-    return secrets.token_urlsafe(32)
+    """Generate a secure API key with a public, indexable prefix"""
+    return f"{API_KEY_PREFIX}{secrets.token_hex(6)}.{secrets.token_urlsafe(32)}"
+
+
+def split_api_key(api_key: str) -> Tuple[str, str]:
+    """
+    Public prefix and secret of an API key. Keys issued before the prefixed
+    format are split after their first 12 characters.
+    """
+    if api_key.startswith(API_KEY_PREFIX) and "." in api_key:
+        prefix, _, secret = api_key[len(API_KEY_PREFIX) :].partition(".")
+        return prefix, secret
+    return api_key[:12], api_key[12:]
+
+
+def check_api_key_hmac_secret() -> bool:
+    """
+    Warn at startup when API key hashes are keyed with ``jwt_secret_key``:
+    rotating the JWT secret would then invalidate every API key. Set
+    ``API_KEY_HMAC_SECRET`` to the current JWT secret to keep existing keys
+    and decouple the two.
+    """
+    if settings.api_key_hmac_secret:
+        return True
+    print(
+        "API_KEY_HMAC_SECRET is not set; API keys are hashed with "
+        "JWT_SECRET_KEY and stop working if it is rotated"
+    )
+    return False
+
+
+def hash_api_key_secret(secret: str) -> str:
+    """Keyed hash stored in place of the secret part of an API key"""
+    key = settings.api_key_hmac_secret or settings.jwt_secret_key
+    return hmac.new(
+        key.encode("utf-8"), secret.encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+
+
+def issue_api_key(
+    db: Union[Session, AsyncSession], user_id: int, name: Optional[str] = None
+) -> Tuple[str, ApiKey]:
+    """
+    Add a new active key for a user, returning the plaintext key and its row.
+    Only the prefix and hash are stored, so this is the one time the key is
+    available in full; the caller commits.
+    """
+    api_key = generate_api_key()
+    prefix, secret = split_api_key(api_key)
+    key = ApiKey(
+        user_id=user_id,
+        prefix=prefix,
+        secret_hash=hash_api_key_secret(secret),
+        name=name,
+    )
+    db.add(key)
+    return api_key, key
+
+
+def _api_key_query(api_key: str):
+    """Query for the owner of the key's prefix, and the secret to check"""
+    prefix, secret = split_api_key(api_key)
+    query = (
+        select(User, ApiKey.secret_hash)
+        .join(ApiKey, ApiKey.user_id == User.id)
+        .where(ApiKey.prefix == prefix, ApiKey.revoked_at.is_(None))
+        .limit(1)
+    )
+    return query, secret
+
+
+def _api_key_owner(row, secret: str):
+    if row is None or not hmac.compare_digest(
+        row.secret_hash, hash_api_key_secret(secret)
+    ):
+        return None
+    return row.User
 
 
 def verify_api_key(api_key: str, db: Session):
     """Verify API key and return user"""
-    user = db.query(User).filter(User.api_key == api_key).first()
-    return user
+    query, secret = _api_key_query(api_key)
+    return _api_key_owner(db.execute(query).first(), secret)
+
+
+async def verify_api_key_async(api_key: str, db: AsyncSession):
+    """Verify API key and return user, without blocking the event loop"""
+    query, secret = _api_key_query(api_key)
+    return _api_key_owner((await db.execute(query)).first(), secret)
 
 
 def authenticate_user(db: Session, username: str, password: str):
@@ -40,6 +129,15 @@ def authenticate_user(db: Session, username: str, password: str):
     return user
 
 
+def access_token_claims(user) -> dict:
+    """Claims identifying a user (or principal) in an access token"""
+    return {
+        "sub": user.username,
+        "uid": user.id,
+        "ver": user.token_version or 0,
+    }
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -0,0 +1,61 @@
+"""Initial schema: users and api_calls
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 00:00:00
+
+The tables as they were before the migration history, created with their
+original indexes. Databases that already have them are left as they are.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.utils.migrations import has_table
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if not has_table("users"):
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("username", sa.String()),
+            sa.Column("hashed_password", sa.String()),
+            sa.Column("api_key", sa.String(), nullable=True),
+            sa.Column("token_limit", sa.Integer()),
+            sa.Column("tokens_used", sa.Integer()),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+        op.create_index("ix_users_api_key", "users", ["api_key"], unique=True)
+
+    if not has_table("api_calls"):
+        op.create_table(
+            "api_calls",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+            sa.Column("timestamp", sa.DateTime()),
+            sa.Column("endpoint", sa.String()),
+            sa.Column("method", sa.String()),
+            sa.Column("request_size", sa.Integer()),
+            sa.Column("status_code", sa.Integer()),
+            sa.Column("response_size", sa.Integer()),
+            sa.Column("tokens_used", sa.Float()),
+            sa.Column("model", sa.String(), nullable=True),
+            sa.Column("estimated_cost", sa.Float()),
+        )
+        op.create_index("ix_api_calls_id", "api_calls", ["id"])
+        op.create_index("ix_api_calls_user_id", "api_calls", ["user_id"])
+        op.create_index("ix_api_calls_timestamp", "api_calls", ["timestamp"])
+        op.create_index("ix_api_calls_endpoint", "api_calls", ["endpoint"])
+
+
+def downgrade() -> None:
+    op.drop_table("api_calls")
+    op.drop_table("users")
@@ -0,0 +1,25 @@
+"""Flag API calls served from the response cache
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 00:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.utils.migrations import add_column_backfilled
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    add_column_backfilled("api_calls", "cached", sa.Boolean(), "false")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("api_calls") as batch:
+        batch.drop_column("cached")
@@ -0,0 +1,25 @@
+"""Add each user's fair queuing weight
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 00:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.utils.migrations import add_column_backfilled
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    add_column_backfilled("users", "scheduling_weight", sa.Float(), "1.0")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("scheduling_weight")
@@ -0,0 +1,25 @@
+"""Add the JWT revocation version to users
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 00:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.utils.migrations import add_column_backfilled
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    add_column_backfilled("users", "token_version", sa.Integer(), "0")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("token_version")
@@ -0,0 +1,78 @@
+"""Move API keys into the hashed, prefix-indexed api_keys table
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 00:00:00
+
+Existing plaintext keys keep working: their first characters become the
+public prefix and the rest is hashed. users.api_key is then dropped, so the
+downgrade can only restore an empty column.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.utils.migrations import has_column, has_index, has_table
+from app.utils.security import hash_api_key_secret, split_api_key
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if not has_table("api_keys"):
+        op.create_table(
+            "api_keys",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+            sa.Column("prefix", sa.String()),
+            sa.Column("secret_hash", sa.String()),
+            sa.Column("name", sa.String(), nullable=True),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("revoked_at", sa.DateTime(), nullable=True),
+        )
+        op.create_index("ix_api_keys_id", "api_keys", ["id"])
+        op.create_index("ix_api_keys_user_id", "api_keys", ["user_id"])
+        op.create_index("ix_api_keys_prefix", "api_keys", ["prefix"], unique=True)
+
+    if not has_column("users", "api_key"):
+        return
+
+    conn = op.get_bind()
+    keys = []
+    for user_id, api_key in conn.execute(
+        sa.text("SELECT id, api_key FROM users WHERE api_key IS NOT NULL")
+    ):
+        prefix, secret = split_api_key(api_key)
+        keys.append(
+            {
+                "user_id": user_id,
+                "prefix": prefix,
+                "secret_hash": hash_api_key_secret(secret),
+            }
+        )
+    existing = {row[0] for row in conn.execute(sa.text("SELECT prefix FROM api_keys"))}
+    keys = [key for key in keys if key["prefix"] not in existing]
+    if keys:
+        conn.execute(
+            sa.text(
+                "INSERT INTO api_keys (user_id, prefix, secret_hash, name, created_at) "
+                "VALUES (:user_id, :prefix, :secret_hash, 'migrated', "
+                "CURRENT_TIMESTAMP)"
+            ),
+            keys,
+        )
+
+    if has_index("users", "ix_users_api_key"):
+        op.drop_index("ix_users_api_key", table_name="users")
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("api_key")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("users") as batch:
+        batch.add_column(sa.Column("api_key", sa.String(), nullable=True))
+    op.create_index("ix_users_api_key", "users", ["api_key"], unique=True)
+    op.drop_table("api_keys")
@@ -0,0 +1,27 @@
+"""Store prompt and completion tokens separately on api_calls
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 00:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.utils.migrations import add_column_backfilled
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    add_column_backfilled("api_calls", "prompt_tokens", sa.Integer(), "0")
+    add_column_backfilled("api_calls", "completion_tokens", sa.Integer(), "0")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("api_calls") as batch:
+        batch.drop_column("completion_tokens")
+        batch.drop_column("prompt_tokens")
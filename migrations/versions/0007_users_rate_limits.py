@@ -0,0 +1,30 @@
+"""Add per-user rate limit overrides
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 00:00:00
+
+NULL uses the configured defaults, so existing rows need no backfill.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.utils.migrations import has_column
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for column in ("rpm_limit", "tpm_limit"):
+        if not has_column("users", column):
+            op.add_column("users", sa.Column(column, sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("tpm_limit")
+        batch.drop_column("rpm_limit")
@@ -0,0 +1,90 @@
+"""Range-partition api_calls by month on PostgreSQL
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 00:00:00
+
+The table is rebuilt as PARTITION BY RANGE (timestamp), with timestamp added
+to the primary key as PostgreSQL requires, one partition per month from the
+oldest call up to api_calls_partitions_ahead months ahead, and the rows are
+copied across. Other databases keep the plain table.
+"""
+
+from datetime import datetime
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.services import partitions
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    "id, user_id, timestamp, endpoint, method, request_size, status_code, "
+    "response_size, tokens_used, prompt_tokens, completion_tokens, model, "
+    "cached, estimated_cost"
+)
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name != "postgresql" or partitions.is_partitioned(conn):
+        return
+
+    op.rename_table("api_calls", "api_calls_unpartitioned")
+    # Index names are global; free them for the new table's indexes
+    for index in ("id", "user_id", "timestamp", "endpoint"):
+        op.execute(f"DROP INDEX IF EXISTS ix_api_calls_{index}")
+    op.create_table(
+        "api_calls",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.Column("endpoint", sa.String()),
+        sa.Column("method", sa.String()),
+        sa.Column("request_size", sa.Integer()),
+        sa.Column("status_code", sa.Integer()),
+        sa.Column("response_size", sa.Integer()),
+        sa.Column("tokens_used", sa.Float()),
+        sa.Column("prompt_tokens", sa.Integer(), server_default=sa.text("0")),
+        sa.Column("completion_tokens", sa.Integer(), server_default=sa.text("0")),
+        sa.Column("model", sa.String(), nullable=True),
+        sa.Column("cached", sa.Boolean(), server_default=sa.text("false")),
+        sa.Column("estimated_cost", sa.Float()),
+        sa.PrimaryKeyConstraint("id", "timestamp"),
+        postgresql_partition_by="RANGE (timestamp)",
+    )
+    op.create_index("ix_api_calls_id", "api_calls", ["id"])
+    op.create_index("ix_api_calls_user_id", "api_calls", ["user_id"])
+    op.create_index("ix_api_calls_timestamp", "api_calls", ["timestamp"])
+    op.create_index("ix_api_calls_endpoint", "api_calls", ["endpoint"])
+
+    oldest = conn.execute(
+        sa.text("SELECT MIN(timestamp) FROM api_calls_unpartitioned")
+    ).scalar()
+    month = partitions.month_start((oldest or datetime.utcnow()).date())
+    current = partitions.month_start(datetime.utcnow().date())
+    while month < current:
+        op.execute(partitions.partition_ddl(month))
+        month = partitions.add_months(month, 1)
+    partitions.ensure_partitions(conn)
+
+    op.execute(
+        f"INSERT INTO api_calls ({COLUMNS}) "
+        f"SELECT {COLUMNS} FROM api_calls_unpartitioned "
+        "WHERE timestamp IS NOT NULL"
+    )
+    op.execute(
+        "SELECT setval(pg_get_serial_sequence('api_calls', 'id'), "
+        "COALESCE((SELECT MAX(id) FROM api_calls), 1))"
+    )
+    op.drop_table("api_calls_unpartitioned")
+
+
+def downgrade() -> None:
+    # Partitions are transparent to the application; going back to a plain
+    # table would mean copying every row again, so the table is left as it is
+    pass
@@ -0,0 +1,56 @@
+"""Add the hourly and daily usage rollups and fill them from api_calls
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17 00:00:00
+
+The backfill reads all of api_calls; run it before starting the version that
+maintains the rollups, while nothing writes usage.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.orm import Session
+
+from app.services.rollups import rebuild_rollups
+from app.utils.migrations import has_table
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def _create_rollup(table: str, bucket_type) -> None:
+    op.create_table(
+        table,
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("bucket", bucket_type),
+        sa.Column("model", sa.String()),
+        sa.Column("call_count", sa.Integer()),
+        sa.Column("tokens_used", sa.Float()),
+        sa.Column("prompt_tokens", sa.Integer()),
+        sa.Column("completion_tokens", sa.Integer()),
+        sa.Column("estimated_cost", sa.Float()),
+        sa.PrimaryKeyConstraint("user_id", "bucket", "model"),
+    )
+
+
+def upgrade() -> None:
+    created = False
+    for table, bucket_type in (
+        ("usage_hourly", sa.DateTime()),
+        ("usage_daily", sa.Date()),
+    ):
+        if not has_table(table):
+            _create_rollup(table, bucket_type)
+            created = True
+    if created:
+        with Session(bind=op.get_bind()) as db:
+            rebuild_rollups(db)
+            db.flush()
+
+
+def downgrade() -> None:
+    op.drop_table("usage_daily")
+    op.drop_table("usage_hourly")
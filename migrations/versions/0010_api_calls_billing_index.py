@@ -0,0 +1,38 @@
+"""Index api_calls by (user_id, timestamp DESC) for billing
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17 00:00:00
+
+Every read of api_calls is one user's calls over a time range, newest
+first. The composite index serves the filter, the order and the
+first/last-call lookups, which makes the single-column indexes redundant:
+user_id is its prefix, nothing filters on timestamp or endpoint alone, and
+id is already the primary key. Dropping them saves four index updates per
+inserted call. Indexes are created and dropped without blocking writes.
+"""
+
+from app.utils.migrations import create_index_online, drop_index_online
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+OLD_INDEXES = ("id", "user_id", "timestamp", "endpoint")
+
+
+def upgrade() -> None:
+    create_index_online(
+        "ix_api_calls_user_id_timestamp", "api_calls", "user_id, timestamp DESC"
+    )
+    for column in OLD_INDEXES:
+        drop_index_online(f"ix_api_calls_{column}", "api_calls")
+        # Name used by the old scripts/migrate_add_api_calls.py
+        drop_index_online(f"idx_api_calls_{column}", "api_calls")
+
+
+def downgrade() -> None:
+    for column in OLD_INDEXES:
+        create_index_online(f"ix_api_calls_{column}", "api_calls", column)
+    drop_index_online("ix_api_calls_user_id_timestamp", "api_calls")
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Benchmark event loop lag under mixed proxy and billing load.
+
+Runs the app in-process against a throwaway SQLite database (seeded with API
+calls so the billing queries have work to do) and a mocked vLLM backend.
+``--proxy`` clients send /v1/completions requests, ``--billing`` clients read
+/users/billing/daily, and a probe measures how late a short ``asyncio.sleep``
+wakes up, i.e. how long the event loop was blocked. It runs twice: with the
+async routes' queries on a blocking sync session (the behaviour before the
+async database layer) and on the async session.
+
+Each run goes through the app's lifespan (with backend health checks and
+model refreshes off), so, as in the server, finished calls are handed to
+the background usage writer and the proxy numbers include batched usage
+accounting.
+
+The in-process run is CPU-bound on one interpreter (see the ``cpu %``
+column), so proxy and billing clients share a fixed CPU budget. Blocking
+sessions stall the billing threads behind the event loop, which leaves more
+of that budget to the proxy clients. Once the loop stops blocking, billing
+is served about twice as fast and proxy throughput drops by the CPU billing
+now takes. Run with ``--billing 0`` to compare the proxy path alone: it is
+10-20% slower on the async session, the cost of aiosqlite handing every
+query to its connection thread and back, in exchange for the lower lag.
+asyncpg has no such thread.
+
+    python scripts/benchmark_event_loop_lag.py --seconds 10 --proxy 32 --billing 4
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='bench_')}/bench.db"
+)
+# The lifespan must not poll the real backends
+os.environ.setdefault("BACKEND_HEALTH_CHECK_INTERVAL", "0")
+os.environ.setdefault("MODELS_REFRESH_INTERVAL", "0")
+os.environ.setdefault("API_KEY_HMAC_SECRET", "benchmark-api-key-hmac-secret")
+
+import httpx  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app.dependencies.database import SessionLocal, engine, get_async_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.user import ApiCall, Base, User  # noqa: E402
+from app.services.rate_limit import get_rate_limiter  # noqa: E402
+from app.services.rollups import rebuild_rollups  # noqa: E402
+from app.services.upstream import get_upstream_client  # noqa: E402
+from app.utils.security import (  # noqa: E402
+    access_token_claims,
+    create_access_token,
+    issue_api_key,
+)
+
+UPSTREAM_LATENCY = 0.02
+PROBE_INTERVAL = 0.005
+
+
+class BlockingSession:
+    """AsyncSession look-alike running the sync session inline, as before"""
+
+    def __init__(self, db):
+        self._db = db
+
+    async def execute(self, statement):
+        return self._db.execute(statement)
+
+    async def commit(self):
+        self._db.commit()
+
+
+class Unlimited:
+    """Rate limiter stand-in that admits everything"""
+
+    def check(self, principal, tokens, key_id=None):
+        return {}
+
+
+async def get_blocking_db():
+    db = SessionLocal()
+    try:
+        yield BlockingSession(db)
+    finally:
+        db.close()
+
+
+def create_user(seed_calls: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = User(
+            username=f"bench_{time.time_ns()}",
+            hashed_password="not-used",
+            token_limit=10**12,
+        )
+        db.add(user)
+        db.flush()
+        api_key, _ = issue_api_key(db, user.id)
+        now = datetime.utcnow()
+        db.execute(
+            insert(ApiCall),
+            [
+                {
+                    "user_id": user.id,
+                    "timestamp": now - timedelta(minutes=i),
+                    "endpoint": "/v1/completions",
+                    "tokens_used": 10,
+                }
+                for i in range(seed_calls)
+            ],
+        )
+        # Billing reads the rollups, which the bulk insert bypassed
+        rebuild_rollups(db)
+        db.commit()
+        token = create_access_token(data=access_token_claims(user))
+        return api_key, token
+    finally:
+        db.close()
+
+
+async def upstream(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(UPSTREAM_LATENCY)
+    return httpx.Response(200, json={"choices": [{"text": "ok"}]})
+
+
+async def run(
+    blocking: bool, api_key: str, token: str, seconds: float, proxy: int, billing: int
+) -> dict:
+    if blocking:
+        app.dependency_overrides[get_async_db] = get_blocking_db
+    app.dependency_overrides[get_upstream_client] = lambda: httpx.AsyncClient(
+        transport=httpx.MockTransport(upstream)
+    )
+    # Measure the database, not the rate limiter
+    app.dependency_overrides[get_rate_limiter] = lambda: Unlimited()
+    cpu_started = time.process_time()
+    deadline = time.monotonic() + seconds
+    counts = {"proxy": 0, "billing": 0}
+    lags = []
+
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        app=app, base_url="http://bench"
+    ) as client:
+
+        async def proxy_loop():
+            headers = {"Authorization": f"Bearer {api_key}"}
+            body = {"model": "m", "prompt": "hello", "max_tokens": 1}
+            while time.monotonic() < deadline:
+                await client.post("/v1/completions", json=body, headers=headers)
+                counts["proxy"] += 1
+
+        async def billing_loop():
+            headers = {"Authorization": f"Bearer {token}"}
+            while time.monotonic() < deadline:
+                await client.get("/users/billing/daily", headers=headers)
+                counts["billing"] += 1
+
+        async def probe():
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                await asyncio.sleep(PROBE_INTERVAL)
+                lags.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+        await asyncio.gather(
+            probe(),
+            *(proxy_loop() for _ in range(proxy)),
+            *(billing_loop() for _ in range(billing)),
+        )
+
+    cpu = time.process_time() - cpu_started
+    app.dependency_overrides.clear()
+
+    lags.sort()
+    return {
+        "proxy_per_s": counts["proxy"] / seconds,
+        "billing_per_s": counts["billing"] / seconds,
+        "lag_p50_ms": statistics.median(lags) * 1000,
+        "lag_p99_ms": lags[int(len(lags) * 0.99) - 1] * 1000,
+        "lag_max_ms": lags[-1] * 1000,
+        "cpu_percent": cpu / seconds * 100,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--proxy", type=int, default=32)
+    parser.add_argument("--billing", type=int, default=4)
+    parser.add_argument("--seed-calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    api_key, token = create_user(args.seed_calls)
+
+    print(f"{args.proxy} proxy clients, {args.billing} billing clients")
+    print(
+        f"{'session':<10} {'proxy/s':>8} {'billing/s':>10}"
+        f" {'lag p50 ms':>11} {'p99 ms':>8} {'max ms':>8} {'cpu %':>6}"
+    )
+    for name, blocking in (("blocking", True), ("async", False)):
+        result = await run(
+            blocking, api_key, token, args.seconds, args.proxy, args.billing
+        )
+        print(
+            f"{name:<10} {result['proxy_per_s']:>8.1f} {result['billing_per_s']:>10.1f}"
+            f" {result['lag_p50_ms']:>11.2f} {result['lag_p99_ms']:>8.2f}"
+            f" {result['lag_max_ms']:>8.2f} {result['cpu_percent']:>6.0f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark login throughput next to proxy latency during a login storm.
+
+Runs the app in-process against a throwaway SQLite database and a mocked vLLM
+backend with a fixed latency. While ``--logins`` clients hammer /auth/token,
+one client sends /v1/completions requests and records their latency. Each
+configuration is run twice: with bcrypt in the shared threadpool (the
+behaviour before the dedicated pool) and in the dedicated process pool.
+Each run goes through the app's lifespan, with backend health checks and
+model refreshes off.
+
+    python scripts/benchmark_password_hashing.py --seconds 10 --logins 32
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from typing import Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='bench_')}/bench.db"
+)
+# The lifespan must not poll the real backends
+os.environ.setdefault("BACKEND_HEALTH_CHECK_INTERVAL", "0")
+os.environ.setdefault("MODELS_REFRESH_INTERVAL", "0")
+os.environ.setdefault("API_KEY_HMAC_SECRET", "benchmark-api-key-hmac-secret")
+
+import httpx  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.dependencies.database import SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.user import Base, User  # noqa: E402
+from app.services.password_hashing import (  # noqa: E402
+    PasswordHasher,
+    get_password_hasher,
+)
+from app.services.upstream import get_upstream_client  # noqa: E402
+from app.utils.security import get_password_hash, issue_api_key  # noqa: E402
+
+PASSWORD = "benchmark-password"
+UPSTREAM_LATENCY = 0.02
+
+
+def create_user() -> Tuple[User, str]:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = User(
+            username=f"bench_{uuid.uuid4().hex}",
+            hashed_password=get_password_hash(PASSWORD),
+            token_limit=10**12,
+        )
+        db.add(user)
+        db.flush()
+        api_key, _ = issue_api_key(db, user.id)
+        db.commit()
+        db.refresh(user)
+        return user, api_key
+    finally:
+        db.close()
+
+
+async def upstream(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(UPSTREAM_LATENCY)
+    return httpx.Response(200, json={"choices": [{"text": "ok"}]})
+
+
+async def run(
+    hasher: PasswordHasher, user: User, api_key: str, seconds: float, logins: int
+) -> dict:
+    app.dependency_overrides[get_password_hasher] = lambda: hasher
+    app.dependency_overrides[get_upstream_client] = lambda: httpx.AsyncClient(
+        transport=httpx.MockTransport(upstream)
+    )
+    deadline = time.monotonic() + seconds
+    login_statuses = []
+    latencies = []
+
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        app=app, base_url="http://bench"
+    ) as client:
+
+        async def login_loop():
+            form = {"username": user.username, "password": PASSWORD}
+            while time.monotonic() < deadline:
+                response = await client.post("/auth/token", data=form)
+                login_statuses.append(response.status_code)
+
+        async def proxy_loop():
+            headers = {"Authorization": f"Bearer {api_key}"}
+            body = {"model": "m", "prompt": "hello"}
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                await client.post("/v1/completions", json=body, headers=headers)
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(proxy_loop(), *(login_loop() for _ in range(logins)))
+
+    app.dependency_overrides.clear()
+    hasher.shutdown()
+
+    latencies.sort()
+    return {
+        "logins_per_s": login_statuses.count(200) / seconds,
+        "rejected_429": login_statuses.count(429),
+        "proxy_p50_ms": statistics.median(latencies) * 1000,
+        "proxy_p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--logins", type=int, default=32)
+    args = parser.parse_args()
+
+    user, api_key = create_user()
+    configurations = {
+        "shared threadpool": PasswordHasher(
+            workers=0, queue_size=10**6, retry_after=1
+        ),
+        "process pool": PasswordHasher(
+            workers=settings.password_hash_workers,
+            queue_size=settings.password_hash_queue_size,
+            retry_after=settings.password_hash_retry_after,
+        ),
+    }
+
+    print(f"bcrypt rounds={settings.bcrypt_rounds}, {args.logins} login clients")
+    print(f"{'mode':<18} {'logins/s':>9} {'429s':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, hasher in configurations.items():
+        result = await run(hasher, user, api_key, args.seconds, args.logins)
+        print(
+            f"{name:<18} {result['logins_per_s']:>9.1f} {result['rejected_429']:>6}"
+            f" {result['proxy_p50_ms']:>8.1f} {result['proxy_p99_ms']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark ApiCall insert throughput under each SQLite storage profile.
+
+``--writers`` threads insert ApiCall rows for ``--seconds`` while
+``--readers`` threads run a billing-style aggregate, against a fresh database
+file per profile. Writers commit every ``--batch`` rows: 1 matches one write
+per request, larger values match the usage writer's batches. The "default"
+profile is the driver's rollback journal with every session on one pool;
+"production" is WAL with the tuned pragmas, a single writer connection and
+query-only readers.
+
+    python scripts/benchmark_sqlite_writes.py --seconds 10 --writers 8 --batch 1
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import func, insert  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.dependencies.database import create_engines  # noqa: E402
+from app.models.user import ApiCall, Base  # noqa: E402
+
+
+def run(profile: str, seconds: float, writers: int, readers: int, batch: int):
+    settings.sqlite_profile = profile
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_"), f"{profile}.db")
+    writer, reader = create_engines(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=writer)
+
+    deadline = time.monotonic() + seconds
+    counts = {"rows": 0, "locked": 0, "reads": 0}
+    lock = threading.Lock()
+    row = {"user_id": 1, "endpoint": "/v1/completions", "tokens_used": 10}
+
+    def write_loop():
+        while time.monotonic() < deadline:
+            try:
+                with Session(writer) as db:
+                    db.execute(
+                        insert(ApiCall),
+                        [dict(row, timestamp=datetime.utcnow()) for _ in range(batch)],
+                    )
+                    db.commit()
+                with lock:
+                    counts["rows"] += batch
+            except OperationalError:
+                with lock:
+                    counts["locked"] += 1
+
+    def read_loop():
+        while time.monotonic() < deadline:
+            try:
+                with Session(reader) as db:
+                    db.query(
+                        func.count(ApiCall.id), func.sum(ApiCall.tokens_used)
+                    ).filter(ApiCall.user_id == 1).one()
+                with lock:
+                    counts["reads"] += 1
+            except OperationalError:
+                with lock:
+                    counts["locked"] += 1
+
+    threads = [threading.Thread(target=write_loop) for _ in range(writers)]
+    threads += [threading.Thread(target=read_loop) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.dispose()
+    reader.dispose()
+
+    return {
+        "rows_per_s": counts["rows"] / seconds,
+        "reads_per_s": counts["reads"] / seconds,
+        "locked": counts["locked"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--batch", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers, {args.readers} readers, {args.batch} rows/commit")
+    print(f"{'profile':<11} {'rows/s':>9} {'reads/s':>8} {'locked':>7}")
+    for profile in ("default", "production"):
+        result = run(profile, args.seconds, args.writers, args.readers, args.batch)
+        print(
+            f"{profile:<11} {result['rows_per_s']:>9.0f}"
+            f" {result['reads_per_s']:>8.0f} {result['locked']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,17 @@
+import os
+
+from alembic import command
+from alembic.config import Config
+
 from app.dependencies.database import engine
-from app.models.user import Base
+from app.services.partitions import maintain_partitions
+
+# Create or upgrade all tables through the migration history
+command.upgrade(
+    Config(os.path.join(os.path.dirname(__file__), "..", "alembic.ini")), "head"
+)
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
+# On PostgreSQL, api_calls needs partitions before it can take rows
+maintain_partitions(engine)
 
 print("Database tables created successfully!")
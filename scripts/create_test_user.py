@@ -10,7 +10,7 @@ from sqlalchemy.orm import sessionmaker
 
 from app.config import settings
 from app.models.user import Base, User
-from app.utils.security import generate_api_key, get_password_hash
+from app.utils.security import get_password_hash, issue_api_key
 
 
 def create_user():
@@ -27,23 +27,26 @@ def create_user():
         # Check if user already exists
         existing_user = db.query(User).filter(User.username == "opencode_user").first()
         if existing_user:
+            # Keys are stored hashed, so issue a fresh one to print
+            api_key, _ = issue_api_key(db, existing_user.id, "opencode")
+            db.commit()
             print("✓ User 'opencode_user' already exists")
-            print(f"API Key: {existing_user.api_key}")
+            print(f"New API Key: {api_key}")
             return
 
         # Create new user
         hashed_password = get_password_hash("test_password_123")
-        api_key = generate_api_key()
 
         new_user = User(
             username="opencode_user",
             hashed_password=hashed_password,
-            api_key=api_key,
             token_limit=50000,
             tokens_used=0,
         )
 
         db.add(new_user)
+        db.flush()
+        api_key, _ = issue_api_key(db, new_user.id, "opencode")
         db.commit()
         db.refresh(new_user)
 
@@ -0,0 +1,193 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import uuid
+
+# Point the app at a throwaway database before any app module is imported
+_db_dir = tempfile.mkdtemp(prefix="llm_users_test_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_dir}/test.db")
+# Fixture sessions stay open across requests and would hold the single writer
+# connection of the production SQLite profile; tests that need that profile
+# run the app in a subprocess through ``run_with_production_profile``
+os.environ.setdefault("SQLITE_PROFILE", "default")
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.dependencies.auth import claims_cache  # noqa: E402
+from app.dependencies.database import SessionLocal, engine, sync_engines  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.user import ApiCall, Base, User  # noqa: E402
+from app.services.auth_cache import api_key_cache, user_cache  # noqa: E402
+from app.services.upstream import get_upstream_client  # noqa: E402
+from app.utils.security import issue_api_key  # noqa: E402
+
+Base.metadata.create_all(bind=engine)
+
+
+def _clear_auth_caches():
+    api_key_cache.clear()
+    user_cache.clear()
+    claims_cache.clear()
+
+
+def _record_statements(match, label=lambda statement: statement):
+    """Record ``label(statement)`` for each statement ``match`` accepts"""
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if match(statement):
+            statements.append(label(statement))
+
+    for target in sync_engines:
+        event.listen(target, "before_cursor_execute", before_execute)
+    yield statements
+    for target in sync_engines:
+        event.remove(target, "before_cursor_execute", before_execute)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def api_user(db):
+    """A user with an API key (as ``user.api_key``) and plenty of quota"""
+    user = User(
+        username=f"user_{uuid.uuid4().hex}",
+        hashed_password="not-used",
+        token_limit=1_000_000,
+        tokens_used=0,
+    )
+    db.add(user)
+    db.flush()
+    # Only the hash is stored; keep the plaintext key around for the tests
+    api_key, _ = issue_api_key(db, user.id)
+    db.commit()
+    db.refresh(user)
+    user.api_key = api_key
+    return user
+
+
+@pytest.fixture
+def client():
+    """A test client with empty auth caches and an upstream that answers ok"""
+    _clear_auth_caches()
+    mock_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, json={"choices": [{"text": "ok"}]})
+        )
+    )
+    app.dependency_overrides[get_upstream_client] = lambda: mock_client
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+    _clear_auth_caches()
+
+
+@pytest.fixture
+def complete(client):
+    """POST a completion with an API key: ``complete(api_key, model="m")``"""
+
+    def post(api_key, model="m", prompt="hi"):
+        return client.post(
+            "/v1/completions",
+            json={"model": model, "prompt": prompt},
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+
+    return post
+
+
+@pytest.fixture
+def user_lookups():
+    """Record SELECTs against the users table"""
+    yield from _record_statements(
+        lambda s: s.lstrip().upper().startswith("SELECT") and "FROM users" in s
+    )
+
+
+@pytest.fixture
+def writes():
+    """Record INSERT/UPDATE statements as e.g. ``"INSERT INTO api_calls"``"""
+    yield from _record_statements(
+        lambda s: s.lstrip().upper().startswith(("INSERT", "UPDATE")),
+        lambda s: s.split("(")[0].split(" SET")[0].strip(),
+    )
+
+
+@pytest.fixture
+def calls(db):
+    """A user's logged API calls, re-read from the database: ``calls(user)``"""
+
+    def read(user):
+        db.expire_all()
+        return db.query(ApiCall).filter(ApiCall.user_id == user.id).all()
+
+    return read
+
+
+# Run by ``run_with_production_profile`` before the test's script
+_PRODUCTION_PRELUDE = """
+import asyncio, json, threading, time
+import httpx
+from app.dependencies.database import engine
+from app.main import app
+from app.models.user import Base
+from app.services.upstream import get_upstream_client
+
+Base.metadata.create_all(bind=engine)
+
+
+async def _upstream(request):
+    await asyncio.sleep(0.02)
+    return httpx.Response(200, json={"choices": [{"text": "ok"}]})
+
+
+app.dependency_overrides[get_upstream_client] = lambda: httpx.AsyncClient(
+    transport=httpx.MockTransport(_upstream)
+)
+"""
+
+
+@pytest.fixture
+def run_with_production_profile(tmp_path):
+    """
+    Run a script against the app in a fresh interpreter, on a new database
+    with the SQLite profile the app ships with (the suite itself uses the
+    default one). The prelude creates the tables and mocks vLLM with 20 ms
+    of latency; the script prints its results as JSON on its last line, and
+    the interpreter must exit within ``timeout`` seconds.
+    """
+
+    def run(script: str, timeout: float = 60) -> dict:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{tmp_path}/production.db",
+            "SQLITE_PROFILE": "production",
+            "BACKEND_HEALTH_CHECK_INTERVAL": "0",
+            "MODELS_REFRESH_INTERVAL": "0",
+            "API_KEY_HMAC_SECRET": "test-api-key-hmac-secret",
+            "BCRYPT_ROUNDS": "4",
+        }
+        result = subprocess.run(
+            [sys.executable, "-c", _PRODUCTION_PRELUDE + textwrap.dedent(script)],
+            cwd=os.path.join(os.path.dirname(__file__), ".."),
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+        assert result.returncode == 0, result.stderr
+        return json.loads(result.stdout.splitlines()[-1])
+
+    return run
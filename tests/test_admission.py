@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.admission import AdmissionController, get_admission_controller
+from app.services.backends import Backend, BackendPool
+
+
+def _controller(limit=1, queue_size=2, queue_timeout=1.0):
+    pool = BackendPool([Backend("http://a", max_concurrency=limit)])
+    return AdmissionController(
+        pool, queue_size=queue_size, queue_timeout=queue_timeout, retry_after=3
+    )
+
+
+@pytest.mark.asyncio
+async def test_queued_request_gets_the_released_slot():
+    admission = _controller()
+    first = await admission.acquire()
+
+    waiter = asyncio.ensure_future(admission.acquire())
+    await asyncio.sleep(0)
+    assert admission.queue_depth == 1
+    assert not waiter.done()
+
+    admission.release(first)
+    second = await waiter
+
+    assert second is first
+    assert second.in_flight == 1
+    assert admission.queue_depth == 0
+    assert admission.metrics.queued_total == 1
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected_with_retry_after():
+    admission = _controller(queue_size=1)
+    await admission.acquire()
+    waiter = asyncio.ensure_future(admission.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await admission.acquire()
+
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers == {"Retry-After": "3"}
+    assert admission.metrics.rejected_queue_full_total == 1
+    waiter.cancel()
+
+
+@pytest.mark.asyncio
+async def test_wait_longer_than_queue_timeout_is_rejected():
+    admission = _controller(queue_timeout=0.05)
+    backend = await admission.acquire()
+
+    with pytest.raises(HTTPException) as exc_info:
+        await admission.acquire()
+
+    assert exc_info.value.status_code == 503
+    assert admission.metrics.rejected_timeout_total == 1
+    assert admission.queue_depth == 0
+    assert backend.in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_slots_never_exceed_the_backend_limit():
+    admission = _controller(limit=2, queue_size=10)
+    backend = admission.pool.backends[0]
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with admission.lease():
+            peak = max(peak, backend.in_flight)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(call() for _ in range(8)))
+
+    assert peak == 2
+    assert backend.in_flight == 0
+
+
+def test_metrics_endpoint_exposes_queue_depth():
+    admission = _controller()
+    app.dependency_overrides[get_admission_controller] = lambda: admission
+    try:
+        response = TestClient(app).get("/metrics")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert "gateway_admission_queue_depth 0" in response.text
+    assert 'gateway_backend_in_flight{backend="http://a"} 0' in response.text
+
+
+async def _service_order(admission, flows):
+    """Queue one request per entry of ``flows`` behind a busy slot and
+    return the order in which the flows are served"""
+    order = []
+    busy = await admission.acquire()
+
+    async def call(flow, weight):
+        backend = await admission.acquire(flow=flow, weight=weight)
+        order.append(flow)
+        admission.release(backend)
+
+    tasks = [asyncio.ensure_future(call(flow, weight)) for flow, weight in flows]
+    await asyncio.sleep(0)
+    admission.release(busy)
+    await asyncio.gather(*tasks)
+    return order
+
+
+@pytest.mark.asyncio
+async def test_waiting_users_are_served_fairly():
+    """A user who queued a batch first cannot starve a later user"""
+    admission = _controller(queue_size=10)
+
+    order = await _service_order(admission, [("batch", 1.0)] * 4 + [("chat", 1.0)] * 2)
+
+    assert order == ["batch", "chat", "batch", "chat", "batch", "batch"]
+
+
+@pytest.mark.asyncio
+async def test_weights_set_each_users_share_of_slots():
+    admission = _controller(queue_size=20)
+
+    order = await _service_order(admission, [("a", 1.0)] * 6 + [("b", 2.0)] * 6)
+
+    assert order[:6].count("b") == 4
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_ordered_by_start_tag():
+    """SFQ: equal start tags are served in arrival order, whatever the weight"""
+    admission = _controller(queue_size=10)
+
+    order = await _service_order(admission, [("light", 1.0), ("heavy", 4.0)])
+
+    assert order == ["light", "heavy"]
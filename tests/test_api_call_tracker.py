@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from app.middleware.api_call_tracker import (
+    REQUEST_HEAD_BYTES,
+    ApiCallTrackerMiddleware,
+    _request_model,
+)
+from app.services.auth_cache import Principal
+from app.services.usage import USAGE_STATE, UsageRecord
+
+
+async def _call(app, path, body: bytes, chunk_size=1024, headers=()):
+    """Drive the middleware with a request body sent in chunks"""
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": list(headers)}
+    await ApiCallTrackerMiddleware(app)(scope, receive, send)
+    return sent
+
+
+@pytest.mark.asyncio
+async def test_streamed_response_is_counted_not_buffered(api_user, db, calls):
+    chunk = b"data: " + b"x" * 1000 + b"\n\n"
+
+    async def app(scope, receive, send):
+        while (await receive())["more_body"]:
+            pass
+        record = UsageRecord(Principal.from_user(api_user), "m")
+        scope["state"][USAGE_STATE] = record
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        for _ in range(500):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    body = json.dumps({"model": "m", "prompt": "p" * 5000}).encode()
+    sent = await _call(app, "/v1/completions", body)
+
+    # Every chunk reaches the client untouched
+    assert sum(len(m.get("body", b"")) for m in sent) == 500 * len(chunk)
+    [call] = calls(api_user)
+    assert (call.request_size, call.response_size) == (len(body), 500 * len(chunk))
+
+
+@pytest.mark.asyncio
+async def test_model_of_failed_call_comes_from_request_head(api_user, db, calls):
+    async def app(scope, receive, send):
+        while (await receive())["more_body"]:
+            pass
+        await send({"type": "http.response.start", "status": 502, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    body = json.dumps({"model": "big-model", "prompt": "p" * 50000}).encode()
+    assert len(body) > REQUEST_HEAD_BYTES
+    authorization = (b"authorization", f"Bearer {api_user.api_key}".encode())
+    await _call(app, "/v1/completions", body, headers=[authorization])
+
+    [call] = calls(api_user)
+    assert (call.model, call.status_code, call.tokens_used) == ("big-model", 502, 0)
+    assert call.request_size == len(body)
+
+
+def test_request_model_from_truncated_head():
+    head = json.dumps({"model": 'a "quoted" name', "prompt": "x" * 100}).encode()[:40]
+    assert _request_model(head, complete=False) == 'a "quoted" name'
+    assert _request_model(b'{"prompt": "x", "model": "m"}', complete=True) == "m"
+    assert _request_model(b'{"prompt": "xxx', complete=False) is None
+
+
+@pytest.mark.parametrize(
+    "path, tracked",
+    [
+        ("/v1/completions", True),
+        ("/v1/chat/completions/", True),
+        ("/chat/completions", True),
+        ("/v1/models", False),
+        ("/users/me", False),
+        ("/auth/token", False),
+    ],
+)
+def test_tracked_paths(path, tracked):
+    assert ApiCallTrackerMiddleware(None)._should_track_call(path, "POST") is tracked
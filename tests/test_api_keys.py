@@ -0,0 +1,78 @@
+from app.config import settings
+from app.models.user import ApiKey
+from app.utils.security import (
+    access_token_claims,
+    check_api_key_hmac_secret,
+    create_access_token,
+    hash_api_key_secret,
+    split_api_key,
+    verify_api_key,
+)
+
+
+def test_only_prefix_and_hash_are_stored(api_user, db):
+    prefix, secret = split_api_key(api_user.api_key)
+    stored = db.query(ApiKey).filter(ApiKey.user_id == api_user.id).one()
+
+    assert api_user.api_key == f"llm-{prefix}.{secret}"
+    assert stored.prefix == prefix
+    assert stored.secret_hash == hash_api_key_secret(secret)
+    assert secret not in stored.secret_hash
+
+
+def test_wrong_secret_with_valid_prefix_is_rejected(api_user, db):
+    prefix, _ = split_api_key(api_user.api_key)
+
+    assert verify_api_key(api_user.api_key, db).id == api_user.id
+    assert verify_api_key(f"llm-{prefix}.not-the-secret", db) is None
+
+
+def test_legacy_key_verifies_after_migration(api_user, db):
+    legacy = "6AKHFK3uQw3Z2LzkC0uXSE2C5k_wnnJuEyvI4ul0wMc"
+    prefix, secret = split_api_key(legacy)
+    db.add(
+        ApiKey(
+            user_id=api_user.id, prefix=prefix, secret_hash=hash_api_key_secret(secret)
+        )
+    )
+    db.commit()
+
+    assert prefix == "6AKHFK3uQw3Z"
+    assert verify_api_key(legacy, db).id == api_user.id
+
+
+def test_keys_rotate_independently(client, api_user, complete):
+    headers = {
+        "Authorization": f"Bearer {create_access_token(access_token_claims(api_user))}"
+    }
+
+    created = client.post("/users/me/api-keys", params={"name": "ci"}, headers=headers)
+    assert created.status_code == 200
+    new_key = created.json()["api_key"]
+    assert created.json()["name"] == "ci"
+
+    listed = client.get("/users/me/api-keys", headers=headers).json()
+    assert len(listed) == 2
+    assert all("api_key" not in key for key in listed)
+
+    assert complete(api_user.api_key).status_code == 200
+    assert complete(new_key).status_code == 200
+
+    old_prefix, _ = split_api_key(api_user.api_key)
+    revoked = client.delete(f"/users/me/api-keys/{old_prefix}", headers=headers)
+    assert revoked.status_code == 200
+
+    assert complete(api_user.api_key).status_code == 401
+    assert complete(new_key).status_code == 200
+    missing = client.delete(f"/users/me/api-keys/{old_prefix}", headers=headers)
+    assert missing.status_code == 404
+
+
+def test_startup_warns_when_keys_are_hashed_with_the_jwt_secret(monkeypatch, capsys):
+    monkeypatch.setattr(settings, "api_key_hmac_secret", None)
+    assert not check_api_key_hmac_secret()
+    assert "API_KEY_HMAC_SECRET" in capsys.readouterr().out
+
+    monkeypatch.setattr(settings, "api_key_hmac_secret", "k" * 32)
+    assert check_api_key_hmac_secret()
+    assert capsys.readouterr().out == ""
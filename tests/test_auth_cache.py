@@ -0,0 +1,74 @@
+from app.models.user import ApiCall, User
+from app.services.auth_cache import api_key_cache
+from app.services.usage_writer import UsageEvent, UsageWriter
+from app.utils.security import create_access_token
+
+
+def test_api_key_is_looked_up_once(client, api_user, user_lookups, complete):
+    """The route and the tracking middleware share one cached lookup"""
+    assert complete(api_user.api_key).status_code == 200
+    assert complete(api_user.api_key).status_code == 200
+
+    assert len(user_lookups) == 1
+
+
+def test_regenerating_the_key_invalidates_the_old_one(client, api_user, complete):
+    assert complete(api_user.api_key).status_code == 200
+    token = create_access_token(data={"sub": api_user.username})
+
+    response = client.post(
+        "/users/me/api-key", headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 200
+    assert complete(api_user.api_key).status_code == 401
+    assert complete(response.json()["api_key"]).status_code == 200
+
+
+def test_limit_change_is_seen_on_next_request(client, api_user, complete):
+    assert complete(api_user.api_key).status_code == 200
+    cached = api_key_cache.get(api_user.api_key)
+    token = create_access_token(data={"sub": api_user.username})
+
+    client.put(
+        "/users/me/token-limit",
+        params={"token_limit": 5000},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert api_key_cache.get(api_user.api_key) is None
+    assert complete(api_user.api_key).status_code == 200
+    assert api_key_cache.get(api_user.api_key) is not cached
+    assert api_key_cache.get(api_user.api_key).token_limit == 5000
+
+
+def test_deleted_user_loses_access(client, api_user, complete):
+    assert complete(api_user.api_key).status_code == 200
+    token = create_access_token(data={"sub": api_user.username})
+
+    response = client.delete("/users/me", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    assert complete(api_user.api_key).status_code == 401
+
+
+def test_deleted_user_keeps_billing_history(client, api_user, db, complete):
+    assert complete(api_user.api_key).status_code == 200
+    token = create_access_token(data={"sub": api_user.username})
+    username = api_user.username
+
+    client.delete("/users/me", headers={"Authorization": f"Bearer {token}"})
+
+    calls = db.query(ApiCall).filter(ApiCall.user_id == api_user.id).count()
+    assert calls == 1
+    # The account is closed: its name no longer logs in, it has no password
+    login = client.post("/auth/token", data={"username": username, "password": "x"})
+    assert login.status_code == 401
+    db.expire_all()
+    assert db.get(User, api_user.id).hashed_password is None
+
+    # Usage still queued for the closed account is written normally
+    writer = UsageWriter(queue_size=1, batch_size=1, flush_interval=0.0)
+    writer.write([UsageEvent({"user_id": api_user.id, "tokens_used": 3}, delta=3)])
+    assert writer.failed_total == 0
+    assert db.query(ApiCall).filter(ApiCall.user_id == api_user.id).count() == 2
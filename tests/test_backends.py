@@ -0,0 +1,120 @@
+import httpx
+import pytest
+
+from app.services.backends import (
+    POWER_OF_TWO,
+    PREFIX_AFFINITY,
+    Backend,
+    BackendPool,
+    prefix_affinity_key,
+)
+
+
+def test_least_outstanding_spreads_in_flight_requests():
+    """Concurrent requests are spread evenly across equal replicas"""
+    pool = BackendPool([Backend("http://a"), Backend("http://b"), Backend("http://c")])
+
+    for _ in range(6):
+        pool.acquire()
+
+    assert [b.in_flight for b in pool.backends] == [2, 2, 2]
+
+
+def test_weights_scale_the_share_of_in_flight_requests():
+    """A backend with twice the weight takes twice the outstanding requests"""
+    small, large = Backend("http://small"), Backend("http://large", weight=2)
+    pool = BackendPool([small, large])
+
+    for _ in range(6):
+        pool.acquire()
+
+    assert (small.in_flight, large.in_flight) == (2, 4)
+
+
+def test_power_of_two_prefers_the_less_loaded_replica():
+    busy, idle = Backend("http://busy"), Backend("http://idle")
+    busy.in_flight = 10
+    pool = BackendPool([busy, idle], strategy=POWER_OF_TWO)
+
+    picks = [pool.choose() for _ in range(200)]
+
+    # Busy only wins when both random choices land on it
+    assert picks.count(idle) > 2 * picks.count(busy)
+
+
+def test_lease_releases_the_slot():
+    pool = BackendPool([Backend("http://a")])
+
+    with pool.lease() as backend:
+        assert backend.in_flight == 1
+
+    assert backend.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_failing_health_checks_eject_and_readmit_backend():
+    """Replicas failing health checks stop receiving traffic until they recover"""
+    good, bad = Backend("http://good"), Backend("http://bad")
+    pool = BackendPool([good, bad], unhealthy_threshold=2)
+    bad_is_down = True
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "bad" and bad_is_down:
+            return httpx.Response(503)
+        return httpx.Response(200)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        await pool.check_health(client)
+        assert bad.healthy
+        await pool.check_health(client)
+        assert not bad.healthy
+        assert all(pool.choose() is good for _ in range(10))
+
+        bad_is_down = False
+        await pool.check_health(client)
+        assert bad.healthy
+
+
+def _conversation(*turns):
+    messages = [{"role": "system", "content": "You are a coding agent."}]
+    for i, turn in enumerate(turns):
+        messages.append(
+            {"role": "user" if i % 2 == 0 else "assistant", "content": turn}
+        )
+    return messages
+
+
+def test_prefix_affinity_key_ignores_later_turns():
+    first = prefix_affinity_key(_conversation("fix the bug", "done"), turns=2)
+    later = prefix_affinity_key(
+        _conversation("fix the bug", "done", "now add tests", "ok"), turns=2
+    )
+    other = prefix_affinity_key(_conversation("write docs", "done"), turns=2)
+
+    assert first == later
+    assert first != other
+    assert prefix_affinity_key([], turns=2) is None
+
+
+def test_prefix_affinity_pins_a_session_to_one_backend():
+    """Every turn of one conversation lands on the same replica"""
+    pool = BackendPool(
+        [Backend(f"http://gpu-{i}") for i in range(4)], strategy=PREFIX_AFFINITY
+    )
+    key = prefix_affinity_key(_conversation("refactor module"), turns=2)
+
+    assert len({pool.choose(key).url for _ in range(20)}) == 1
+
+
+def test_prefix_affinity_spills_over_when_the_pinned_backend_is_overloaded():
+    """Bounded loads send traffic elsewhere once the pinned replica is hot"""
+    pool = BackendPool(
+        [Backend(f"http://gpu-{i}") for i in range(4)],
+        strategy=PREFIX_AFFINITY,
+        affinity_load_factor=1.25,
+    )
+    key = prefix_affinity_key(_conversation("long session"), turns=2)
+    pinned = pool.choose(key)
+    pinned.in_flight = 8
+
+    assert pool.choose(key) is not pinned
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.upstream import get_upstream_client
+from app.utils.security import create_access_token
+
+UPSTREAM_DELAY = 0.3
+CONCURRENT_REQUESTS = 5
+
+
+@pytest.mark.asyncio
+async def test_concurrent_chat_completions_overlap(api_user):
+    """Slow upstream calls on /chat/completions must not serialise the event loop"""
+    in_flight = 0
+    peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(UPSTREAM_DELAY)
+        in_flight -= 1
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    app.dependency_overrides[get_upstream_client] = lambda: mock_client
+    token = create_access_token(
+        data={"sub": api_user.username}, expires_delta=timedelta(minutes=5)
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    payload = {"messages": [{"role": "user", "content": "hi"}]}
+
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            started = time.perf_counter()
+            responses = await asyncio.gather(
+                *(
+                    client.post("/chat/completions", json=payload, headers=headers)
+                    for _ in range(CONCURRENT_REQUESTS)
+                )
+            )
+            elapsed = time.perf_counter() - started
+    finally:
+        app.dependency_overrides.clear()
+
+    assert all(r.status_code == 200 for r in responses)
+    assert peak == CONCURRENT_REQUESTS
+    assert elapsed < UPSTREAM_DELAY * CONCURRENT_REQUESTS / 2
+
+
+def test_upstream_failure_maps_to_502(api_user):
+    """Upstream status errors surface as 502 like the OpenAI-compatible routes"""
+    mock_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(500))
+    )
+    app.dependency_overrides[get_upstream_client] = lambda: mock_client
+    token = create_access_token(data={"sub": api_user.username})
+    try:
+        response = TestClient(app).post(
+            "/chat/completions",
+            json={"messages": [{"role": "user", "content": "hi"}]},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 502
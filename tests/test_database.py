@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.dependencies.database import async_database_url, create_engines
+from app.models.user import ApiCall, Base
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("sqlite:///./llm_users.db", "sqlite+aiosqlite:///./llm_users.db"),
+        (
+            "postgresql://u:p@db/llm",
+            "postgresql+asyncpg://u:p@db/llm",
+        ),
+        (
+            "postgresql+psycopg2://u:p@db/llm",
+            "postgresql+asyncpg://u:p@db/llm",
+        ),
+        ("sqlite+aiosqlite:///x.db", "sqlite+aiosqlite:///x.db"),
+    ],
+)
+def test_async_database_url(url, expected):
+    assert async_database_url(url) == expected
+
+
+@pytest.fixture
+def production_engines(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "sqlite_profile", "production")
+    writer, reader = create_engines(f"sqlite:///{tmp_path}/profile.db")
+    Base.metadata.create_all(bind=writer)
+    yield writer, reader
+    writer.dispose()
+    reader.dispose()
+
+
+def test_production_profile_applies_pragmas(production_engines):
+    writer, reader = production_engines
+    with writer.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert conn.exec_driver_sql("PRAGMA temp_store").scalar() == 2  # MEMORY
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == (
+            settings.sqlite_busy_timeout
+        )
+    assert writer.pool.size() == 1
+
+    with reader.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.exec_driver_sql("DELETE FROM api_calls")
+
+
+def test_concurrent_writers_queue_for_the_single_connection(production_engines):
+    writer, reader = production_engines
+    errors = []
+
+    def insert_calls():
+        try:
+            for _ in range(25):
+                with Session(writer) as db:
+                    db.add(ApiCall(user_id=1, endpoint="/v1/completions"))
+                    db.commit()
+                with Session(reader) as db:
+                    db.query(ApiCall).count()
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=insert_calls) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with Session(reader) as db:
+        assert db.query(ApiCall).count() == 200
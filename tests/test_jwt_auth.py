@@ -0,0 +1,50 @@
+from app.utils.security import access_token_claims, create_access_token
+
+
+def _headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_token_carries_user_id_and_version(api_user):
+    claims = access_token_claims(api_user)
+
+    assert claims == {"sub": api_user.username, "uid": api_user.id, "ver": 0}
+
+
+def test_billing_reads_skip_the_user_lookup(client, api_user, user_lookups):
+    token = create_access_token(data=access_token_claims(api_user))
+
+    for _ in range(3):
+        response = client.get("/users/billing/calls", headers=_headers(token))
+        assert response.status_code == 200
+        assert response.json()["user_id"] == api_user.id
+
+    assert len(user_lookups) == 1
+
+
+def test_revoke_invalidates_issued_tokens(client, api_user):
+    token = create_access_token(data=access_token_claims(api_user))
+    assert client.get("/users/me", headers=_headers(token)).status_code == 200
+
+    response = client.post("/auth/revoke", headers=_headers(token))
+
+    assert response.status_code == 200
+    assert client.get("/users/me", headers=_headers(token)).status_code == 401
+
+
+def test_token_without_user_id_is_still_accepted(client, api_user):
+    token = create_access_token(data={"sub": api_user.username})
+
+    response = client.get("/users/me", headers=_headers(token))
+
+    assert response.status_code == 200
+    assert response.json()["id"] == api_user.id
+
+
+def test_deleted_user_token_is_rejected(client, api_user):
+    token = create_access_token(data=access_token_claims(api_user))
+    assert client.delete("/users/me", headers=_headers(token)).status_code == 200
+
+    assert (
+        client.get("/users/billing/calls", headers=_headers(token)).status_code == 401
+    )
@@ -9,3 +9,69 @@ def test_root():
     response = client.get("/")
     assert response.status_code == 200
     assert response.json() == {"message": "LLM User Management API"}
+
+
+def test_production_profile_serves_and_shuts_down_cleanly(
+    run_with_production_profile,
+):
+    result = run_with_production_profile(
+        """
+        async def serve(round):
+            credentials = [
+                {"username": f"user_{round}_{i}", "password": "pw-123456"}
+                for i in range(4)
+            ]
+            async with app.router.lifespan_context(app), httpx.AsyncClient(
+                app=app, base_url="http://test"
+            ) as client:
+                registered = await asyncio.gather(
+                    *(client.post("/auth/register", json=c) for c in credentials)
+                )
+                headers = {
+                    "Authorization": f"Bearer {registered[0].json()['api_key']}"
+                }
+
+                async def complete():
+                    started = time.perf_counter()
+                    response = await client.post(
+                        "/v1/completions",
+                        json={"model": "m", "prompt": "hi"},
+                        headers=headers,
+                    )
+                    return response.status_code, time.perf_counter() - started
+
+                logins = [client.post("/auth/token", data=c) for c in credentials]
+                responses = await asyncio.gather(
+                    *logins, *(complete() for _ in range(8))
+                )
+            return {
+                "register": sorted({r.status_code for r in registered}),
+                "login": sorted({r.status_code for r in responses[:4]}),
+                "completion": sorted({status for status, _ in responses[4:]}),
+                "latency": max(latency for _, latency in responses[4:]),
+            }
+
+        # A second lifespan in the same process reuses the disposed engines
+        rounds = [asyncio.run(serve(round)) for round in range(2)]
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            threads = [
+                thread.name
+                for thread in threading.enumerate()
+                if thread is not threading.main_thread() and not thread.daemon
+            ]
+            if not threads:
+                break
+            time.sleep(0.05)
+        print(json.dumps({"rounds": rounds, "threads": threads}))
+        """
+    )
+
+    for round in result["rounds"]:
+        assert round["register"] == [200]
+        assert round["login"] == [200]
+        assert round["completion"] == [200]
+        assert round["latency"] < 1.0
+    # aiosqlite connections and the bcrypt pool's threads are all gone
+    assert result["threads"] == []
@@ -0,0 +1,128 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+
+from app.dependencies.database import read_engine
+from app.main import app
+from app.models.user import Base
+from app.services.auth_cache import authenticate_api_key
+from app.services.usage_writer import UsageEvent, UsageWriter
+from app.utils.security import access_token_claims, create_access_token
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+@pytest.fixture
+def migrated():
+    """Run migrations against a fresh SQLite file: ``migrated(revision)``"""
+    url = f"sqlite:///{tempfile.mkdtemp(prefix='migrations_')}/db.sqlite"
+    config = Config(
+        os.path.join(ROOT, "alembic.ini"), attributes={"configure_logger": False}
+    )
+    config.set_main_option("sqlalchemy.url", url)
+    engine = create_engine(url)
+
+    def upgrade(revision="head"):
+        command.upgrade(config, revision)
+        return engine
+
+    yield upgrade
+    engine.dispose()
+
+
+def test_migration_history_builds_the_model_schema(migrated):
+    engine = migrated()
+
+    with engine.connect() as conn:
+        assert compare_metadata(MigrationContext.configure(conn), Base.metadata) == []
+
+
+def test_pre_migration_database_is_upgraded_in_place(migrated):
+    engine = migrated("0001")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO users (username, hashed_password, api_key) "
+                "VALUES ('old', 'x', 'sk-legacy-plaintext-key-0123456789')"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO api_calls (user_id, timestamp, model, tokens_used) "
+                "VALUES (1, '2026-01-05 10:30:00', 'm', 12)"
+            )
+        )
+
+    migrated()
+
+    with Session(engine) as db:
+        principal = authenticate_api_key("sk-legacy-plaintext-key-0123456789", db)
+        assert principal is not None and principal.scheduling_weight == 1.0
+        # New columns are backfilled with their defaults
+        assert db.execute(
+            text("SELECT cached, prompt_tokens, completion_tokens FROM api_calls")
+        ).one() == (0, 0, 0)
+        # History is rolled up
+        assert db.execute(
+            text("SELECT bucket, model, call_count, tokens_used FROM usage_daily")
+        ).one() == ("2026-01-05", "m", 1, 12.0)
+
+
+def _plans(conn, statements):
+    plans = []
+    for statement, parameters in statements:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        plans.append((statement, [row[-1] for row in rows]))
+    return plans
+
+
+def test_billing_queries_use_the_indexes(api_user):
+    now = datetime.utcnow()
+    UsageWriter(queue_size=10, batch_size=10, flush_interval=0.0).write(
+        [
+            UsageEvent({"user_id": api_user.id, "timestamp": now - timedelta(hours=1)}),
+            UsageEvent({"user_id": api_user.id, "timestamp": now}),
+        ]
+    )
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if "FROM api_calls" in statement or "FROM usage_" in statement:
+            statements.append((statement, parameters))
+
+    headers = {
+        "Authorization": "Bearer "
+        + create_access_token(data=access_token_claims(api_user))
+    }
+    client = TestClient(app)
+    event.listen(read_engine, "before_cursor_execute", before_execute)
+    try:
+        for path in (
+            f"/users/billing/calls?start_date={now.date()}&end_date={now.date()}",
+            "/users/billing/daily",
+            f"/users/billing/summary?month={now.month}&year={now.year}",
+        ):
+            assert client.get(path, headers=headers).status_code == 200
+    finally:
+        event.remove(read_engine, "before_cursor_execute", before_execute)
+
+    with read_engine.connect() as conn:
+        plans = _plans(conn, statements)
+    # calls page and count, daily totals twice, model totals, first/last hour
+    # and the first and last call
+    assert len(plans) == 8
+    for statement, plan in plans:
+        searches = [step for step in plan if step.startswith("SEARCH")]
+        assert searches and not any(step.startswith("SCAN") for step in plan), plan
+        assert "USE TEMP B-TREE FOR ORDER BY" not in plan, plan
+        if "FROM api_calls" in statement:
+            assert all("ix_api_calls_user_id_timestamp" in s for s in searches), plan
@@ -0,0 +1,97 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.backends import Backend, BackendPool, get_backend_pool
+from app.services.model_catalog import FALLBACK_MODELS, ModelCatalog, get_model_catalog
+from app.services.upstream import get_upstream_client
+
+
+def _model(model_id, max_model_len=4096):
+    return {"id": model_id, "object": "model", "max_model_len": max_model_len}
+
+
+@pytest.fixture
+def backends():
+    """Two replicas whose model lists the tests can change or take down"""
+    state = {
+        "a": [_model("llama", 8192)],
+        "b": [_model("llama", 8192), _model("qwen", 32768)],
+        "requests": 0,
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        state["requests"] += 1
+        models = state.get(request.url.host)
+        if models is None:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"object": "list", "data": models})
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    pool = BackendPool([Backend("http://a"), Backend("http://b")])
+    catalog = ModelCatalog()
+    app.dependency_overrides[get_upstream_client] = lambda: mock_client
+    app.dependency_overrides[get_backend_pool] = lambda: pool
+    app.dependency_overrides[get_model_catalog] = lambda: catalog
+    yield state, catalog, mock_client, pool
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.asyncio
+async def test_models_are_merged_across_backends(backends):
+    _, catalog, mock_client, pool = backends
+    assert await catalog.refresh(mock_client, pool)
+
+    response = TestClient(app).get("/v1/models")
+
+    assert response.status_code == 200
+    assert [m["id"] for m in response.json()["data"]] == ["llama", "qwen"]
+    assert catalog.max_model_len("qwen") == 32768
+    assert catalog.max_model_len("unknown") is None
+
+
+@pytest.mark.asyncio
+async def test_if_none_match_returns_304(backends):
+    _, catalog, mock_client, pool = backends
+    await catalog.refresh(mock_client, pool)
+    client = TestClient(app)
+    etag = client.get("/v1/models").headers["etag"]
+
+    response = client.get("/v1/models", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+@pytest.mark.asyncio
+async def test_stale_list_is_served_while_backends_are_down(backends):
+    state, catalog, mock_client, pool = backends
+    assert await catalog.refresh(mock_client, pool)
+    before = catalog.snapshot()
+
+    del state["a"], state["b"]
+    assert not await catalog.refresh(mock_client, pool)
+
+    assert catalog.snapshot() == before
+
+
+@pytest.mark.asyncio
+async def test_fallback_is_used_until_first_successful_refresh(backends):
+    state, catalog, mock_client, pool = backends
+    del state["a"], state["b"]
+    assert not await catalog.refresh(mock_client, pool)
+
+    response = TestClient(app).get("/v1/models")
+
+    assert response.json() == FALLBACK_MODELS
+
+
+def test_models_never_wait_for_the_backends(backends):
+    state, _, _, _ = backends
+
+    # Before the background refresh has run, the fallback is served at once
+    response = TestClient(app).get("/v1/models")
+
+    assert response.json() == FALLBACK_MODELS
+    assert state["requests"] == 0
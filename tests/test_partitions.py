@@ -0,0 +1,104 @@
+import os
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from app.config import settings
+from app.dependencies.database import create_engines, engine
+from app.models.user import ApiCall, Base, User
+from app.services.partitions import (
+    add_months,
+    drop_partitions_before,
+    ensure_partitions,
+    list_partitions,
+    maintain_partitions,
+    partition_ddl,
+    partition_name,
+)
+
+# Set to run the PostgreSQL tests, e.g. postgresql://postgres@localhost/test
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+
+def test_month_arithmetic_and_names():
+    assert add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert partition_name(date(2026, 3, 1)) == "api_calls_y2026m03"
+    assert partition_ddl(date(2026, 12, 17)) == (
+        "CREATE TABLE IF NOT EXISTS api_calls_y2026m12 PARTITION OF api_calls "
+        "FOR VALUES FROM ('2026-12-01') TO ('2027-01-01')"
+    )
+
+
+def test_postgres_table_is_range_partitioned_by_timestamp():
+    ddl = str(CreateTable(ApiCall.__table__).compile(dialect=postgresql.dialect()))
+
+    assert "PARTITION BY RANGE (timestamp)" in ddl
+    # The partition key has to be part of the primary key
+    assert "PRIMARY KEY (id, timestamp)" in ddl
+
+
+def test_postgres_engines_use_the_pool_settings():
+    calls = []
+
+    def create(url, **options):
+        calls.append(options)
+        return object()
+
+    writer, reader = create_engines("postgresql://u:p@db/llm", create=create)
+
+    assert writer is reader
+    assert calls == [
+        {
+            "poolclass": calls[0]["poolclass"],
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "pool_timeout": settings.db_pool_timeout,
+            "pool_recycle": settings.db_pool_recycle,
+            "pool_pre_ping": settings.db_pool_pre_ping,
+        }
+    ]
+
+
+def test_maintenance_is_a_no_op_on_sqlite():
+    assert maintain_partitions(engine) == []
+
+
+@pytest.fixture
+def pg_engine():
+    if not POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    pg = create_engine(POSTGRES_URL)
+    Base.metadata.drop_all(bind=pg)
+    Base.metadata.create_all(bind=pg)
+    yield pg
+    Base.metadata.drop_all(bind=pg)
+    pg.dispose()
+
+
+def test_partitions_are_created_ahead_and_dropped_cheaply(pg_engine):
+    today = date(2026, 10, 17)
+    with pg_engine.begin() as conn:
+        assert ensure_partitions(conn, today, months_ahead=2) == [
+            "api_calls_y2026m10",
+            "api_calls_y2026m11",
+            "api_calls_y2026m12",
+        ]
+        conn.execute(text(partition_ddl(date(2026, 8, 1))))
+        user_id = conn.execute(
+            insert(User).values(username="pg", hashed_password="x").returning(User.id)
+        ).scalar()
+        conn.execute(
+            insert(ApiCall),
+            [
+                {"user_id": user_id, "timestamp": datetime(2026, 8, 3)},
+                {"user_id": user_id, "timestamp": datetime(2026, 10, 5)},
+            ],
+        )
+
+        assert drop_partitions_before(conn, date(2026, 10, 1)) == ["api_calls_y2026m08"]
+        assert list_partitions(conn)[0] == "api_calls_y2026m10"
+        assert conn.execute(text("SELECT COUNT(*) FROM api_calls")).scalar() == 1
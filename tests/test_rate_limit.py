@@ -0,0 +1,98 @@
+import httpx
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.services.auth_cache import Principal, api_key_cache, user_cache
+from app.services.rate_limit import RateLimiter, rate_limiter
+from app.services.upstream import get_upstream_client
+
+
+def _principal(rpm=None, tpm=None):
+    return Principal(
+        id=1, username="u", token_limit=10**9, rpm_limit=rpm, tpm_limit=tpm
+    )
+
+
+def test_requests_per_minute_and_headers():
+    limiter = RateLimiter()
+    user = _principal(rpm=3, tpm=0)
+
+    headers = [limiter.check(user, tokens=10) for _ in range(3)]
+    with pytest.raises(HTTPException) as excinfo:
+        limiter.check(user, tokens=10)
+
+    assert [h["x-ratelimit-remaining-requests"] for h in headers] == ["2", "1", "0"]
+    assert headers[0]["x-ratelimit-limit-requests"] == "3"
+    assert headers[0]["x-ratelimit-reset-requests"] == "20s"
+    assert "x-ratelimit-limit-tokens" not in headers[0]
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers["Retry-After"] == "20"
+
+
+def test_tokens_per_minute_rejection_consumes_nothing():
+    limiter = RateLimiter()
+    user = _principal(rpm=100, tpm=1000)
+
+    limiter.check(user, tokens=900)
+    with pytest.raises(HTTPException):
+        limiter.check(user, tokens=200)
+    headers = limiter.check(user, tokens=100)
+
+    assert headers["x-ratelimit-remaining-tokens"] == "0"
+    assert headers["x-ratelimit-remaining-requests"] == "98"
+
+
+def test_defaults_apply_when_user_has_no_override(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_rpm", 1)
+    limiter = RateLimiter()
+
+    limiter.check(_principal(), tokens=1)
+    with pytest.raises(HTTPException):
+        limiter.check(_principal(), tokens=1)
+    # An explicit 0 disables the limit for that user
+    limiter.check(_principal(rpm=0), tokens=1)
+
+
+def test_per_key_limit_is_separate_from_user_limit(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_key_rpm", 1)
+    limiter = RateLimiter()
+    user = _principal(rpm=10)
+
+    limiter.check(user, tokens=1, key_id="aaa")
+    limiter.check(user, tokens=1, key_id="bbb")
+    with pytest.raises(HTTPException):
+        limiter.check(user, tokens=1, key_id="aaa")
+
+
+def test_proxied_call_returns_rate_limit_headers(api_user, db):
+    api_user.rpm_limit = 1
+    db.commit()
+    api_key_cache.clear()
+    user_cache.clear()
+    rate_limiter.clear()
+    mock_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, json={"choices": [{"text": "ok"}]})
+        )
+    )
+    app.dependency_overrides[get_upstream_client] = lambda: mock_client
+    try:
+        client = TestClient(app)
+        headers = {"Authorization": f"Bearer {api_user.api_key}"}
+        body = {"model": "m", "prompt": "hi"}
+        first = client.post("/v1/completions", json=body, headers=headers)
+        second = client.post("/v1/completions", json=body, headers=headers)
+    finally:
+        app.dependency_overrides.clear()
+        api_key_cache.clear()
+        user_cache.clear()
+        rate_limiter.clear()
+
+    assert first.status_code == 200
+    assert first.headers["x-ratelimit-limit-requests"] == "1"
+    assert first.headers["x-ratelimit-remaining-requests"] == "0"
+    assert second.status_code == 429
+    assert "retry-after" in second.headers
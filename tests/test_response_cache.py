@@ -0,0 +1,106 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.models.user import ApiCall
+from app.services import response_cache as rc
+from app.services.upstream import get_upstream_client
+
+
+@pytest.fixture
+def cache_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "response_cache_enabled", True)
+    rc.response_cache.clear()
+    yield rc.response_cache
+    rc.response_cache.clear()
+
+
+@pytest.fixture
+def upstream_calls():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        choice = {"text": "four", "finish_reason": "stop"}
+        return httpx.Response(200, json={"id": "cmpl-1", "choices": [choice]})
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    app.dependency_overrides[get_upstream_client] = lambda: mock_client
+    yield calls
+    app.dependency_overrides.clear()
+
+
+def test_lru_evicts_least_recently_used():
+    cache = rc.ResponseCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_entries_expire_after_ttl():
+    cache = rc.ResponseCache(max_entries=2, ttl=-1)
+    cache.set("a", 1)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_only_deterministic_requests_are_cacheable():
+    body = {"model": "m", "prompt": "2+2=", "temperature": 0, "max_tokens": 5}
+
+    assert rc.cache_key("/v1/completions", body) is not None
+    assert rc.cache_key("/v1/completions", dict(body, stream=True)) is None
+    assert rc.cache_key("/v1/completions", dict(body, temperature=0.7)) is None
+    assert rc.cache_key("/v1/completions", {"prompt": "2+2="}) is None
+    # Key order does not matter, sampling parameters do
+    assert rc.cache_key("/v1/completions", dict(reversed(body.items()))) == (
+        rc.cache_key("/v1/completions", body)
+    )
+    assert rc.cache_key("/v1/completions", dict(body, max_tokens=6)) != (
+        rc.cache_key("/v1/completions", body)
+    )
+
+
+def test_repeated_request_is_served_from_cache(
+    api_user, db, cache_enabled, upstream_calls
+):
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {api_user.api_key}"}
+    body = {"model": "m", "prompt": "two plus two", "temperature": 0}
+
+    first = client.post("/v1/completions", json=body, headers=headers)
+    second = client.post("/v1/completions", json=body, headers=headers)
+
+    assert first.headers[rc.CACHE_HEADER] == "MISS"
+    assert second.headers[rc.CACHE_HEADER] == "HIT"
+    assert second.json() == first.json()
+    assert len(upstream_calls) == 1
+
+    calls = (
+        db.query(ApiCall)
+        .filter(ApiCall.user_id == api_user.id)
+        .order_by(ApiCall.id)
+        .all()
+    )
+    assert [c.cached for c in calls] == [False, True]
+
+
+def test_no_cache_header_bypasses_cache(api_user, cache_enabled, upstream_calls):
+    client = TestClient(app)
+    headers = {
+        "Authorization": f"Bearer {api_user.api_key}",
+        "Cache-Control": "no-cache",
+    }
+    body = {"model": "m", "prompt": "two plus two", "temperature": 0}
+
+    client.post("/v1/completions", json=body, headers=headers)
+    response = client.post("/v1/completions", json=body, headers=headers)
+
+    assert rc.CACHE_HEADER not in response.headers
+    assert len(upstream_calls) == 2
@@ -0,0 +1,127 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.dependencies.database import read_engine
+from app.main import app
+from app.models.user import UsageDaily, UsageHourly
+from app.services.rollups import rebuild_rollups
+from app.services.usage_writer import UsageEvent, UsageWriter
+from app.utils.security import access_token_claims, create_access_token
+
+
+@pytest.fixture
+def raw_reads():
+    """Record SELECTs against api_calls made through the read pool"""
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "api_calls" in statement:
+            statements.append(statement)
+
+    event.listen(read_engine, "before_cursor_execute", before_execute)
+    yield statements
+    event.remove(read_engine, "before_cursor_execute", before_execute)
+
+
+def _event(user, timestamp, model="m", prompt=3, completion=4, cost=0.5):
+    return UsageEvent(
+        {
+            "user_id": user.id,
+            "endpoint": "/v1/chat/completions",
+            "timestamp": timestamp,
+            "model": model,
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "tokens_used": prompt + completion,
+            "estimated_cost": cost,
+        }
+    )
+
+
+def _rollup(db, table, user):
+    db.expire_all()
+    rows = db.query(table).filter(table.user_id == user.id).order_by(table.bucket)
+    return [
+        (r.bucket, r.model, r.call_count, r.prompt_tokens, r.completion_tokens)
+        for r in rows
+    ]
+
+
+def test_batches_accumulate_into_hourly_and_daily_buckets(api_user, db):
+    writer = UsageWriter(queue_size=10, batch_size=10, flush_interval=0.0)
+    writer.write(
+        [
+            _event(api_user, datetime(2026, 3, 1, 9, 5)),
+            _event(api_user, datetime(2026, 3, 1, 9, 55), prompt=10),
+            _event(api_user, datetime(2026, 3, 1, 10, 1), model=None),
+        ]
+    )
+    # A later batch adds to the existing buckets
+    writer.write([_event(api_user, datetime(2026, 3, 1, 9, 30))])
+
+    assert _rollup(db, UsageHourly, api_user) == [
+        (datetime(2026, 3, 1, 9), "m", 3, 16, 12),
+        (datetime(2026, 3, 1, 10), "", 1, 3, 4),
+    ]
+    assert _rollup(db, UsageDaily, api_user) == [
+        (date(2026, 3, 1), "", 1, 3, 4),
+        (date(2026, 3, 1), "m", 3, 16, 12),
+    ]
+
+
+def test_rebuild_matches_incremental_rollups(api_user, db):
+    writer = UsageWriter(queue_size=10, batch_size=10, flush_interval=0.0)
+    writer.write(
+        [
+            _event(api_user, datetime(2026, 4, 2, 23, 59)),
+            _event(api_user, datetime(2026, 4, 3, 0, 0), model="other"),
+        ]
+    )
+    hourly = _rollup(db, UsageHourly, api_user)
+    daily = _rollup(db, UsageDaily, api_user)
+
+    rebuild_rollups(db)
+    db.commit()
+
+    assert _rollup(db, UsageHourly, api_user) == hourly
+    assert _rollup(db, UsageDaily, api_user) == daily
+
+
+def test_billing_endpoints_read_the_rollups(api_user, raw_reads):
+    now = datetime.utcnow()
+    writer = UsageWriter(queue_size=10, batch_size=10, flush_interval=0.0)
+    writer.write(
+        [
+            _event(api_user, now - timedelta(days=2)),
+            _event(api_user, now),
+            _event(api_user, now, model="other", cost=1.0),
+        ]
+    )
+    headers = {
+        "Authorization": "Bearer "
+        + create_access_token(data=access_token_claims(api_user))
+    }
+    client = TestClient(app)
+
+    daily = client.get("/users/billing/daily?days=7", headers=headers).json()
+    assert [d["call_count"] for d in daily["daily_usage"]] == [1, 2]
+    assert daily["summary"] == {
+        "total_calls": 3,
+        "total_tokens": 21.0,
+        "total_cost": 2.0,
+    }
+    # The daily view never reads api_calls, however long the history
+    assert raw_reads == []
+
+    summary = client.get(
+        f"/users/billing/summary?month={now.month}&year={now.year}", headers=headers
+    ).json()
+    assert summary["summary"]["last_call"] == now.isoformat()
+    assert {"model": "other", "calls": 1} in [
+        {"model": m["model"], "calls": m["calls"]} for m in summary["model_breakdown"]
+    ]
+    # Only the first and last hour of the month are read from api_calls
+    assert len(raw_reads) == 2
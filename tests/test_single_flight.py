@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.main import app
+from app.models.user import User
+from app.services.single_flight import SingleFlight
+from app.services.upstream import get_upstream_client
+from app.utils.security import issue_api_key
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_result():
+    flights = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"answer": 42}
+
+    results = await asyncio.gather(*(flights.do("k", fetch) for _ in range(5)))
+
+    assert calls == 1
+    assert results == [{"answer": 42}] * 5
+    assert len(flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_failures_are_shared_and_not_cached():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise httpx.ConnectError("down")
+
+    results = await asyncio.gather(
+        *(flights.do("k", fail) for _ in range(3)), return_exceptions=True
+    )
+
+    assert all(isinstance(r, httpx.ConnectError) for r in results)
+    assert await flights.do("k", lambda: asyncio.sleep(0, result="ok")) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_hit_upstream_once_and_bill_each_user(api_user, db):
+    """A burst of identical deterministic requests costs one generation"""
+    other = User(
+        username=f"{api_user.username}_2",
+        hashed_password="not-used",
+        token_limit=1_000_000,
+        tokens_used=0,
+    )
+    db.add(other)
+    db.flush()
+    other_key, _ = issue_api_key(db, other.id)
+    db.commit()
+
+    upstream_calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={"choices": [{"text": "four"}]})
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    app.dependency_overrides[get_upstream_client] = lambda: mock_client
+    body = {"model": "m", "prompt": "two plus two", "temperature": 0}
+    keys = [api_user.api_key, other_key] * 3
+
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            responses = await asyncio.gather(
+                *(
+                    client.post(
+                        "/v1/completions",
+                        json=body,
+                        headers={"Authorization": f"Bearer {key}"},
+                    )
+                    for key in keys
+                )
+            )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert all(r.status_code == 200 for r in responses)
+    assert upstream_calls == 1
+
+    db.expire_all()
+    first = db.get(User, api_user.id)
+    second = db.get(User, other.id)
+    assert first.tokens_used > 0
+    assert first.tokens_used == second.tokens_used
@@ -0,0 +1,73 @@
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models.user import ApiCall
+from app.services.upstream import get_upstream_client
+
+
+def _sse(*events):
+    body = "".join(f"data: {json.dumps(event)}\n\n" for event in events)
+    return body + "data: [DONE]\n\n"
+
+
+def _completion_chunk(text, finish_reason=None):
+    return {
+        "id": "cmpl-1",
+        "object": "text_completion",
+        "created": 1,
+        "choices": [{"index": 0, "text": text, "finish_reason": finish_reason}],
+    }
+
+
+def test_chat_stream_relays_chunks_and_settles_once(api_user, db):
+    """Streamed completions are relayed as chat chunks and usage is settled once"""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)["stream"] is True
+        body = _sse(
+            _completion_chunk("Hel"),
+            _completion_chunk("lo"),
+            _completion_chunk("!", finish_reason="stop"),
+        )
+        return httpx.Response(
+            200, text=body, headers={"content-type": "text/event-stream"}
+        )
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    app.dependency_overrides[get_upstream_client] = lambda: mock_client
+    try:
+        response = TestClient(app).post(
+            "/v1/chat/completions",
+            headers={"Authorization": f"Bearer {api_user.api_key}"},
+            json={
+                "model": "test-model",
+                "stream": True,
+                "messages": [{"role": "user", "content": "hello world"}],
+            },
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = [
+        line[len("data: ") :]
+        for line in response.text.splitlines()
+        if line.startswith("data: ")
+    ]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    assert [c["object"] for c in chunks] == ["chat.completion.chunk"] * 3
+    assert chunks[0]["choices"][0]["delta"] == {"role": "assistant", "content": "Hel"}
+    assert "".join(c["choices"][0]["delta"]["content"] for c in chunks) == "Hello!"
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+
+    # Three estimated prompt tokens ("hello world") plus three streamed, written once
+    calls = db.query(ApiCall).filter(ApiCall.user_id == api_user.id).all()
+    assert [(c.prompt_tokens, c.completion_tokens) for c in calls] == [(3, 3)]
+    db.refresh(api_user)
+    assert api_user.tokens_used == 6
@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+from app.services.token_counter import TokenCounter, estimate_tokens
+
+
+class CharTokenizer:
+    """One token per character, counting how much text it was given"""
+
+    def __init__(self):
+        self.chars_seen = 0
+
+    def encode(self, text, add_special_tokens=False):
+        self.chars_seen += len(text)
+        return list(text)
+
+
+def _counter(**kwargs):
+    options = dict(
+        tokenizer_dir=None,
+        download=False,
+        cache_max_entries=128,
+        cache_ttl=60.0,
+        offload_chars=1_000_000,
+    )
+    options.update(kwargs)
+    return TokenCounter(**options)
+
+
+def test_estimate_does_not_undercount_code():
+    code = "def f(x):return{'a':[x,x**2]}"
+
+    assert estimate_tokens("hello world") == 3
+    assert estimate_tokens(code) == 8
+
+
+@pytest.mark.asyncio
+async def test_registered_tokenizer_is_used_per_model():
+    counter = _counter()
+    counter.register("char-model", CharTokenizer())
+
+    assert await counter.count_text("char-model", "hello") == 5
+    assert await counter.count_text("other-model", "hello") == estimate_tokens("hello")
+
+
+@pytest.mark.asyncio
+async def test_growing_conversation_only_tokenizes_new_turns():
+    tokenizer = CharTokenizer()
+    counter = _counter()
+    counter.register("m", tokenizer)
+    history = [
+        {"role": "system", "content": "be brief"},
+        {"role": "user", "content": "hi"},
+    ]
+
+    assert await counter.count_messages("m", history) == 10
+    assert tokenizer.chars_seen == 10
+
+    history += [
+        {"role": "assistant", "content": "hello"},
+        {"role": "user", "content": [{"type": "text", "text": "bye"}]},
+    ]
+    assert await counter.count_messages("m", history) == 18
+    assert tokenizer.chars_seen == 18
+
+    assert await counter.count_messages("m", history) == 18
+    assert tokenizer.chars_seen == 18
+
+
+@pytest.mark.asyncio
+async def test_large_inputs_are_tokenized_off_the_event_loop():
+    threads = []
+
+    class RecordingTokenizer(CharTokenizer):
+        def encode(self, text, add_special_tokens=False):
+            threads.append(threading.current_thread())
+            return super().encode(text)
+
+    counter = _counter(offload_chars=100)
+    counter.register("m", RecordingTokenizer())
+
+    await counter.count_text("m", "short")
+    await counter.count_text("m", "x" * 100)
+
+    assert threads[0] is threading.main_thread()
+    assert threads[1] is not threading.main_thread()
+
+
+@pytest.mark.asyncio
+async def test_only_served_models_are_loaded_off_the_event_loop(monkeypatch):
+    loads = []
+
+    def load(model):
+        loads.append((model, threading.current_thread()))
+        return CharTokenizer()
+
+    counter = _counter(is_served=lambda model: model.startswith("served"))
+    monkeypatch.setattr(counter, "_load", load)
+
+    assert await counter.count_text("made-up/model", "hello") == estimate_tokens(
+        "hello"
+    )
+    assert await counter.count_text("served-a", "hello") == 5
+    # The sync count reuses the loaded tokenizer
+    assert counter.count("served-a", "hi") == 2
+
+    assert [model for model, _ in loads] == ["served-a"]
+    assert loads[0][1] is not threading.main_thread()
+
+
+@pytest.mark.asyncio
+async def test_loaded_tokenizers_are_bounded(monkeypatch):
+    loads = []
+    counter = _counter(max_loaded=2, is_served=lambda model: True)
+    monkeypatch.setattr(counter, "_load", lambda model: loads.append(model))
+
+    for i, model in enumerate(("a", "b", "a", "c", "a", "b")):
+        await counter.count_text(model, f"prompt {i}")
+
+    # Models without a tokenizer are remembered too, least recently used first out
+    assert loads == ["a", "b", "c", "b"]
+    assert len(counter._tokenizers) == 2
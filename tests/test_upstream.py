@@ -0,0 +1,45 @@
+import httpx
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import upstream
+
+
+def test_lifespan_creates_and_closes_shared_client():
+    """The upstream client is created once at startup and closed at shutdown"""
+    with TestClient(app):
+        client = upstream.get_upstream_client()
+        assert client is upstream.get_upstream_client()
+        assert not client.is_closed
+
+    assert client.is_closed
+    assert upstream._client is None
+
+
+def test_routes_use_the_injected_client(api_user):
+    """Routers proxy through the injected upstream client"""
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"text": "ok"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1},
+            },
+        )
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    app.dependency_overrides[upstream.get_upstream_client] = lambda: mock_client
+    try:
+        response = TestClient(app).post(
+            "/v1/completions",
+            json={"model": "m", "prompt": "hi"},
+            headers={"Authorization": f"Bearer {api_user.api_key}"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert seen == ["/v1/completions"]
@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.upstream import get_upstream_client
+
+
+@pytest.fixture
+def upstream():
+    """Route upstream calls to a handler set by the test"""
+    state = {"handler": None, "requests": []}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        state["requests"].append(json.loads(request.content))
+        return state["handler"](request)
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    app.dependency_overrides[get_upstream_client] = lambda: mock_client
+    yield state
+    app.dependency_overrides.clear()
+
+
+def test_reservation_is_settled_with_reported_usage(
+    api_user, db, upstream, writes, calls
+):
+    upstream["handler"] = lambda request: httpx.Response(
+        200,
+        json={
+            "choices": [{"text": "four"}],
+            "usage": {"prompt_tokens": 7, "completion_tokens": 11},
+        },
+    )
+
+    response = TestClient(app).post(
+        "/v1/completions",
+        json={"model": "m", "prompt": "two plus two"},
+        headers={"Authorization": f"Bearer {api_user.api_key}"},
+    )
+
+    assert response.status_code == 200
+    calls = calls(api_user)
+    assert [(c.prompt_tokens, c.completion_tokens, c.tokens_used) for c in calls] == [
+        (7, 11, 18)
+    ]
+    db.refresh(api_user)
+    assert api_user.tokens_used == 18
+    # One conditional reservation, then one write settling the real usage
+    # and adding the call to the rollups
+    assert writes == [
+        "UPDATE users",
+        "UPDATE users",
+        "INSERT INTO api_calls",
+        "INSERT INTO usage_hourly",
+        "INSERT INTO usage_daily",
+    ]
+
+
+def test_stream_usage_chunk_is_used_but_not_relayed(api_user, db, upstream, calls):
+    chunks = [
+        {"choices": [{"index": 0, "text": "Hi", "finish_reason": "stop"}]},
+        {"choices": [], "usage": {"prompt_tokens": 9, "completion_tokens": 2}},
+    ]
+    body = "".join(f"data: {json.dumps(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+    upstream["handler"] = lambda request: httpx.Response(
+        200, text=body, headers={"content-type": "text/event-stream"}
+    )
+
+    response = TestClient(app).post(
+        "/v1/completions",
+        json={"model": "m", "prompt": "hello", "stream": True},
+        headers={"Authorization": f"Bearer {api_user.api_key}"},
+    )
+
+    assert upstream["requests"][0]["stream_options"] == {"include_usage": True}
+    assert "usage" not in response.text
+    calls = calls(api_user)
+    assert [(c.prompt_tokens, c.completion_tokens) for c in calls] == [(9, 2)]
+
+
+def test_failed_call_is_logged_without_charge(api_user, db, upstream, calls):
+    upstream["handler"] = lambda request: httpx.Response(500, json={})
+
+    response = TestClient(app).post(
+        "/v1/completions",
+        json={"model": "m", "prompt": "hello"},
+        headers={"Authorization": f"Bearer {api_user.api_key}"},
+    )
+
+    assert response.status_code == 502
+    calls = calls(api_user)
+    assert [(c.status_code, c.tokens_used) for c in calls] == [(502, 0)]
+    db.refresh(api_user)
+    assert api_user.tokens_used == 0
+
+
+@pytest.mark.asyncio
+async def test_parallel_requests_cannot_overshoot_the_limit(api_user, db, upstream):
+    api_user.token_limit = 25
+    db.commit()
+
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"text": "ok"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 3},
+            },
+        )
+
+    async def rejected(requests, count):
+        while sum(request.done() for request in requests) < count:
+            await asyncio.sleep(0.01)
+
+    upstream["handler"] = handler
+    headers = {"Authorization": f"Bearer {api_user.api_key}"}
+    body = {"model": "m", "prompt": "hi", "max_tokens": 10}
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        requests = [
+            asyncio.ensure_future(
+                client.post("/v1/completions", json=body, headers=headers)
+            )
+            for _ in range(6)
+        ]
+        # Hold the admitted requests upstream until the rest are turned away,
+        # so none settles early and frees quota for a latecomer
+        try:
+            await asyncio.wait_for(rejected(requests, 4), timeout=5)
+        except asyncio.TimeoutError:
+            pass
+        release.set()
+        responses = await asyncio.gather(*requests)
+
+    # Each request reserves 1 + 10 tokens, so only two fit under 25
+    assert sorted(r.status_code for r in responses) == [200, 200, 429, 429, 429, 429]
+    db.refresh(api_user)
+    assert api_user.tokens_used == 8
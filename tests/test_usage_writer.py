@@ -0,0 +1,213 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.models.user import User
+from app.services.auth_cache import Principal
+from app.services.usage_writer import UsageEvent, UsageWriter
+
+
+async def _written(writer, count):
+    while writer.written_total < count:
+        await asyncio.sleep(0.01)
+
+
+def _event(user, tokens=10, reserved=0, principal=None, **values):
+    row = {"user_id": user.id, "endpoint": "/v1/completions", "tokens_used": tokens}
+    row.update(values)
+    return UsageEvent(row, principal=principal, delta=tokens - reserved)
+
+
+@pytest.mark.asyncio
+async def test_batch_is_written_with_one_insert_and_one_update(
+    api_user, db, writes, calls
+):
+    writer = UsageWriter(queue_size=100, batch_size=3, flush_interval=10.0)
+    principal = Principal.from_user(api_user)
+    writer.start()
+    for tokens in (5, 7, 11):
+        await writer.submit(_event(api_user, tokens, principal=principal))
+
+    # The cached principal is settled before anything is written
+    assert principal.tokens_used == 23
+    await asyncio.wait_for(_written(writer, 3), timeout=5)
+    await writer.stop()
+
+    assert sorted(c.tokens_used for c in calls(api_user)) == [5, 7, 11]
+    db.refresh(api_user)
+    assert api_user.tokens_used == 23
+    assert writes == [
+        "UPDATE users",
+        "INSERT INTO api_calls",
+        "INSERT INTO usage_hourly",
+        "INSERT INTO usage_daily",
+    ]
+
+
+def test_reservations_of_several_users_settle_in_one_update(db, writes):
+    users = [
+        User(username=f"user_{uuid.uuid4().hex}", hashed_password="x") for _ in range(2)
+    ]
+    for user in users:
+        user.tokens_used = 100
+        db.add(user)
+    db.commit()
+    writes.clear()
+
+    writer = UsageWriter(queue_size=100, batch_size=10, flush_interval=10.0)
+    writer.write(
+        [
+            _event(users[0], tokens=30, reserved=50),
+            _event(users[1], tokens=70, reserved=50),
+            _event(users[0], tokens=5),
+        ]
+    )
+
+    for user in users:
+        db.refresh(user)
+    assert [u.tokens_used for u in users] == [85, 120]
+    assert writes == [
+        "UPDATE users",
+        "INSERT INTO api_calls",
+        "INSERT INTO usage_hourly",
+        "INSERT INTO usage_daily",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_queued_events(api_user, db, calls):
+    writer = UsageWriter(queue_size=100, batch_size=100, flush_interval=60.0)
+    writer.start()
+    await writer.submit(_event(api_user))
+    await writer.submit(_event(api_user))
+    assert calls(api_user) == []
+
+    await writer.stop()
+
+    assert len(calls(api_user)) == 2
+    assert not writer.running
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("overflow, logged", [("drop", 1), ("inline", 2)])
+async def test_overflow_policy_when_queue_is_full(
+    api_user, db, overflow, logged, calls
+):
+    writer = UsageWriter(
+        queue_size=1, batch_size=100, flush_interval=0.0, overflow=overflow
+    )
+    writer.start()
+    # The writer task has not run yet, so the second event finds the queue full
+    await writer.submit(_event(api_user))
+    await writer.submit(_event(api_user))
+    await writer.stop()
+
+    assert len(calls(api_user)) == logged
+    assert writer.dropped_total == 2 - logged
+    # A dropped call's usage is still settled
+    db.refresh(api_user)
+    assert api_user.tokens_used == 20
+    assert writer.carried_users == 0
+
+
+@pytest.mark.asyncio
+async def test_dropped_usage_is_settled_by_the_next_batch(api_user, db, calls):
+    writer = UsageWriter(
+        queue_size=1, batch_size=100, flush_interval=0.0, overflow="drop"
+    )
+    writer.start()
+    await writer.submit(_event(api_user, tokens=5))
+    await writer.submit(_event(api_user, tokens=7))
+    assert writer.carried_users == 1
+
+    await asyncio.wait_for(_written(writer, 1), timeout=5)
+
+    db.refresh(api_user)
+    assert api_user.tokens_used == 12
+    assert [c.tokens_used for c in calls(api_user)] == [5]
+    assert writer.carried_users == 0
+    await writer.stop()
+
+
+def test_failed_batch_is_retried(api_user, calls, monkeypatch):
+    writer = UsageWriter(
+        queue_size=10, batch_size=10, flush_interval=0.0, retry_delay=0
+    )
+    write = writer._write
+    attempts = []
+
+    def flaky_write(events, carried):
+        attempts.append(len(events))
+        if len(attempts) == 1:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        write(events, carried)
+
+    monkeypatch.setattr(writer, "_write", flaky_write)
+    writer.write([_event(api_user), _event(api_user)])
+
+    assert attempts == [2, 2]
+    assert len(calls(api_user)) == 2
+    assert writer.failed_total == 0
+
+
+def test_bad_rows_do_not_lose_the_rest_of_the_batch(api_user, db, calls):
+    writer = UsageWriter(
+        queue_size=10, batch_size=10, flush_interval=0.0, retry_delay=0
+    )
+    bad = _event(api_user, tokens=3, endpoint=["not", "a", "string"])
+
+    writer.write([_event(api_user, tokens=5), bad, _event(api_user, tokens=7)])
+
+    assert sorted(c.tokens_used for c in calls(api_user)) == [5, 7]
+    assert writer.failed_total == 1
+    # The bad row's usage is carried over rather than lost
+    db.refresh(api_user)
+    assert api_user.tokens_used == 12
+    writer.write([])
+    db.refresh(api_user)
+    assert api_user.tokens_used == 15
+
+
+def test_constraint_violation_is_not_retried(api_user, calls, monkeypatch):
+    writer = UsageWriter(queue_size=10, batch_size=10, flush_interval=0.0)
+    write = writer._write
+    attempts = []
+
+    def write_rejecting_deleted_users(events, carried):
+        attempts.append(len(events))
+        if any(event.values["user_id"] == -1 for event in events):
+            raise IntegrityError("INSERT", {}, Exception("FOREIGN KEY constraint"))
+        write(events, carried)
+
+    monkeypatch.setattr(writer, "_write", write_rejecting_deleted_users)
+    deleted = _event(api_user)
+    deleted.values["user_id"] = -1
+    writer.write([_event(api_user), deleted, _event(api_user)])
+
+    # One failed batch, then one write per event
+    assert attempts == [3, 1, 1, 1]
+    assert len(calls(api_user)) == 2
+    assert writer.failed_total == 1
+
+
+@pytest.mark.asyncio
+async def test_unauthenticated_call_is_attributed_at_write_time(api_user, db, calls):
+    writer = UsageWriter(queue_size=100, batch_size=100, flush_interval=0.0)
+    await writer.submit(
+        UsageEvent(
+            {"user_id": None, "endpoint": "/v1/completions", "status_code": 502},
+            api_key=api_user.api_key,
+        )
+    )
+    await writer.submit(
+        UsageEvent({"user_id": None, "endpoint": "/v1/completions"}, api_key="bad")
+    )
+
+    assert [c.status_code for c in calls(api_user)] == [502]
+
+
+def test_unknown_overflow_policy_is_rejected():
+    with pytest.raises(ValueError):
+        UsageWriter(queue_size=1, batch_size=1, flush_interval=0.0, overflow="spill")